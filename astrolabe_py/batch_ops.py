@@ -0,0 +1,384 @@
+#
+# Module to compute derived metadata for a batch of FITS files at once, using array operations.
+#   Written by: agent. 10/19/2026.
+#   Last Modified: Derive positions from sexagesimal coordinate keys.
+#
+import collections
+import logging
+import re
+import numpy as np
+import astropy.units as u
+from astropy.coordinates import FK4, FK4NoETerms, FK5, ICRS, Angle, SkyCoord
+from astropy.time import Time
+
+# pairs of FITS keys holding the (often sexagesimal) position of an observation, in order of preference
+_POSITION_KEY_PAIRS = [ ("OBJCTRA", "OBJCTDEC"), ("RA", "DEC") ]
+
+# FITS keys holding the reference frame and equinox of the position keys, in order of preference
+_RADESYS_KEYS = [ "RADESYS", "RADECSYS" ]
+_EQUINOX_KEYS = [ "EQUINOX", "EPOCH" ]
+
+# set of all FITS keys on which the derived position metadata depends
+POSITION_DEPENDENCY_KEYS = (set([key for pair in _POSITION_KEY_PAIRS for key in pair]) |
+                            set(_RADESYS_KEYS) | set(_EQUINOX_KEYS))
+
+# FITS keys holding the start of an observation, in order of preference
+_START_KEYS = [ "MJD-BEG", "DATE-BEG", "MJD-OBS", "DATE-OBS", "TSTART" ]
+
+# FITS keys holding the end of an observation, in order of preference
+_STOP_KEYS = [ "MJD-END", "DATE-END", "TSTOP" ]
+
+# FITS keys holding the exposure time of an observation, in order of preference
+_EXPOSURE_KEYS = [ "XPOSURE", "EXPTIME", "EXPOSURE", "TELAPSE" ]
+
+# non-standard exposure keys whose values are always in seconds, rather than in TIMEUNIT
+_EXPOSURE_SECONDS_KEYS = set([ "EXPTIME", "EXPOSURE" ])
+
+# FITS keys holding the time of day for an old-style DATE-OBS value which has only a date
+_TIME_OF_DAY_KEYS = [ "TIME-OBS", "UT" ]
+
+# FITS keys holding the time reference information used to interpret the other time keys
+_TIME_REFERENCE_KEYS = [ "TIMESYS", "TIMEUNIT", "TIMEOFFS", "MJDREF", "MJDREFI", "MJDREFF",
+                         "JDREF", "JDREFI", "JDREFF", "DATEREF" ]
+
+# dictionary mapping each derived time key to the FITS keys from which it is derived
+TIME_SOURCE_KEYS = {
+    "start_time": _START_KEYS,
+    "stop_time": _STOP_KEYS,
+    "exposure_time": _EXPOSURE_KEYS,
+    "time_resolution": [ "TIMEDEL" ]
+}
+
+# set of all FITS keys on which the derived time metadata depends
+TIME_DEPENDENCY_KEYS = (set(_TIME_OF_DAY_KEYS) | set(_TIME_REFERENCE_KEYS) |
+                        set([key for keys in TIME_SOURCE_KEYS.values() for key in keys]))
+
+# dictionary mapping FITS TIMESYS values to an Astropy time scale and an offset (in seconds)
+_TIME_SCALES = {
+    "UTC": ("utc", 0.0), "GMT": ("utc", 0.0),
+    "TT": ("tt", 0.0), "TDT": ("tt", 0.0), "ET": ("tt", 0.0),
+    "TAI": ("tai", 0.0), "IAT": ("tai", 0.0),
+    "GPS": ("tai", 19.0),                   # GPS time runs a constant 19 seconds behind TAI
+    "TDB": ("tdb", 0.0), "TCG": ("tcg", 0.0), "TCB": ("tcb", 0.0),
+    "UT1": ("ut1", 0.0), "LOCAL": ("local", 0.0)
+}
+
+# dictionary mapping FITS TIMEUNIT values to the number of seconds in that unit
+_TIME_UNITS = {
+    "s": 1.0, "min": 60.0, "h": 3600.0, "d": 86400.0,
+    "a": 31557600.0, "yr": 31557600.0, "cy": 3155760000.0
+}
+
+_SECONDS_PER_DAY = 86400.0
+
+# patterns for recognizing the date formats found in FITS headers
+_ISO_DATE_RE = re.compile(r"^\d{4}-\d{2}-\d{2}(T\d{2}:\d{2}:\d{2}(\.\d*)?)?$")
+_OLD_DATE_RE = re.compile(r"^(\d{2})/(\d{2})/(\d{2})$") # dd/mm/yy: pre-2000 FITS standard
+_DMY_DATE_RE = re.compile(r"^(\d{2})-(\d{2})-(\d{4})$") # dd-mm-yyyy: non-standard
+_TIME_OF_DAY_RE = re.compile(r"^(\d{1,2}):(\d{2}):(\d{2}(\.\d*)?)$")
+
+# class to hold one time, in a single time scale, as an ISO string or an MJD, plus an offset in days
+_TimeSpec = collections.namedtuple('_TimeSpec', ['scale', 'iso', 'mjd', 'offset'])
+
+
+def derive_position_metadata(fms, keys_subset=None):
+    """ For those of the given batch of FitsMeta instances which did not get right_ascension and
+        declination items from their CTYPE keys, derive them from the OBJCTRA/OBJCTDEC or RA/DEC
+        keys, which may be sexagesimal strings (RA in hours) or decimal degrees. Positions are
+        interpreted in the frame given by the RADESYS and EQUINOX keys and converted to ICRS
+        degrees. The parsing and the conversion of each frame are done as array operations
+        over the whole batch.
+    """
+    found = []                              # list of (FitsMeta, RA, DEC, frame) tuples
+    for fm in fms:
+        if (("right_ascension" in fm) or ("declination" in fm)):
+            continue                        # already has a position from its CTYPE keys
+        position = next((pair for pair in [(_value(fm, ra_key), _value(fm, dec_key))
+                                           for ra_key, dec_key in _POSITION_KEY_PAIRS]
+                         if ((pair[0] is not None) and (pair[1] is not None))), None)
+        if (position):
+            found.append((fm, position[0], position[1], _position_frame(fm)))
+    if (not found):
+        return
+
+    ras = _parse_angles([item[1] for item in found], u.hourangle)
+    decs = _parse_angles([item[2] for item in found], u.deg)
+    by_frame = collections.defaultdict(list)
+    for idx, item in enumerate(found):
+        if ((not np.isnan(ras[idx])) and (abs(decs[idx]) <= 90.0)):
+            by_frame[item[3]].append(idx)
+
+    for frame, idxs in by_frame.items():
+        coords = SkyCoord(ra=ras[idxs] * u.deg, dec=decs[idxs] * u.deg,
+                          frame=_make_frame(frame)).transform_to(ICRS())
+        for pos, idx in enumerate(idxs):
+            fm = found[idx][0]
+            for key, value in [("right_ascension", coords.ra.degree[pos]),
+                               ("declination", coords.dec.degree[pos])]:
+                if (fm.add_item(key, float(value), nodup=True) and keys_subset
+                    and (key not in keys_subset)):
+                    keys_subset.append(key) # if added, add derived keyword to the subset
+
+
+def derive_time_metadata(fms, keys_subset=None):
+    """ Normalize the observation times of the given batch of FitsMeta instances, from whichever
+        of the DATE, MJD, or relative (TSTART/TSTOP) time keys each file has, interpreted according
+        to its TIMESYS, MJDREF, TIMEUNIT, and TIMEOFFS keys. Adds the start_time and stop_time
+        (as UTC MJDs), exposure_time and time_resolution (in seconds) items to each FitsMeta,
+        as available. The conversions are done as array operations over the whole batch.
+    """
+    refs = [_time_reference(fm) for fm in fms]
+    starts = _specs_to_mjds([_time_spec(fm, ref, _START_KEYS) for fm, ref in zip(fms, refs)])
+    stops = _specs_to_mjds([_time_spec(fm, ref, _STOP_KEYS) for fm, ref in zip(fms, refs)])
+    exposures = np.array([_exposure_seconds(fm, ref) for fm, ref in zip(fms, refs)], dtype=float)
+    resolutions = np.array([_unit_seconds(fm, ref, "TIMEDEL") for fm, ref in zip(fms, refs)],
+                           dtype=float)
+
+    # fill in whichever of the start, stop, or exposure is missing from the other two
+    stops = np.where(np.isnan(stops), starts + (exposures / _SECONDS_PER_DAY), stops)
+    starts = np.where(np.isnan(starts), stops - (exposures / _SECONDS_PER_DAY), starts)
+    exposures = np.where(np.isnan(exposures), (stops - starts) * _SECONDS_PER_DAY, exposures)
+
+    derived = { "start_time": starts, "stop_time": stops,
+                "exposure_time": exposures, "time_resolution": resolutions }
+    for idx, fm in enumerate(fms):
+        for key, values in derived.items():
+            if (not np.isnan(values[idx])):
+                _add_derived_item(fm, key, float(values[idx]), keys_subset, TIME_SOURCE_KEYS[key])
+
+
+def _add_derived_item(fm, key, value, keys_subset, source_keys):
+    """ Add a derived item to the given FitsMeta unless only a subset of keys is requested and
+        neither the derived key nor any of its source keys are in that subset. If the item is
+        added because of a source key, the derived key is added to the subset.
+    """
+    if (keys_subset):                       # if only a subset of keys requested
+        if ((key not in keys_subset) and (not any([src in keys_subset for src in source_keys]))):
+            return                          # derived item not wanted
+    if (fm.add_item(key, value, nodup=True) and keys_subset and (key not in keys_subset)):
+        keys_subset.append(key)             # if added, add derived keyword to the subset
+
+
+def _exposure_seconds(fm, ref):
+    """ Return the exposure time, in seconds, of the given FitsMeta, or NaN if not present. """
+    for key in _EXPOSURE_KEYS:
+        if (key in _EXPOSURE_SECONDS_KEYS):
+            seconds = _to_float(_value(fm, key))
+        else:
+            seconds = _unit_seconds(fm, ref, key)
+        if (not np.isnan(seconds)):
+            return seconds
+    return np.nan
+
+
+def _make_frame(frame):
+    """ Return an Astropy reference frame for the given (frame name, equinox) tuple. """
+    name, equinox = frame
+    if (name == "FK5"):
+        return FK5(equinox=Time(equinox, format="jyear"))
+    elif (name == "FK4"):
+        return FK4(equinox=Time(equinox, format="byear"))
+    elif (name == "FK4-NO-E"):
+        return FK4NoETerms(equinox=Time(equinox, format="byear"))
+    else:
+        return ICRS()
+
+
+def _normalize_date(date_str, time_str=None):
+    """ Return an ISO-8601 date or datetime string for the given FITS date string, combined with
+        the given separate time of day string, if any, when the date has no time part.
+        Returns None if the date string is not in a recognized format.
+    """
+    date_str = date_str.strip().rstrip("Z")
+    match = _OLD_DATE_RE.match(date_str)
+    if (match):
+        date_str = "19{}-{}-{}".format(match.group(3), match.group(2), match.group(1))
+    match = _DMY_DATE_RE.match(date_str)
+    if (match):
+        date_str = "{}-{}-{}".format(match.group(3), match.group(2), match.group(1))
+    if (not _ISO_DATE_RE.match(date_str)):
+        return None
+    if (("T" not in date_str) and time_str):
+        match = _TIME_OF_DAY_RE.match(time_str.strip())
+        if (match):
+            date_str = "{}T{:02d}:{}:{}".format(
+                date_str, int(match.group(1)), match.group(2), match.group(3))
+    return date_str
+
+
+def _isos_to_mjds(isos, scale):
+    """ Convert a list of ISO date strings in the given time scale to an array of MJDs,
+        in one array operation if possible; any unconvertible strings become NaNs.
+    """
+    try:
+        return Time(isos, format="fits", scale=scale).mjd
+    except ValueError:                      # a bad date somewhere: convert one at a time
+        mjds = np.full(len(isos), np.nan)
+        for idx, iso in enumerate(isos):
+            try:
+                mjds[idx] = Time(iso, format="fits", scale=scale).mjd
+            except ValueError:
+                logging.warning("(batch_ops): unable to convert date '{}'".format(iso))
+        return mjds
+
+
+def _parse_angles(values, sexagesimal_unit):
+    """ Return an array of the given angle values in degrees (NaNs where unparseable). Numeric
+        values are taken to be degrees; other strings are parsed, in one array operation if
+        possible, as sexagesimal angles in the given unit.
+    """
+    degrees = np.full(len(values), np.nan)
+    sexa_pos = []
+    for idx, value in enumerate(values):
+        number = _to_float(value)
+        if (not np.isnan(number)):
+            degrees[idx] = number
+        elif (isinstance(value, str)):
+            sexa_pos.append(idx)
+    if (sexa_pos):
+        strs = [values[idx].strip() for idx in sexa_pos]
+        try:
+            degrees[sexa_pos] = Angle(strs, unit=sexagesimal_unit).degree
+        except ValueError:                  # a bad angle somewhere: parse one at a time
+            for idx, angle_str in zip(sexa_pos, strs):
+                try:
+                    degrees[idx] = Angle(angle_str, unit=sexagesimal_unit).degree
+                except ValueError:
+                    logging.warning("(batch_ops): unable to parse angle '{}'".format(angle_str))
+    return degrees
+
+
+def _position_frame(fm):
+    """ Return a (frame name, equinox) tuple for the position keys of the given FitsMeta,
+        defaulted as specified by the FITS standard.
+    """
+    radesys = next((_value(fm, key) for key in _RADESYS_KEYS if _value(fm, key)), None)
+    radesys = str(radesys).strip().upper() if radesys else None
+    equinox = next((_to_float(_value(fm, key)) for key in _EQUINOX_KEYS
+                    if not np.isnan(_to_float(_value(fm, key)))), np.nan)
+    if (radesys is None):
+        if (np.isnan(equinox)):
+            return ("ICRS", None)
+        radesys = "FK4" if (equinox < 1984.0) else "FK5"
+    if (radesys == "FK5"):
+        return ("FK5", 2000.0 if np.isnan(equinox) else equinox)
+    elif (radesys in ("FK4", "FK4-NO-E")):
+        return (radesys, 1950.0 if np.isnan(equinox) else equinox)
+    else:
+        return ("ICRS", None)
+
+
+def _specs_to_mjds(specs):
+    """ Convert a list of time specifications (or Nones) to an array of UTC MJDs (NaNs where
+        unknown), with one array conversion per time scale used in the batch.
+    """
+    mjds = np.full(len(specs), np.nan)
+    by_scale = collections.defaultdict(list)
+    for idx, spec in enumerate(specs):
+        if (spec):
+            by_scale[spec.scale].append(idx)
+
+    for scale, idxs in by_scale.items():
+        scale_mjds = np.array([np.nan if (specs[idx].mjd is None) else specs[idx].mjd
+                               for idx in idxs])
+        iso_pos = [pos for pos, idx in enumerate(idxs) if (specs[idx].iso is not None)]
+        if (iso_pos):
+            scale_mjds[iso_pos] = _isos_to_mjds([specs[idxs[pos]].iso for pos in iso_pos], scale)
+        scale_mjds += np.array([specs[idx].offset for idx in idxs])
+        mjds[idxs] = _to_utc(scale_mjds, scale)
+    return mjds
+
+
+def _time_reference(fm):
+    """ Return a dictionary of the time reference information for the given FitsMeta:
+        its time scale, scale offset (in days), time unit (in seconds), reference time,
+        and time offset (in time units).
+    """
+    timesys = str(_value(fm, "TIMESYS", "UTC")).strip().upper()
+    scale, scale_offset = _TIME_SCALES.get(timesys, ("utc", 0.0))
+    timeunit = str(_value(fm, "TIMEUNIT", "s")).strip()
+    unit_seconds = _TIME_UNITS.get(timeunit, _TIME_UNITS.get(timeunit.lower(), 1.0))
+    timeoffs = _to_float(_value(fm, "TIMEOFFS", 0.0))
+
+    ref_iso = None
+    ref_mjd = _to_float(_value(fm, "MJDREFI")) + _to_float(_value(fm, "MJDREFF", 0.0))
+    if (np.isnan(ref_mjd)):
+        ref_mjd = _to_float(_value(fm, "MJDREF"))
+    if (np.isnan(ref_mjd)):
+        ref_jd = _to_float(_value(fm, "JDREFI")) + _to_float(_value(fm, "JDREFF", 0.0))
+        if (np.isnan(ref_jd)):
+            ref_jd = _to_float(_value(fm, "JDREF"))
+        ref_mjd = ref_jd - 2400000.5
+    if (np.isnan(ref_mjd)):
+        dateref = _value(fm, "DATEREF")
+        ref_iso = _normalize_date(dateref) if isinstance(dateref, str) else None
+        ref_mjd = np.nan if ref_iso else 0.0  # FITS standard default is MJDREF = 0
+
+    return { "scale": scale, "scale_offset": scale_offset / _SECONDS_PER_DAY,
+             "unit_seconds": unit_seconds, "ref_iso": ref_iso, "ref_mjd": ref_mjd,
+             "timeoffs": 0.0 if np.isnan(timeoffs) else timeoffs }
+
+
+def _time_spec(fm, ref, keys):
+    """ Return a time specification for the first of the given keys which is present in the
+        given FitsMeta, interpreted with the given time reference, or None if no key is usable.
+    """
+    for key in keys:
+        value = _value(fm, key)
+        if (value is None):
+            continue
+        if (key.startswith("MJD-")):        # an absolute MJD
+            mjd = _to_float(value)
+            if (not np.isnan(mjd)):
+                return _TimeSpec(ref["scale"], None, mjd, ref["scale_offset"])
+        elif (key.startswith("DATE-")):     # an absolute date, perhaps with a separate time
+            time_str = next((_value(fm, tkey) for tkey in _TIME_OF_DAY_KEYS
+                             if isinstance(_value(fm, tkey), str)), None)
+            iso = _normalize_date(value, time_str) if isinstance(value, str) else None
+            if (iso):
+                return _TimeSpec(ref["scale"], iso, None, ref["scale_offset"])
+        else:                               # a time relative to the reference time
+            rel = _to_float(value)
+            if (not np.isnan(rel)):
+                offset = ((rel + ref["timeoffs"]) * ref["unit_seconds"]) / _SECONDS_PER_DAY
+                return _TimeSpec(ref["scale"], ref["ref_iso"],
+                                 None if ref["ref_iso"] else ref["ref_mjd"],
+                                 offset + ref["scale_offset"])
+    return None
+
+
+def _to_float(value):
+    """ Return the given header value as a float or NaN, if it is not numeric. """
+    if ((value is None) or isinstance(value, bool)):
+        return np.nan
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return np.nan
+
+
+def _to_utc(mjds, scale):
+    """ Convert the given array of MJDs in the given time scale to MJDs in the UTC scale.
+        Times in the local scale, or which cannot be converted, are returned unchanged.
+    """
+    valid = ~np.isnan(mjds)
+    if ((scale in ("utc", "local")) or (not valid.any())):
+        return mjds
+    try:
+        utc_mjds = np.copy(mjds)
+        utc_mjds[valid] = Time(mjds[valid], format="mjd", scale=scale).utc.mjd
+        return utc_mjds
+    except Exception as ex:
+        logging.warning("(batch_ops): unable to convert {} times to UTC: {}".format(scale, ex))
+        return mjds
+
+
+def _unit_seconds(fm, ref, key):
+    """ Return the value of the given key, which is in TIMEUNIT units, in seconds or NaN. """
+    return _to_float(_value(fm, key)) * ref["unit_seconds"]
+
+
+def _value(fm, key, default=None):
+    """ Return the value of the given key from the given FitsMeta or the given default value. """
+    item = fm.get(key)
+    return item.value if item else default
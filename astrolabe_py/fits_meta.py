@@ -1,8 +1,9 @@
 """
 Class to extract and format metadata from FITS files.
-  Last Modified: Update for project rename.
+  Last Modified: Allow metadata to be extracted from already captured header bytes.
 """
 import copy
+import io
 import json
 import logging
 import re
@@ -25,16 +26,31 @@ def default_cleaner_fn(fld):
 class FitsMeta:
     """ Class to extract and format metadata from FITS files. """
 
-    def __init__(self, filepath, cleaner=default_cleaner_fn, ignore_keys=None):
+    def __init__(self, filepath, cleaner=default_cleaner_fn, ignore_keys=None, wanted_keys=None,
+                 header_bytes=None):
+        """ Extract metadata from the first HDU of the given FITS file. Cards whose keys are
+            in the optional ignore_keys set, or, if the optional wanted_keys set is given,
+            are NOT in the wanted_keys set, are skipped before being cleaned or stored.
+            If the bytes of the file's primary header are given, they are used instead of
+            reading the file again; no summary information about the HDUs is then available.
+        """
         self._filepath = filepath
-        hdulist = fits.open(self._filepath) # raises error if unable to read file
-        self._hdusinfo = hdulist.info(False) # get summary info for all HDUs
+        ignore_keys = set(ignore_keys) if ignore_keys else None
+        wanted_keys = set(wanted_keys) if wanted_keys else None
+        if (header_bytes):
+            with warnings.catch_warnings():
+                warnings.simplefilter("ignore") # the header alone looks like a truncated file
+                hdulist = fits.open(io.BytesIO(header_bytes))
+                hdulist[0]                  # parse the header while ignoring warnings
+            self._hdusinfo = []
+        else:
+            hdulist = fits.open(self._filepath) # raises error if unable to read file
+            self._hdusinfo = hdulist.info(False) # get summary info for all HDUs
         hdu0 = hdulist[0]                   # get first HDU
         hdu0.verify('silentfix+ignore')     # fix fixable items in the first HDU
-        self._metadata = self._extract_metadata(hdu0.header, cleaner)
-        self._metadata.append(Metadatum(FILEPATH_KEY, self._filepath))
-        if (ignore_keys):
-            self._metadata = self.remove_by_keys(ignore_keys)
+        self._metadata = self._extract_metadata(hdu0.header, cleaner, ignore_keys, wanted_keys)
+        if (self._is_wanted(FILEPATH_KEY, ignore_keys, wanted_keys)):
+            self._metadata.append(Metadatum(FILEPATH_KEY, self._filepath))
         self._update_key_set()              # compute initial set of metadata keys
         hdulist.close()                     # close the file
 
@@ -58,6 +74,18 @@ class FitsMeta:
         return len(self._metadata)
 
 
+    def add_item(self, keyword, value, nodup=False):
+        """ Add a new metadatum, with the given key and value, to the metadata. If nodup flag
+            is True, then the addition is prevented if it would create a duplicate of an
+            existing metadata key. If the metadatum is added, the internal key set is updated.
+            Returns True if metadatum added, False otherwise.
+        """
+        if ((keyword in self._key_set) and nodup):
+            return False
+        self._metadata.append(Metadatum(keyword, value))
+        self._update_key_set()
+        return True
+
     def copy_item(self, src_key, target_key, nodup=False):
         """ Copy an existing metadatum, named by the src_key, back into the metadata
             with a new key specified by target_key. If nodup flag is True, then the copy
@@ -117,24 +145,44 @@ class FitsMeta:
         return self.filter_by_keys(ks)
 
     def metadata_as_json(self):
-        """ Return the metadata items as JSON. """
-        return json.dumps(self._metadata)
+        """ Return the metadata items as JSON. Values without a JSON type are stringified. """
+        return json.dumps(self._metadata, default=str)
 
     def remove_by_keys(self, keys):
         """ Return a list of Metadatum items whose keys are NOT in the given key set. """
         return list(filter(lambda item: item.keyword not in set(keys), self._metadata))
 
 
-    def _extract_metadata(self, header, cleaner):
-        """ Return a list of metadata pairs, extracted and cleaned from the given FITS Header. """
+    def _extract_metadata(self, header, cleaner, ignore_keys=None, wanted_keys=None):
+        """ Return a list of metadata pairs, extracted and cleaned from the given FITS Header.
+            Values keep their native header types (int, float, bool, or str): conversion to
+            strings is left to the consumers which need it.
+            Cards with unwanted or ignored keys are skipped before their values are parsed.
+        """
         metadata = []
-        for k, v in header.items():
-            key = str(cleaner(k))           # clean key and ensure it is a string
-            val = str(cleaner(v))           # clean value and ensure it is a string
-            if (key and val):
+        for card in header.cards:
+            if (not self._is_wanted(card.keyword, ignore_keys, wanted_keys)):
+                continue                    # skip card without touching its value
+            key = str(cleaner(card.keyword)) # clean key and ensure it is a string
+            val = cleaner(card.value)       # clean value but keep its native type
+            if (key and self._has_value(val)):
                 metadata.append(Metadatum(key, val))
         return metadata
 
+    def _has_value(self, val):
+        """ Tell whether the given header value is a real value: not missing, undefined, or empty. """
+        if ((val is None) or isinstance(val, fits.card.Undefined)):
+            return False
+        return (val != "")
+
+    def _is_wanted(self, keyword, ignore_keys, wanted_keys):
+        """ Tell whether the given key is wanted: it is not ignored and, if a set of
+            wanted keys is given, it is in that set.
+        """
+        if (ignore_keys and (keyword in ignore_keys)):
+            return False
+        return ((wanted_keys is None) or (keyword in wanted_keys))
+
     def _update_key_set(self):
         """ Recompute and save the list of keys for the current metadata. """
         self._key_set = set([item.keyword for item in self._metadata])
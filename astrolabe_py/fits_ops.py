@@ -1,12 +1,14 @@
 #
 # Module to view, extract, and/or verify metadata from one or more FITS files.
 #   Written by: Tom Hicks. 4/24/2018.
-#   Last Modified: Sequence the special cases. Revert to using right_ascension & declination names.
+#   Last Modified: Do not fail a whole batch for one unreadable file.
 #
+import logging
 import os
 import sys
 import warnings
 from astropy.io import fits
+import astrolabe_py.batch_ops as bo
 import astrolabe_py.utils as utils
 from astrolabe_py.fits_meta import FitsMeta
 
@@ -14,24 +16,28 @@ from astrolabe_py.fits_meta import FitsMeta
 _ALTERNATE_KEYS_MAP = {
     "right_ascension": "s_ra",              # calculated -> VO
     "declination": "s_dec",                 # calculated -> VO
-    "DATE-BEG": "t_min",                    # FITS -> VO
-    "DATE-END": "t_max",                    # FITS -> VO
-    "DATE-OBS": "t_min",                    # FITS -> VO
+    "start_time": "t_min",                  # calculated -> VO
+    "stop_time": "t_max",                   # calculated -> VO
+    "exposure_time": "t_exptime",           # calculated -> VO
+    "time_resolution": "t_resolution",      # calculated -> VO
     "INSTRUME": "instrument_name",          # FITS -> VO
-    "MJD-END" : "t_max",                    # FITS -> VO
-    "MJD-OBS" : "t_min",                    # FITS -> VO
     "NAXIS1"  : "sxel1",                    # FITS -> VO
     "NAXIS2"  : "sxel2",                    # FITS -> VO
     "OBJECT"  : "target_name",              # FITS -> VO
     "OBSERVER": "obs_creator_name",         # FITS -> VO
-    "TELESCOP": "facility_name",            # FITS -> VO
-    "TSTART"  : "t_min",                    # FITS -> VO
-    "TSTOP"   : "t_max"                     # FITS -> VO
+    "TELESCOP": "facility_name"             # FITS -> VO
 }
 
 # dictionary mapping CTYPE* key names to their associated CRVAL* key names
 _CTYPES = { "CTYPE1": "CRVAL1",  "CTYPE2": "CRVAL2" }
 
+# list of functions which derive metadata for a whole batch of files at once
+_BATCH_STAGES = [ bo.derive_position_metadata, bo.derive_time_metadata ]
+
+# set of FITS keys which must be extracted because the derived metadata depends on them
+_DERIVED_DEPENDENCY_KEYS = (set(_CTYPES.keys()) | set(_CTYPES.values()) |
+                            bo.POSITION_DEPENDENCY_KEYS | bo.TIME_DEPENDENCY_KEYS)
+
 
 def execute_info(options):
     """ Returns a (possibly empty) list, each element of which is a list of
@@ -45,7 +51,7 @@ def execute_info(options):
     else:
         if (os.path.isdir(file_path)):
             info_lst = [fits_hdu_info(fits_file, options)
-                        for fits_file in utils.filter_file_tree(file_path)]
+                        for fits_file in utils.filter_file_tree(file_path, options.get("shard"))]
             return [info for info in info_lst if info] # just in case: remove empty lists
         else:                                          # should never happen
             print("Error: Specified file path '{}' is not a file or directory".format(file_path))
@@ -58,9 +64,8 @@ def fits_hdu_info(file_path, options={}):
         print("Reading HDU information for file {} ...".format(file_path))
     fm = FitsMeta(file_path)
     hduinfo = fm.hdu_info()
-    filename = os.path.basename(fm.filepath())
     # format the information into a report (a list of strings):
-    results = ["Filename: {}".format(filename),
+    results = ["Filename: {}".format(fm.filepath()),
                "No.    Name      Ver    Type      Cards   Dimensions   Format"]
     layout = "{:3d}  {:10}  {:3} {:11}  {:5d}   {}   {}   {}"
     for hinfo in hduinfo:
@@ -68,27 +73,69 @@ def fits_hdu_info(file_path, options={}):
     return results
 
 
-def fits_metadata(file_path, options={}):
-    """ Return a list Metadatum tuples extracted from the given FITS file. """
+def fits_metadata(file_path, options={}, header_bytes=None):
+    """ Return a list Metadatum tuples extracted from the given FITS file or, if given,
+        from the already captured bytes of its primary header.
+    """
+    keys_subset = options.get("keys_subset")
+    fm = FitsMeta(file_path, ignore_keys=options.get("ignore_keys"),
+                  wanted_keys=_wanted_keys(keys_subset), header_bytes=header_bytes)
+    return _post_process_batch([fm], keys_subset)[0]
+
+
+def fits_metadata_batch(file_paths, options={}, headers=None):
+    """ Return a list, each element of which is a list of Metadatum tuples extracted from
+        one of the given FITS files, or None if that file could not be read. Derived metadata
+        is computed for the whole batch at once. If a list of captured primary header bytes
+        (or None) for each file is given, any captured header is used instead of reading its
+        file again.
+    """
     keys_subset = options.get("keys_subset")
     ignore_keys = options.get("ignore_keys")
-    fm = FitsMeta(file_path, ignore_keys=ignore_keys)
-    metadata = _post_process_metadata(fm, keys_subset)
-    return metadata
+    wanted_keys = _wanted_keys(keys_subset)
+    headers = headers or ([None] * len(file_paths))
+    fms = []
+    for file_path, header_bytes in zip(file_paths, headers):
+        try:
+            fms.append(FitsMeta(file_path, ignore_keys=ignore_keys, wanted_keys=wanted_keys,
+                                header_bytes=header_bytes))
+        except Exception as ex:             # one bad file must not fail the whole batch
+            logging.error("(fits_metadata_batch): unable to read file '{}': {}".format(file_path, ex))
+            fms.append(None)
+    results = iter(_post_process_batch([fm for fm in fms if fm is not None], keys_subset))
+    return [None if (fm is None) else next(results) for fm in fms]
+
+
+def _wanted_keys(keys_subset):
+    """ Return the set of keys to be extracted from a FITS file for the given subset of keys:
+        the subset keys plus any keys on which derived metadata depends. Returns None,
+        meaning all keys, if no subset is given.
+    """
+    if (keys_subset):
+        return set(keys_subset) | _DERIVED_DEPENDENCY_KEYS
+    else:
+        return None
 
 
-def _post_process_metadata(fm, keys_subset):
-    """ Post process the accumulated metadata; handle a couple of special cases. """
-    for item in fm.metadata():              # check all metadata items for CTYPE special cases
-        _handle_ctype_mapping(fm, item, keys_subset) # fm and key_subset modified by side-effect
+def _post_process_batch(fms, keys_subset):
+    """ Post process the accumulated metadata for a batch of files; handle the special cases.
+        Returns a list of the resulting metadata for each file.
+    """
+    for fm in fms:
+        for item in fm.metadata():          # check all metadata items for CTYPE special cases
+            _handle_ctype_mapping(fm, item, keys_subset) # fm and key_subset modified by side-effect
+
+    for stage in _BATCH_STAGES:             # derive metadata over the whole batch
+        stage(fms, keys_subset)             # fms and key_subset modified by side-effect
 
-    for item in fm.metadata():              # check all metadata items for alternate keys
-        _handle_alternate_key(fm, item, keys_subset) # fm and key_subset modified by side-effect
+    for fm in fms:
+        for item in fm.metadata():          # check all metadata items for alternate keys
+            _handle_alternate_key(fm, item, keys_subset) # fm and key_subset modified by side-effect
 
     if (keys_subset):                       # if user requested only a subset of the metadata
-        return fm.filter_by_keys(keys_subset) # filter the metadata by the keys subset
+        return [fm.filter_by_keys(keys_subset) for fm in fms] # filter by the keys subset
     else:
-        return fm.metadata()                # else just return all the accumulated metadata
+        return [fm.metadata() for fm in fms] # else just return all the accumulated metadata
 
 
 def _handle_alternate_key(fm, item, keys_subset):
@@ -116,7 +163,7 @@ def _handle_ctype_mapping(fm, item, keys_subset):
     """
     # if this item's key is a CTYPE key, then get the CRVAL key interpreted by this item:
     crval_key = _CTYPES.get(item.keyword)   # lookup this item's key in CTYPE dictionary
-    if (crval_key):                         # if this item key is a CTYPE key
+    if (crval_key and isinstance(item.value, str)): # if this item key is a CTYPE key
         if "RA" in item.value:              # if this CTYPE item's value contains RA
             interp_key = "right_ascension"  # the 'interpretation' of the CRVAL value
         elif "DEC" in item.value:           # else if this CTYPE item's value contains DEC
@@ -142,7 +189,7 @@ def execute_verify(options):
     else:
         if (os.path.isdir(file_path)):
             warn_lst = [fits_verify(fits_file, options)
-                        for fits_file in utils.filter_file_tree(file_path)]
+                        for fits_file in utils.filter_file_tree(file_path, options.get("shard"))]
             return [warn for warn in warn_lst if warn] # remove empty lists
         else:                                          # should never happen
             print("Error: Specified file path '{}' is not a file or directory".format(file_path))
@@ -0,0 +1,85 @@
+"""
+Class to capture the primary header of a FITS file from the bytes of the file as they stream past.
+  Last Modified: Initial creation.
+"""
+import logging
+import zlib
+
+logging.basicConfig(level=logging.ERROR)    # default logging configuration
+
+# sizes of a FITS block and of a header card, in bytes
+FITS_BLOCK_SIZE = 2880
+FITS_CARD_SIZE = 80
+
+# the card which ends a FITS header: the END keyword padded to the width of a keyword
+_END_KEYWORD = b"END     "
+
+# maximum number of header bytes captured before giving up on finding the END card
+DEFAULT_MAX_HEADER_SIZE = 1000 * FITS_BLOCK_SIZE
+
+
+class HeaderCapture:
+    """ Class to capture the primary header of a FITS file, which is optionally gzipped,
+        from the chunks of the file passed to it, in order, as the file is read for some other
+        purpose (e.g. uploading it), so that the file need not be read again for its header.
+    """
+
+    def __init__(self, gzipped=False, max_header_size=DEFAULT_MAX_HEADER_SIZE):
+        """ Create a capture for a plain FITS file or, if gzipped is True, a gzipped one.
+            Capture is abandoned if no END card is found in the given maximum number of bytes.
+        """
+        self._gzipped = gzipped
+        self._max_header_size = max_header_size
+        self.reset()
+
+    def __call__(self, chunk):
+        """ Pass the next chunk of the file's bytes to this capture. """
+        if (self._done):
+            return
+        if (self._decompressor):
+            try:
+                chunk = self._decompressor.decompress(chunk)
+            except zlib.error as ex:
+                logging.warning("(HeaderCapture): unable to decompress file: {}".format(ex))
+                self._done = True
+                return
+        self._buffer.extend(chunk)
+        self._scan()
+
+    def done(self):
+        """ Tell whether this capture has finished, with or without finding a header. """
+        return self._done
+
+    def header_bytes(self):
+        """ Return the bytes of the complete primary header (a whole number of FITS blocks,
+            the last of which holds the END card), or None if it has not been captured.
+        """
+        return self._header
+
+    def reset(self):
+        """ Discard anything captured, to start again from the beginning of the file. """
+        self._buffer = bytearray()
+        self._scanned = 0                   # number of complete blocks already scanned
+        self._header = None
+        self._done = False
+        self._decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS) if self._gzipped else None
+
+    def _scan(self):
+        """ Scan any newly completed blocks for the END card. """
+        while (len(self._buffer) >= ((self._scanned + 1) * FITS_BLOCK_SIZE)):
+            start = self._scanned * FITS_BLOCK_SIZE
+            self._scanned += 1
+            for offset in range(start, start + FITS_BLOCK_SIZE, FITS_CARD_SIZE):
+                if (self._buffer[offset:offset + len(_END_KEYWORD)] == _END_KEYWORD):
+                    self._header = bytes(self._buffer[:start + FITS_BLOCK_SIZE])
+                    self._finish()
+                    return
+        if (len(self._buffer) >= self._max_header_size):
+            logging.warning("(HeaderCapture): no END card found in {} bytes".format(len(self._buffer)))
+            self._finish()
+
+    def _finish(self):
+        """ Stop capturing and release the buffer. """
+        self._done = True
+        self._buffer = bytearray()
+        self._decompressor = None
@@ -1,17 +1,31 @@
 """
 Helper class for iRods commands: manipulate the filesystem, including metadata.
-  Last Modified: Port updates from glue irods project: reformats, adds methods to test iRods node types.
+  Last Modified: Keep tree queries to the tree, whatever wildcards its path holds.
 """
+import collections
 import os
 import logging
 import pathlib as pl
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from irods.session import iRODSSession
 from irods.collection import iRODSCollection
+from irods.column import Like
 from irods.data_object import iRODSDataObject
+from irods.meta import AVUOperation, iRODSMeta
+from irods.models import Collection, DataObject, DataObjectMeta
+import irods.keywords as kw
 from astrolabe_py import Metadatum
+from astrolabe_py.lookup_cache import LookupCache, DEFAULT_MAX_ENTRIES, DEFAULT_TTL
 
 logging.basicConfig(level=logging.ERROR)    # default logging configuration
 
+# size of the chunks in which a file is read when its bytes are teed or transformed as they are uploaded
+_STREAM_CHUNK_SIZE = 4 * 1024 * 1024
+
+# class to hold the path, size, and checksum (or None) of a file (data object) in iRods
+FileRecord = collections.namedtuple('FileRecord', ['path', 'size', 'checksum'])
+
 
 class IrodsHelper:
     """ Helper class for iRods commands """
@@ -45,6 +59,56 @@ class IrodsHelper:
     def is_dataobject(node):
         return isinstance(node, iRODSDataObject)
 
+    @staticmethod
+    def metadata_changes(current, metadata):
+        """ Given the current metadata items (iRODSMeta) of an iRods node and a list of new
+            metadata items (Metadatum), return a list of the operations (AVUOperation) which
+            replace the values of each key of the new items: the current items of those keys
+            which are not among the new items are removed and the missing new items are added.
+            Items of other keys are left alone. New values of any type are stored as strings.
+        """
+        wanted = {}                         # new values by key, in order and without duplicates
+        for item in metadata:
+            values = wanted.setdefault(item.keyword, [])
+            if (str(item.value) not in values):
+                values.append(str(item.value))
+        kept = set()
+        changes = []
+        for avu in current:
+            if (avu.name in wanted):
+                if ((avu.value in wanted[avu.name]) and (not avu.units)):
+                    kept.add((avu.name, avu.value))
+                else:
+                    changes.append(AVUOperation(operation="remove", avu=avu))
+        for key, values in wanted.items():
+            for value in values:
+                if ((key, value) not in kept):
+                    changes.append(AVUOperation(operation="add", avu=iRODSMeta(key, value)))
+        return changes
+
+    @staticmethod
+    def missing_branches(dir_paths, existing):
+        """ Given a list of absolute directory paths and the set of those directories (and their
+            ancestors) known to exist, return a list of independent branches of directories to
+            be created: each branch is a list of the missing leaf directories which share the
+            same topmost missing ancestor. Since directories are created recursively, creating
+            only the leaves creates every missing directory.
+        """
+        paths = {str(pl.PurePath(path)) for path in dir_paths}
+        missing = {path for path in paths if (path not in existing)}
+        ancestors = {str(parent) for path in missing for parent in pl.PurePath(path).parents}
+        known = set(existing)               # the ancestors of existing directories exist too
+        known.update([str(parent) for path in existing for parent in pl.PurePath(path).parents])
+        branches = {}
+        for leaf in sorted(missing - ancestors):
+            top = leaf
+            for parent in pl.PurePath(leaf).parents:
+                if (str(parent) in known):
+                    break
+                top = str(parent)
+            branches.setdefault(top, []).append(leaf)
+        return [branches[top] for top in sorted(branches)]
+
     @staticmethod
     def to_dirpath(dir_path):
         """ Add a trailing slash to the given directory path to mark it is an iRods
@@ -54,11 +118,38 @@ class IrodsHelper:
         else:
             return "{}/".format(dir_path)
 
-    def __init__(self, options={}, connect=True):
+    @staticmethod
+    def new_session(options={}):
+        """ Create and return an iRods session using the given options, or
+            a file specified by the environment variable IRODS_ENVIRONMENT_FILE, or
+            the default irods_environment.json file.
+        """
+        try:
+            env_file = options["irods_env_file"]
+        except KeyError:
+            try:
+                env_file = os.environ["IRODS_ENVIRONMENT_FILE"]
+            except KeyError:
+                env_file = os.path.expanduser("~/.irods/irods_environment.json")
+
+        logging.info("IrodsHelper.new_session: env_file={}".format(env_file))
+        return iRODSSession(irods_env_file=env_file)
+
+    def __init__(self, options={}, connect=True, pool=None):
+        """ Create a helper using the given options. If a session pool is given, sessions are
+            checked out from it, and returned to it on disconnecting, instead of being
+            created and closed by this helper. The data objects and collections looked up are
+            cached, up to the number of entries and for the number of seconds given by the
+            "lookup_cache_size" and "lookup_cache_ttl" options.
+        """
         self._cwdpath = None                # current working directory - a PurePath
         self._root = None                   # root directory path - a PurePath
         self._session = None                # current session - None until connected
+        self._known_dirs = set()            # absolute paths of collections known to exist
         self._options = options             # dict of settings for this class
+        self._pool = pool                   # shared pool of sessions, if any
+        self._lookups = LookupCache(options.get("lookup_cache_size", DEFAULT_MAX_ENTRIES),
+                                    options.get("lookup_cache_ttl", DEFAULT_TTL))
         if (connect):                       # connect now unless specified otherwise
             self.connect()
 
@@ -72,6 +163,17 @@ class IrodsHelper:
         """ Return an iRods path for the given path relative to the users root directory. """
         return str(self._root / path)
 
+    def attach(self):
+        """ Check out a session from the pool of this helper again, after detach, keeping the
+            users root directory and the current working directory. Does nothing if this
+            helper already has a session.
+        """
+        if (not self._session):
+            root, cwdpath = self._root, self._cwdpath
+            self.connect()
+            if (root is not None):
+                self._root, self._cwdpath = root, cwdpath
+
     def cleanup(self):
         """ Cleanup the current session. """
         self.disconnect()
@@ -79,21 +181,16 @@ class IrodsHelper:
     def connect(self):
         """ Create an iRods session using the instantiation options, or
             a file specified by the environment variable IRODS_ENVIRONMENT_FILE, or
-            the default irods_environment.json file.
+            the default irods_environment.json file. If this helper uses a session pool,
+            a session is checked out from the pool instead.
         """
         logging.info("(IrodsHelper.connect): options={}".format(self._options))
-        try:
-            env_file = self._options["irods_env_file"]
-        except KeyError:
-            try:
-                env_file = os.environ["IRODS_ENVIRONMENT_FILE"]
-            except KeyError:
-                env_file = os.path.expanduser("~/.irods/irods_environment.json")
-
-        logging.info("IrodsHelper.connect: env_file={}".format(env_file))
 
         # session is established upon successful connection to iRods
-        self._session = iRODSSession(irods_env_file=env_file)
+        if (self._pool):
+            self._session = self._pool.acquire()
+        else:
+            self._session = IrodsHelper.new_session(self._options)
         logging.info("IrodsHelper.connect: SESSION={}".format(self._session))
 
         # users root directory is set to their iRods home directory
@@ -151,7 +248,10 @@ class IrodsHelper:
         """
         try:
             dirobj = self.get_dir(dir_path, absolute=absolute)
+            self._lookups.invalidate_tree(dirobj.path)
             dirobj.remove(force=force, recurse=recurse)
+            self._known_dirs = {path for path in self._known_dirs
+                                if (not pl.PurePath(path) >= pl.PurePath(dirobj.path))}
             return True
         except:                             # ignore any errors
             return False
@@ -162,24 +262,132 @@ class IrodsHelper:
         """
         try:
             obj = self.getf(file_path, absolute=absolute)
+            self._lookups.invalidate(obj.path)
             obj.unlink(force=True)
             return True
         except:                             # ignore any errors
             return False
 
-    def disconnect(self):
-        """ Close down and cleanup the current session. """
+    def delete_tree(self, dir_path, absolute=False, force=False, jobs=1, progress_fn=None):
+        """ Delete the specified directory, and everything in the tree under it, relative to
+            the iRods current working directory (default) OR relative to the users root
+            directory, if the absolute argument is True. The tree is listed by a few catalog
+            queries, its files (data objects) are unlinked using the given number of concurrent
+            threads (each with its own connection of the session), and then its directories are
+            removed, bottom-up, those of each level concurrently. If a progress function is
+            given, it is called with an event (a dictionary) for each node deleted or not.
+            Returns the number of nodes which could not be deleted (0 if all were).
+        """
+        if (absolute):
+            dirpath = self.abs_path(dir_path)  # path is relative to root dir
+        else:
+            dirpath = self.rel_path(dir_path)  # path is relative to current working dir
+        dirs = self.list_dirs(dirpath)
+        if (dirpath not in dirs):
+            logging.error("(IrodsHelper.delete_tree): no directory {}".format(dirpath))
+            return 1
+        files = sorted(set([record.path for record in self._walk_files(dirpath)]))
+        self._lookups.invalidate_tree(dirpath)
+        self._known_dirs = {path for path in self._known_dirs
+                            if (not pl.PurePath(path) >= pl.PurePath(dirpath))}
+
+        total = len(files) + len(dirs)
+        counts = { "done": 0, "failed": 0 }
+        lock = threading.Lock()
+
+        def delete(kind, path, remove_fn):
+            try:
+                remove_fn(path, force=force)
+                ok = True
+            except Exception as ex:
+                logging.error("(IrodsHelper.delete_tree): failed to delete {}: {}".format(path, ex))
+                ok = False
+            with lock:
+                counts["done"] += 1
+                counts["failed"] += (0 if ok else 1)
+                if (progress_fn):
+                    progress_fn({ "event": "delete", "kind": kind, "path": path, "ok": ok,
+                                  "done": counts["done"], "total": total })
+
+        def remove_dir(path, force=False):
+            self._session.collections.remove(path, recurse=False, force=force)
+
+        levels = {}                         # directories by depth: deepest removed first
+        for path in dirs:
+            levels.setdefault(len(pl.PurePath(path).parts), []).append(path)
+        with ThreadPoolExecutor(max_workers=max(1, jobs)) as pool:
+            list(pool.map(lambda path: delete("file", path, self._session.data_objects.unlink), files))
+            for depth in sorted(levels, reverse=True):
+                list(pool.map(lambda path: delete("dir", path, remove_dir), sorted(levels[depth])))
+        return counts["failed"]
+
+    def detach(self):
+        """ Return the session of this helper to its pool, if it uses one, keeping the users
+            root directory, the current working directory, and the directories known to exist,
+            so that the helper can attach to another session of the pool later. The cached
+            lookups are dropped, as they belong to the session.
+        """
+        if (self._pool and self._session):
+            self._pool.release(self._session)
+            self._session = None
+            self._lookups.clear()
+
+    def disconnect(self, broken=False):
+        """ Close down and cleanup the current session. If this helper uses a session pool,
+            the session is returned to the pool instead, unless it is broken.
+        """
         logging.info("(IrodsHelper.disconnect)")
         if (self._session):
-            self._session.cleanup()
+            if (not self._pool):
+                self._session.cleanup()
+            elif (broken):
+                self._pool.discard(self._session)
+            else:
+                self._pool.release(self._session)
             self._session = None
             self._cwdpath = None
             self._root = None
             self._options = {}
+            self._known_dirs = set()
+            self._lookups.clear()           # cached objects belong to the session
+
+    def ensure_dirs(self, dir_paths, absolute=False, jobs=1):
+        """ Ensure that the directories (collections) with the given paths, relative to the
+            iRods current working directory (default) OR relative to the users root directory,
+            if the absolute argument is True, exist. The existing directories are found by
+            a single listing of their common subtree and cached, so only the missing leaf
+            directories are created. Independent branches are created using the given number
+            of concurrent threads. Returns the number of directories created.
+        """
+        if (absolute):
+            dirpaths = [self.abs_path(path) for path in dir_paths] # paths are relative to root dir
+        else:
+            dirpaths = [self.rel_path(path) for path in dir_paths] # relative to current working dir
+        unknown = [path for path in dirpaths if (path not in self._known_dirs)]
+        if (not unknown):
+            return 0
+
+        if (len(unknown) == 1):             # just check the one directory
+            if (self._session.collections.exists(unknown[0])):
+                self._known_dirs.add(unknown[0])
+        else:                               # list the common subtree once
+            self._known_dirs |= self.list_dirs(os.path.commonpath(unknown))
+
+        branches = IrodsHelper.missing_branches(unknown, self._known_dirs)
+        pooled = bool(self._pool)
+        if (pooled):                        # the branches take their sessions from the pool
+            self.detach()
+        try:
+            with ThreadPoolExecutor(max_workers=max(1, jobs)) as pool:
+                list(pool.map(self._create_branch, branches)) # re-raise any creation error
+        finally:
+            if (pooled):
+                self.attach()
+        return sum([len(branch) for branch in branches])
 
     def get_cwd(self):
         """ Get directory information for the current working directory. """
-        return self._session.collections.get(self._cwdpath) if (self._cwdpath) else None
+        return self._lookup_dir(str(self._cwdpath)) if (self._cwdpath) else None
 
     def get_dir(self, dir_path, absolute=False):
         """ Get the specified directory relative to the iRods current working directory (default)
@@ -189,7 +397,21 @@ class IrodsHelper:
             dirpath = self.abs_path(dir_path)  # path is relative to root dir
         else:
             dirpath = self.rel_path(dir_path)  # path is relative to current working dir
-        return self._session.collections.get(dirpath)
+        return self._lookup_dir(dirpath)
+
+    def get_file_stats(self, dir_path, absolute=False):
+        """ Return a dictionary mapping the absolute iRods path of every file (data object) in
+            the tree under the specified directory to a (size, checksum) tuple, using a single
+            catalog query rather than one request per file. The checksum is None if no checksum
+            is stored. The directory is relative to the iRods current working directory (default)
+            OR relative to the users root directory, if the absolute argument is True.
+        """
+        if (absolute):
+            dirpath = self.abs_path(dir_path)  # path is relative to root dir
+        else:
+            dirpath = self.rel_path(dir_path)  # path is relative to current working dir
+        return { record.path: (record.size, record.checksum)
+                 for record in self._walk_files(dirpath) }
 
     def getf(self, file_path, absolute=False):
         """ Get the specified file relative to the iRods current working directory (default)
@@ -199,27 +421,41 @@ class IrodsHelper:
             filepath = self.abs_path(file_path)  # path is relative to root dir
         else:
             filepath = self.rel_path(file_path)  # path is relative to current working dir
-        return self._session.data_objects.get(filepath)
+        return self._lookup_file(filepath)
 
     def get_metac(self, dir_path, absolute=False):
         """ Get the metadata for the specified directory relative to the iRods
             current working directory (default) OR relative to the users root directory,
-            if the absolute argument is True.
+            if the absolute argument is True. The metadata is read afresh, not from the cache.
         """
         dirobj = self.get_dir(dir_path, absolute=absolute)
-        return [Metadatum(item.name, item.value) for item in dirobj.metadata.items()]
+        return [Metadatum(item.name, item.value)
+                for item in self._session.metadata.get(Collection, dirobj.path)]
 
     def get_metaf(self, file_path, absolute=False):
         """ Get the metadata for the specified file relative to the iRods
             current working directory (default) OR relative to the users root directory,
-            if the absolute argument is True.
+            if the absolute argument is True. The metadata is read afresh, not from the cache.
         """
         obj = self.getf(file_path, absolute=absolute)
-        return [Metadatum(item.name, item.value) for item in obj.metadata.items()]
+        return [Metadatum(item.name, item.value)
+                for item in self._session.metadata.get(DataObject, obj.path)]
 
     def get_root(self):
         """ Get directory information for the users root directory. """
-        return self._session.collections.get(self._root)
+        return self._lookup_dir(str(self._root))
+
+    def list_dirs(self, dir_path):
+        """ Return the set of absolute paths of the given absolute directory path and all of
+            the directories (collections) in the tree under it, which exist in iRods, using
+            a single catalog query.
+        """
+        dirs = set()
+        for row in self._session.query(Collection.name).filter(Like(Collection.name, dir_path + "%")):
+            path = row[Collection.name]
+            if ((path == dir_path) or path.startswith(dir_path + "/")): # skip sibling prefixes
+                dirs.add(path)
+        return dirs
 
     def mkdir(self, dir_path, absolute=False):
         """ Make a directory (collection) with the given path relative to the iRods
@@ -230,31 +466,64 @@ class IrodsHelper:
             dirpath = self.abs_path(dir_path)  # path is relative to root dir
         else:
             dirpath = self.rel_path(dir_path)  # path is relative to current working dir
-        return self._session.collections.create(dirpath)
+        return self._lookups.put(dirpath, self._session.collections.create(dirpath))
 
-    def put_file(self, local_file, file_path, absolute=False):
+    def put_file(self, local_file, file_path, absolute=False, checksum=False, num_threads=0,
+                 tee=None, transform=None):
         """ Upload the specified local file to the specified path, relative to the iRods
             current working directory (default) OR relative to the users root directory,
-            if the absolute argument is True.
+            if the absolute argument is True. If the checksum argument is True, iRods computes
+            and stores a checksum for the uploaded file. A large file is sent in parts over the
+            given number of parallel streams (default 0: as chosen by the iRods client;
+            1: a single stream).
+            If a tee function is given and the file is sent in a single stream, each chunk of
+            the file is passed to it, in order, as the chunk is sent, so that the file is read
+            only once. Returns True if the whole file was passed to the tee function.
+            If a transform function is given, the file is sent in a single stream of the chunks
+            yielded by calling it on the iterator of the file's chunks (as teed).
         """
         if (absolute):
             filepath = self.abs_path(file_path)  # path is relative to root dir
         else:
             filepath = self.rel_path(file_path)  # path is relative to current working dir
-        self._session.data_objects.put(local_file, filepath)
+        self._lookups.invalidate(filepath)  # any file replaced is changed
+        if ((tee and (num_threads == 1)) or transform):
+            self._put_stream(local_file, filepath, tee, transform, checksum)
+            return bool(tee)
+        put_options = { kw.REG_CHKSUM_KW: "" } if checksum else {}
+        self._session.data_objects.put(local_file, filepath, num_threads=num_threads, **put_options)
+        return False
 
     def put_metaf(self, metadata, file_path, absolute=False):
         """ Attach the given metadata on the file specified relative to the iRods
             current working directory (default) OR relative to the users root directory,
-            if the absolute argument is True. Returns the new number of metadata items.
+            if the absolute argument is True. Metadata values of any type are stored as strings.
+            Only the changes to the current metadata are sent, in a single atomic operation.
+            The current metadata is read afresh, since that of a cached file may be stale.
+            Returns the new number of metadata items.
         """
         obj = self.getf(file_path, absolute=absolute)
-        keys = [item.keyword for item in metadata]
-        for key in keys:
-            del(obj.metadata[key])
-        for item in metadata:
-            obj.metadata.add(item.keyword, item.value)
-        return len(obj.metadata)
+        current = self._session.metadata.get(DataObject, obj.path)
+        changes = IrodsHelper.metadata_changes(current, metadata)
+        if (changes):
+            self._lookups.invalidate(obj.path) # its cached metadata is changed
+            self._session.metadata.apply_atomic_operations(DataObject, obj.path, *changes)
+        removed = len([change for change in changes if (change.operation == "remove")])
+        return len(current) + len(changes) - (2 * removed)
+
+    def reconnect(self):
+        """ Re-establish the session, as after it has broken, keeping the instantiation options,
+            the users root directory, and the current working directory.
+        """
+        logging.info("(IrodsHelper.reconnect)")
+        options, root, cwdpath = self._options, self._root, self._cwdpath
+        try:
+            self.disconnect(broken=True)
+        except Exception:                   # a broken session may fail to cleanup: drop it
+            self._session = None
+        self._options = options
+        self.connect()
+        self._root, self._cwdpath = root, cwdpath
 
     def rel_path(self, path):
         """ Return an iRods path for the given path relative to the current working directory. """
@@ -268,6 +537,10 @@ class IrodsHelper:
         """ Return the current session object. """
         return self._session
 
+    def session_pool(self):
+        """ Return the pool from which this helper checks out its sessions, or None. """
+        return self._pool
+
     def set_connection(self, json_body):
         """ Create a session and set it as current, using the fields of the given JSON object. """
         self.disconnect()                   # close and cleanup any existing session
@@ -289,11 +562,185 @@ class IrodsHelper:
             self._root = None
         self.cd_root()                      # cd back to root after changing root dir
 
-    def walk(self, topdown=True):
+    def _create_branch(self, leaf_paths):
+        """ Create the given absolute leaf directory paths, in order, and all of their missing
+            ancestors, recording them as known to exist. If this helper uses a session pool,
+            a session is checked out from the pool for the branch, and the created collections,
+            which belong to that session, are not cached.
+        """
+        session = self._pool.acquire() if (self._pool) else self._session
+        try:
+            for path in leaf_paths:
+                coll = session.collections.create(path)
+                if (not self._pool):
+                    self._lookups.put(path, coll)
+                self._known_dirs.add(path)
+                self._known_dirs.update([str(parent) for parent in pl.PurePath(path).parents])
+        finally:
+            if (self._pool):
+                self._pool.release(session)
+
+    def _query_tree(self, dirpath, columns, ordered=False, page_size=None):
+        """ Generator to yield the rows of a catalog query for the given columns of the given
+            absolute directory path and of all the directories in the tree under it, in pages
+            of the given number of rows (default: as chosen by the iRods client). If ordered
+            is True, the rows of each directory are ordered by directory and file name.
+            Any '_' or '%' in the path is a wildcard to the LIKE query, so rows of directories
+            outside the tree which the pattern also matches are skipped.
+        """
+        prefix = dirpath + "/"
+        for criterion in (Collection.name == dirpath, Like(Collection.name, prefix + "%")):
+            query = self._session.query(*columns).filter(criterion)
+            if (ordered):
+                query = query.order_by(Collection.name).order_by(DataObject.name)
+            if (page_size):
+                query = query.limit(page_size)
+            for row in query:
+                if ((row[Collection.name] == dirpath) or row[Collection.name].startswith(prefix)):
+                    yield row
+
+    def _lookup_dir(self, dirpath):
+        """ Return the collection with the given absolute path, from the cache if possible. """
+        dirobj = self._lookups.get(dirpath)
+        if (dirobj is None):
+            dirobj = self._lookups.put(dirpath, self._session.collections.get(dirpath))
+        return dirobj
+
+    def _lookup_file(self, filepath):
+        """ Return the data object with the given absolute path, from the cache if possible. """
+        obj = self._lookups.get(filepath)
+        if (obj is None):
+            obj = self._lookups.put(filepath, self._session.data_objects.get(filepath))
+        return obj
+
+    def _put_stream(self, local_file, filepath, tee=None, transform=None, checksum=False):
+        """ Upload the given local file to the given absolute iRods path in a single stream,
+            passing each chunk read to the given tee function, if any, and sending the chunks
+            yielded by the given transform function, if any, instead of the chunks read.
+        """
+        put_options = { kw.OPR_TYPE_KW: 1 }    # a put operation: triggers the post-put policy
+        with open(local_file, "rb") as source:
+            chunks = iter(lambda: source.read(_STREAM_CHUNK_SIZE), b"")
+            if (tee):
+                chunks = IrodsHelper._teed(chunks, tee)
+            if (transform):
+                chunks = transform(chunks)
+            with self._session.data_objects.open(filepath, "w", **put_options) as target:
+                for chunk in chunks:
+                    target.write(chunk)
+        if (checksum):
+            self._session.data_objects.chksum(filepath) # compute and register the checksum
+
+    @staticmethod
+    def _teed(chunks, tee):
+        """ Generator to pass each of the given chunks to the given tee function and yield it. """
+        for chunk in chunks:
+            tee(chunk)
+            yield chunk
+
+    def walk_metadata(self, dir_path, absolute=False, include_bare=True, page_size=None):
+        """ Generator to yield an (absolute iRods path, list of Metadatum) tuple for every file
+            (data object) in the tree under the specified directory, using a few catalog queries,
+            returning rows in pages of the given size, rather than one request per file.
+            The files with metadata are yielded first and then, if include_bare is True, those
+            without any, with an empty list. The directory is relative to the iRods current
+            working directory (default) OR relative to the users root directory, if the absolute
+            argument is True.
+        """
+        if (absolute):
+            dirpath = self.abs_path(dir_path)  # path is relative to root dir
+        else:
+            dirpath = self.rel_path(dir_path)  # path is relative to current working dir
+        columns = (Collection.name, DataObject.name, DataObjectMeta.name, DataObjectMeta.value)
+        seen = set()
+        path, items = None, []
+        for row in self._query_tree(dirpath, columns, ordered=True, page_size=page_size):
+            row_path = "{}/{}".format(row[Collection.name], row[DataObject.name])
+            if (row_path != path):          # rows of a file are together: the file is done
+                if (path is not None):
+                    yield (path, items)
+                path, items = row_path, []
+                seen.add(path)
+            item = Metadatum(row[DataObjectMeta.name], row[DataObjectMeta.value])
+            if (item not in items):         # each replica of a file repeats its metadata
+                items.append(item)
+        if (path is not None):
+            yield (path, items)
+
+        if (include_bare):
+            for row in self._query_tree(dirpath, (Collection.name, DataObject.name),
+                                        page_size=page_size):
+                row_path = "{}/{}".format(row[Collection.name], row[DataObject.name])
+                if (row_path not in seen):
+                    seen.add(row_path)
+                    yield (row_path, [])
+
+    def walk(self, topdown=True, page_size=None):
         """ Collection tree generator. For each subcollection in the dir tree,
             starting at the current working directory, yield a 3-tuple of
             (self, self.subcollections, self.data_objects)
+            The whole tree is listed first, by two catalog queries returning rows in pages of
+            the given size, rather than by two requests for each collection. Subcollections
+            and data objects are ordered by name.
+        """
+        if (not self._cwdpath):
+            return
+        top = str(self._cwdpath)
+        colls = {}                          # collections by path
+        for row in self._query_tree(top, (Collection,), page_size=page_size):
+            colls[row[Collection.name]] = iRODSCollection(self._session.collections, row)
+        if (top not in colls):
+            return
+
+        subcolls = {path: [] for path in colls}
+        for path, coll in colls.items():
+            parent = str(pl.PurePath(path).parent)
+            if ((path != top) and (parent in subcolls)):
+                subcolls[parent].append(coll)
+        replicas = {path: {} for path in colls} # rows of each data object, by collection path
+        for row in self._query_tree(top, (DataObject, Collection.name), page_size=page_size):
+            if (row[Collection.name] in replicas):
+                replicas[row[Collection.name]].setdefault(row[DataObject.id], []).append(row)
+        objs = {path: [iRODSDataObject(self._session.data_objects, colls[path], rows)
+                       for rows in replicas[path].values()] for path in colls}
+
+        def walk_from(coll):
+            children = sorted(subcolls[coll.path], key=lambda sub: sub.name)
+            node = (coll, children, sorted(objs[coll.path], key=lambda obj: obj.name))
+            if (topdown):
+                yield node
+            for child in children:
+                yield from walk_from(child)
+            if (not topdown):
+                yield node
+
+        yield from walk_from(colls[top])
+
+    def walk_files(self, dir_path, absolute=False, page_size=None):
+        """ Generator to yield a FileRecord (path, size, checksum) for every file (data object)
+            in the tree under the specified directory, using a few catalog queries returning
+            rows in pages of the given size. The checksum is None if no checksum is stored.
+            The directory is relative to the iRods current working directory (default)
+            OR relative to the users root directory, if the absolute argument is True.
+        """
+        if (absolute):
+            dirpath = self.abs_path(dir_path)  # path is relative to root dir
+        else:
+            dirpath = self.rel_path(dir_path)  # path is relative to current working dir
+        yield from self._walk_files(dirpath, page_size)
+
+    def _walk_files(self, dirpath, page_size=None):
+        """ Generator to yield a FileRecord for every file in the tree under the given absolute
+            directory path, taking the checksum of any replica which has one.
         """
-        cwd = self.get_cwd()
-        if (cwd):
-            yield from cwd.walk(topdown=topdown)
+        columns = (Collection.name, DataObject.name, DataObject.size, DataObject.checksum)
+        record = None
+        for row in self._query_tree(dirpath, columns, ordered=True, page_size=page_size):
+            path = "{}/{}".format(row[Collection.name], row[DataObject.name])
+            if ((record is not None) and (record.path != path)): # replicas are together
+                yield record
+                record = None
+            if ((record is None) or (record.checksum is None)): # prefer a replica checksum
+                record = FileRecord(path, int(row[DataObject.size]), row[DataObject.checksum] or None)
+        if (record is not None):
+            yield record
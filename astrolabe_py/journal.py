@@ -0,0 +1,113 @@
+"""
+Class to keep an append-only journal of completed file uploads, so an interrupted run can be resumed.
+  Last Modified: Record the size and modification time of a file as it was before its upload.
+"""
+import json
+import logging
+import os
+import threading
+
+logging.basicConfig(level=logging.ERROR)    # default logging configuration
+
+# default number of records written between each sync of the journal to disk
+DEFAULT_SYNC_BATCH = 100
+
+
+class UploadJournal:
+    """ Class to keep an append-only journal of completed file uploads. Each record holds the
+        source path, size, and modification time of the local file, the target path of the
+        uploaded file, and whether metadata was attached to it.
+    """
+
+    def __init__(self, journal_path, sync_batch=DEFAULT_SYNC_BATCH):
+        """ Open the journal at the given path, creating it if necessary, and load any records
+            already in it. New records are synced to disk after every 'sync_batch' records.
+        """
+        self._journal_path = journal_path
+        self._sync_batch = max(1, sync_batch)
+        self._records = self._load(journal_path)
+        self._lock = threading.Lock()
+        self._unsynced = 0                  # number of records written since the last sync
+        self._journal = open(journal_path, "a")
+        if (self._journal.tell() > 0):      # terminate any partially written last record
+            with open(journal_path, "rb") as journal:
+                journal.seek(-1, os.SEEK_END)
+                if (journal.read(1) != b"\n"):
+                    self._journal.write("\n")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __len__(self):
+        return len(self._records)
+
+    def close(self):
+        """ Sync any outstanding records to disk and close the journal. """
+        with self._lock:
+            if (self._journal):
+                self._sync()
+                self._journal.close()
+                self._journal = None
+
+    def is_done(self, source_path, target_path, metadata_wanted=False):
+        """ Tell whether the journal records that the given, unchanged, local file was uploaded
+            to the given target path, with its metadata attached if metadata is wanted.
+        """
+        record = self._records.get(os.path.abspath(source_path))
+        if ((record is None) or (record.get("target") != target_path)):
+            return False
+        if (metadata_wanted and (not record.get("metadata"))):
+            return False
+        try:
+            stat = os.stat(source_path)
+        except OSError:
+            return False
+        return ((record.get("size") == stat.st_size) and (record.get("mtime") == stat.st_mtime))
+
+    def journal_path(self):
+        """ Return the path to the journal file. """
+        return self._journal_path
+
+    def record(self, source_path, target_path, metadata_attached=False, size=None, mtime=None):
+        """ Append a record of the completed upload of the given local file to the given target
+            path. The size and modification time should be those of the file taken before it
+            was uploaded, so that a file changed during its upload is not taken as done; if
+            not given, the file is examined now. Records are keyed by absolute source path
+            and synced to disk in batches.
+        """
+        if ((size is None) or (mtime is None)):
+            stat = os.stat(source_path)
+            size, mtime = stat.st_size, stat.st_mtime
+        record = { "source": os.path.abspath(source_path), "size": size, "mtime": mtime,
+                   "target": target_path, "metadata": bool(metadata_attached) }
+        with self._lock:
+            self._journal.write(json.dumps(record) + "\n")
+            self._records[record["source"]] = record
+            self._unsynced += 1
+            if (self._unsynced >= self._sync_batch):
+                self._sync()
+
+    def _load(self, journal_path):
+        """ Return a dictionary of the records in the given journal file, keyed by source path.
+            Later records replace earlier ones. A partially written (last) record is ignored.
+        """
+        records = {}
+        if (os.path.isfile(journal_path)):
+            with open(journal_path, "r") as journal:
+                for line in journal:
+                    try:
+                        record = json.loads(line)
+                        records[record["source"]] = record
+                    except (ValueError, KeyError, TypeError):
+                        logging.warning("(UploadJournal): skipping bad record: {}".format(line))
+        return records
+
+    def _sync(self):
+        """ Flush the written records and force them to disk. Caller must hold the lock. """
+        if (self._unsynced > 0):
+            self._journal.flush()
+            os.fsync(self._journal.fileno())
+            self._unsynced = 0
@@ -0,0 +1,75 @@
+"""
+Class to cache the results of looking up paths (e.g. iRods data objects and collections), for a while.
+  Last Modified: Initial creation.
+"""
+import collections
+import threading
+import time
+
+# default maximum number of entries held in a lookup cache
+DEFAULT_MAX_ENTRIES = 1024
+
+# default number of seconds for which a cached entry is used
+DEFAULT_TTL = 60.0
+
+
+class LookupCache:
+    """ Class to hold a bounded number of values keyed by path, each for a limited time.
+        When full, the least recently used entry is dropped to make room for a new one.
+        All methods may be called from several threads at once.
+    """
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES, ttl=DEFAULT_TTL, clock=time.monotonic):
+        """ Create a cache of at most the given number of entries, each of which expires the
+            given number of seconds after it is stored. A cache of no entries holds nothing.
+        """
+        self._max_entries = max(0, max_entries)
+        self._ttl = ttl
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._entries = collections.OrderedDict() # path => (value, expiry), least recent first
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+    def clear(self):
+        """ Drop all of the entries. """
+        with self._lock:
+            self._entries.clear()
+
+    def get(self, path):
+        """ Return the value cached for the given path, or None if there is none or it expired. """
+        with self._lock:
+            entry = self._entries.get(path)
+            if (entry is None):
+                return None
+            if (self._clock() >= entry[1]):
+                del(self._entries[path])
+                return None
+            self._entries.move_to_end(path)
+            return entry[0]
+
+    def invalidate(self, path):
+        """ Drop any entry for the given path. """
+        with self._lock:
+            self._entries.pop(path, None)
+
+    def invalidate_tree(self, path):
+        """ Drop any entries for the given path and for all of the paths under it. """
+        prefix = path.rstrip("/") + "/"
+        with self._lock:
+            for key in [key for key in self._entries if ((key == path) or key.startswith(prefix))]:
+                del(self._entries[key])
+
+    def put(self, path, value):
+        """ Cache the given value for the given path, dropping the least recently used entry,
+            if the cache is full. Returns the value.
+        """
+        if (self._max_entries > 0):
+            with self._lock:
+                self._entries[path] = (value, self._clock() + self._ttl)
+                self._entries.move_to_end(path)
+                while (len(self._entries) > self._max_entries):
+                    self._entries.popitem(last=False)
+        return value
@@ -0,0 +1,49 @@
+#
+# Module to merge the result reports of several sharded checker or uploader runs.
+#   Written by: agent. 10/19/2026.
+#   Last Modified: Initial creation.
+#
+import os
+import sys
+
+# prefix of the line which begins the results for each file in a report
+_FILENAME_PREFIX = "Filename: "
+
+
+def execute_merge(options):
+    """ Returns a list, each element of which is the list of report strings for a single
+        file, merged from all of the report files and ordered by filename.
+    """
+    report_paths = options.get("report_paths", [])
+    for report_path in report_paths:
+        if (not os.path.isfile(report_path)):
+            print("Error: Specified report path '{}' is not a file".format(report_path))
+            sys.exit(40)
+    return merge_reports([read_report(report_path) for report_path in report_paths])
+
+
+def merge_reports(reports):
+    """ Merge the given list of reports, each a list of file result blocks, into a single
+        list of file result blocks, ordered by filename. A file appearing in more than
+        one report is only reported once, from the last report in which it appears.
+    """
+    blocks = {}
+    for report in reports:
+        for block in report:
+            blocks[block[0]] = block
+    return [blocks[filename_line] for filename_line in sorted(blocks)]
+
+
+def read_report(report_path):
+    """ Read the given report file and return a list of file result blocks. Each block
+        is a list of report lines, the first of which names the file. Lines preceding
+        the first file result block are ignored.
+    """
+    blocks = []
+    with open(report_path, "r") as report_file:
+        for line in report_file.read().splitlines():
+            if (line.startswith(_FILENAME_PREFIX)):
+                blocks.append([line])       # start a new block for a new file
+            elif (blocks and line):
+                blocks[-1].append(line)     # continue the current block
+    return blocks
@@ -0,0 +1,155 @@
+#
+# Module to plan an upload, estimating its cost, without connecting to iRods.
+#   Written by: agent. 10/19/2026.
+#   Last Modified: Skip unreadable files when counting metadata items.
+#
+import os
+import pathlib as pl
+import sys
+
+import astrolabe_py.fits_ops as fo
+import astrolabe_py.uploader as up
+import astrolabe_py.utils as utils
+from astrolabe_py.irods_help import IrodsHelper
+
+# default throughput of the link to iRods, in bytes per second
+DEFAULT_BANDWIDTH = 100 * 1024**2
+
+# default latency of a single round trip to the iRods server, in seconds
+DEFAULT_LATENCY = 0.05
+
+# number of round trips made to create a collection and to upload a file
+_MKDIR_ROUND_TRIPS = 1
+_PUT_ROUND_TRIPS = 3                        # existence check, open, and close
+
+# number of round trips made to replace the metadata of a file
+_METADATA_ROUND_TRIPS = 3                   # fetch the file and its metadata, apply the changes
+
+# number of files whose metadata is extracted at once, to count the metadata items
+_METADATA_BATCH_SIZE = 100
+
+# placeholder for the iRods root directory, which is not known without connecting
+_PLAN_ROOT = "/"
+
+
+def execute_plan(options):
+    """ Returns a list of strings reporting the plan for uploading the specified file(s):
+        the collections to create, the files and bytes to transfer, the metadata items to
+        attach, and the estimated wall time, given the other arguments.
+    """
+    # get the desired subset of metadata keys, if any specified by a keyfile
+    md_keys = utils.get_metadata_keys(options)
+    if (md_keys):
+        options["keys_subset"] = md_keys
+
+    images_path = options.get("images_path")
+    if (utils.path_has_dots(images_path)):
+        print("Error: Images path argument must be asbolute; it may not contain '..' or '.'")
+        sys.exit(10)
+
+    if (os.path.isfile(images_path)):
+        to_path = options.get("to_path") or os.path.basename(images_path)
+        plan = plan_upload([(images_path, to_path)], [], options)
+    elif (os.path.isdir(images_path)):
+        plan = plan_tree(images_path, options)
+    else:
+        print("Error: Specified images path '{}' is not a file or directory".format(images_path))
+        sys.exit(11)
+    return format_plan(plan)
+
+
+def plan_tree(root_node, options):
+    """ Return the plan for uploading the tree of files under the given root node, found
+        exactly as the uploader finds them.
+    """
+    root_path = os.path.normpath(root_node) # remove any trailing slashes from given root path
+    source_paths = up.get_source_paths(root_path, options)
+    suffix_paths = up.make_suffix_paths(root_path, source_paths, options)
+    dir_paths = up.make_dir_paths(suffix_paths, options)
+    target_paths = up.make_target_paths(suffix_paths, options)
+    return plan_upload(list(zip(source_paths, target_paths)), dir_paths, options)
+
+
+def plan_upload(pairs, dir_paths, options):
+    """ Return a dictionary holding the plan for uploading the given (local source file,
+        iRods target path) pairs into the given directories, and the estimated cost of it.
+        All of the directories are assumed to be missing, since iRods is not consulted.
+    """
+    abs_dirs = [os.path.join(_PLAN_ROOT, adir) for adir in dir_paths]
+    collections = {str(path) for adir in abs_dirs
+                   for path in [pl.PurePath(adir)] + list(pl.PurePath(adir).parents)}
+    branches = IrodsHelper.missing_branches(abs_dirs, set([_PLAN_ROOT]))
+    plan = {
+        "collections": len(collections - set([_PLAN_ROOT])),
+        "collection_creates": sum([len(branch) for branch in branches]), # only leaves are created
+        "files": len(pairs),
+        "bytes": sum([os.path.getsize(pair[0]) for pair in pairs]),
+        "metadata_files": 0,
+        "metadata_items": 0
+    }
+
+    wanted = [pair[0] for pair in pairs if up.metadata_wanted(pair[0], options)]
+    for start in range(0, len(wanted), _METADATA_BATCH_SIZE): # hold only one batch at a time
+        counts = [len(metadata) for metadata in
+                  fo.fits_metadata_batch(wanted[start:start + _METADATA_BATCH_SIZE], options)
+                  if metadata is not None]  # skip any unreadable files
+        plan["metadata_files"] += len(counts)
+        plan["metadata_items"] += sum(counts)
+
+    plan.update(estimate_time(plan, options))
+    return plan
+
+
+def estimate_time(plan, options):
+    """ Return a dictionary of the estimated times, in seconds, to carry out the given plan,
+        from the bandwidth and latency given in the options or the default ones. Collections
+        are created first; then the round trips of the uploads overlap on the concurrent
+        workers, while the transfers share the bandwidth of the link.
+    """
+    bandwidth = options.get("bandwidth") or DEFAULT_BANDWIDTH
+    latency = options.get("latency")
+    latency = DEFAULT_LATENCY if (latency is None) else latency
+    jobs = options.get("jobs", 1) or 1
+
+    round_trips = ((plan["files"] * _PUT_ROUND_TRIPS) +
+                   (plan["metadata_files"] * _METADATA_ROUND_TRIPS))
+    mkdir_time = plan["collection_creates"] * _MKDIR_ROUND_TRIPS * latency
+    transfer_time = plan["bytes"] / bandwidth
+    latency_time = round_trips * latency / jobs
+    return {
+        "mkdir_time": mkdir_time,
+        "transfer_time": transfer_time,
+        "latency_time": latency_time,
+        "wall_time": mkdir_time + transfer_time + latency_time
+    }
+
+
+def format_plan(plan):
+    """ Return a list of report strings for the given plan. """
+    return [
+        "Collections to create: {} (in {} requests)".format(plan["collections"],
+                                                             plan["collection_creates"]),
+        "Files to transfer: {}".format(plan["files"]),
+        "Bytes to transfer: {} ({})".format(plan["bytes"], format_bytes(plan["bytes"])),
+        "Metadata items to attach: {} (to {} files)".format(plan["metadata_items"],
+                                                             plan["metadata_files"]),
+        "Estimated collection creation time: {}".format(format_seconds(plan["mkdir_time"])),
+        "Estimated transfer time: {}".format(format_seconds(plan["transfer_time"])),
+        "Estimated round trip time: {}".format(format_seconds(plan["latency_time"])),
+        "Estimated wall time: {}".format(format_seconds(plan["wall_time"]))
+    ]
+
+
+def format_bytes(nbytes):
+    """ Return a short, human-readable string for the given number of bytes. """
+    for unit in ["B", "KiB", "MiB", "GiB", "TiB"]:
+        if ((nbytes < 1024) or (unit == "TiB")):
+            return "{:.1f} {}".format(nbytes, unit) if (unit != "B") else "{} B".format(nbytes)
+        nbytes = nbytes / 1024
+
+
+def format_seconds(seconds):
+    """ Return a string for the given number of seconds, as hours, minutes and seconds. """
+    minutes, secs = divmod(int(round(seconds)), 60)
+    hours, minutes = divmod(minutes, 60)
+    return "{:d}:{:02d}:{:02d}".format(hours, minutes, secs)
@@ -0,0 +1,191 @@
+"""
+Class to track the progress of an upload run: emit structured events, display progress, and summarize.
+  Last Modified: Call the event callback outside of the lock, and survive its failures.
+"""
+import json
+import logging
+import math
+import threading
+import time
+
+logging.basicConfig(level=logging.ERROR)    # default logging configuration
+
+# phases of the processing of a file, whose durations are tracked
+PHASES = [ "extract", "put", "attach" ]
+
+# percentiles of the phase durations reported in the summary
+SUMMARY_PERCENTILES = [ 50, 90, 99 ]
+
+# minimum interval between updates of the progress display, in seconds
+DISPLAY_INTERVAL = 0.5
+
+
+def percentile(values, pct):
+    """ Return the given percentile (0-100) of the given list of numbers, by the nearest-rank
+        method, or None if the list is empty.
+    """
+    if (not values):
+        return None
+    ordered = sorted(values)
+    rank = max(1, int(math.ceil((pct / 100.0) * len(ordered))))
+    return ordered[rank - 1]
+
+
+class ProgressTracker:
+    """ Class to track the progress of an upload run. Each processed file is reported as an
+        event (a dictionary), which is written as a JSON line to an events file and/or passed
+        to a callback function. A rolling progress line can be displayed, and a summary, with
+        throughput and percentiles of the phase durations, is produced at the end.
+        All methods may be called from several threads at once.
+    """
+
+    def __init__(self, total_files=0, total_bytes=0, events_path=None, callback=None,
+                 display=None, clock=time.monotonic):
+        """ Create a tracker for a run of the given number of files and bytes. Events are
+            appended, as JSON lines, to the file at the given events path and/or passed to the
+            given callback function. If a display stream (e.g. sys.stderr) is given, a rolling
+            progress line is written to it.
+        """
+        self._total_files = total_files
+        self._total_bytes = total_bytes
+        self._events_file = open(events_path, "a") if events_path else None
+        self._callback = callback
+        self._display = display
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._start = clock()
+        self._last_display = None
+        self._files = 0
+        self._failed = 0
+        self._bytes = 0
+        self._retries = 0
+        self._durations = { phase: [] for phase in PHASES }
+        self.event("start", files=total_files, bytes=total_bytes)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        """ Close the events file, if any. """
+        with self._lock:
+            if (self._events_file):
+                self._events_file.close()
+                self._events_file = None
+
+    def event(self, kind, **fields):
+        """ Emit an event of the given kind with the given fields. """
+        record = dict(event=kind, elapsed=round(self._clock() - self._start, 6), **fields)
+        with self._lock:
+            self._emit(record)
+        self._notify(record)
+
+    def file_done(self, source_file, to_path, nbytes, phases, retries=0, ok=True):
+        """ Record the processing of a file of the given size, with the durations, in seconds,
+            of its phases (a dictionary keyed by phase name) and the number of retries it took.
+        """
+        record = { "event": "file", "elapsed": round(self._clock() - self._start, 6),
+                   "source": source_file, "target": to_path, "bytes": nbytes, "ok": ok,
+                   "retries": retries, "phases": phases }
+        with self._lock:
+            self._files += 1
+            self._failed += (0 if ok else 1)
+            self._bytes += (nbytes if ok else 0)
+            self._retries += retries
+            for phase, duration in phases.items():
+                self._durations.setdefault(phase, []).append(duration)
+            self._emit(record)
+            self._show()
+        self._notify(record)
+
+    def finish(self):
+        """ Emit the summary event, end the progress display, and return the summary. """
+        summary = self.summary()
+        record = dict(event="summary", **summary)
+        with self._lock:
+            self._emit(record)
+            if (self._display and (self._last_display is not None)):
+                self._display.write("\n")
+                self._display.flush()
+        self._notify(record)
+        return summary
+
+    def summary(self):
+        """ Return a dictionary summarizing the run so far: counts, throughput, and the
+            percentiles of the durations of each phase.
+        """
+        with self._lock:
+            elapsed = max(self._clock() - self._start, 1e-9)
+            phases = {}
+            for phase, durations in self._durations.items():
+                if (durations):
+                    stats = { "p{}".format(pct): percentile(durations, pct)
+                              for pct in SUMMARY_PERCENTILES }
+                    stats["max"] = max(durations)
+                    stats["count"] = len(durations)
+                    phases[phase] = stats
+            return { "files": self._files, "failed": self._failed, "bytes": self._bytes,
+                     "retries": self._retries, "seconds": elapsed,
+                     "files_per_second": self._files / elapsed,
+                     "bytes_per_second": self._bytes / elapsed, "phases": phases }
+
+    def summary_lines(self, summary=None):
+        """ Return a list of report strings for the given (or the current) summary. """
+        summary = summary or self.summary()
+        lines = [
+            "Files: {} ({} failed), {:.1f} MB in {:.1f} seconds".format(
+                summary["files"], summary["failed"], summary["bytes"] / 1e6, summary["seconds"]),
+            "Throughput: {:.2f} files/s, {:.2f} MB/s, {} retries".format(
+                summary["files_per_second"], summary["bytes_per_second"] / 1e6, summary["retries"])
+        ]
+        for phase, stats in summary["phases"].items():
+            pcts = ", ".join(["p{0}={1:.3f}s".format(pct, stats["p{}".format(pct)])
+                              for pct in SUMMARY_PERCENTILES])
+            lines.append("Phase {}: {} ({} files, max={:.3f}s)".format(
+                phase, pcts, stats["count"], stats["max"]))
+        return lines
+
+    def _emit(self, record):
+        """ Write the given event record to the events file. Caller must hold the lock. """
+        if (self._events_file):
+            self._events_file.write(json.dumps(record, default=str) + "\n")
+            self._events_file.flush()
+
+    def _notify(self, record):
+        """ Pass the given event record to the callback. Caller must not hold the lock, so the
+            callback may call back into the tracker. A failing callback does not fail the run.
+        """
+        if (self._callback):
+            try:
+                self._callback(record)
+            except Exception as ex:
+                logging.error("(ProgressTracker): event callback failed: {}".format(ex))
+
+    def _show(self):
+        """ Update the rolling progress display, if it is due. Caller must hold the lock. """
+        if (not self._display):
+            return
+        now = self._clock()
+        if ((self._last_display is not None) and ((now - self._last_display) < DISPLAY_INTERVAL)
+            and (self._files < self._total_files)):
+            return
+        self._last_display = now
+        elapsed = max(now - self._start, 1e-9)
+        rate = self._bytes / elapsed
+        remaining = max(self._total_bytes - self._bytes, 0)
+        eta = (remaining / rate) if (rate > 0) else float("inf")
+        self._display.write("\r{}/{} files, {:.1f}/{:.1f} MB, {:.2f} files/s, {:.2f} MB/s, ETA {}   ".format(
+            self._files, self._total_files, self._bytes / 1e6, self._total_bytes / 1e6,
+            self._files / elapsed, rate / 1e6, _format_eta(eta)))
+        self._display.flush()
+
+
+def _format_eta(seconds):
+    """ Return a string for the given estimated number of seconds remaining. """
+    if (math.isinf(seconds)):
+        return "--:--:--"
+    minutes, secs = divmod(int(round(seconds)), 60)
+    hours, minutes = divmod(minutes, 60)
+    return "{:d}:{:02d}:{:02d}".format(hours, minutes, secs)
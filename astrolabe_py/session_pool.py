@@ -0,0 +1,153 @@
+"""
+Class to share a bounded pool of warm, authenticated iRods sessions among several threads.
+  Last Modified: Initial creation.
+"""
+import logging
+import threading
+import time
+
+logging.basicConfig(level=logging.ERROR)    # default logging configuration
+
+# default number of seconds a session may sit unused in the pool before it is closed
+DEFAULT_MAX_IDLE = 300.0
+
+# default number of seconds a session may sit unused before it is checked on checkout
+DEFAULT_CHECK_AFTER = 30.0
+
+
+def check_session(session):
+    """ Tell whether the given iRods session still works, by asking the server for a
+        collection which always exists: the zone collection of the session's user.
+    """
+    return session.collections.exists("/{}".format(session.zone))
+
+
+class SessionPool:
+    """ Class to hand out iRods sessions, created by a given factory function, to several
+        threads, holding no more than a maximum number of sessions open at once. Returned
+        sessions are kept, idle, for reuse: those idle for a while are checked before they are
+        handed out again, and those idle too long are closed. All methods may be called from
+        several threads at once.
+    """
+
+    def __init__(self, factory, max_sessions=1, max_idle=DEFAULT_MAX_IDLE,
+                 check_after=DEFAULT_CHECK_AFTER, health_fn=check_session, clock=time.monotonic):
+        """ Create a pool of at most the given number of sessions, each created by calling
+            the given factory function. Sessions idle for more than the given number of
+            seconds are closed. Sessions idle for more than the given check interval are
+            checked with the given health function (returning True if a session works)
+            before they are handed out again.
+        """
+        self._factory = factory
+        self._max_sessions = max(1, max_sessions)
+        self._max_idle = max_idle
+        self._check_after = check_after
+        self._health_fn = health_fn
+        self._clock = clock
+        self._cond = threading.Condition()
+        self._idle = []                     # (session, time returned) pairs, most recent last
+        self._size = 0                      # number of sessions open: idle or checked out
+        self._closed = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def acquire(self, timeout=None):
+        """ Check out a session: a working idle one if there is any, otherwise a new one if the
+            pool is not full, otherwise the next one returned, waiting for it up to the given
+            number of seconds (forever, if None). Raises TimeoutError if none becomes free.
+        """
+        deadline = None if (timeout is None) else (self._clock() + timeout)
+        while True:
+            with self._cond:
+                self._evict()
+                while ((not self._closed) and (not self._idle) and (self._size >= self._max_sessions)):
+                    remaining = None if (deadline is None) else (deadline - self._clock())
+                    if ((remaining is not None) and (remaining <= 0)):
+                        raise TimeoutError("(SessionPool): no session free after {} seconds".format(timeout))
+                    self._cond.wait(remaining)
+                    self._evict()
+                if (self._closed):
+                    raise RuntimeError("(SessionPool): pool is closed")
+                if (self._idle):
+                    session, returned = self._idle.pop()
+                else:
+                    session, returned = None, None
+                    self._size += 1         # reserve a place for the new session
+
+            if (session is None):
+                try:
+                    return self._factory()
+                except Exception:
+                    self._forget()
+                    raise
+            if (((self._clock() - returned) < self._check_after) or self._healthy(session)):
+                return session
+            logging.info("(SessionPool.acquire): discarding a broken session")
+            self.discard(session)
+
+    def close(self):
+        """ Close the idle sessions and refuse further checkouts. Sessions checked out are
+            closed when they are returned.
+        """
+        with self._cond:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._size -= len(idle)
+            self._cond.notify_all()
+        for session, _ in idle:
+            self._cleanup(session)
+
+    def discard(self, session):
+        """ Close the given checked out session, which is broken, instead of returning it. """
+        self._cleanup(session)
+        self._forget()
+
+    def release(self, session):
+        """ Return the given checked out session to the pool, for reuse. """
+        with self._cond:
+            if (not self._closed):
+                self._idle.append((session, self._clock()))
+                self._cond.notify()
+                return
+        self.discard(session)
+
+    def size(self):
+        """ Return the number of sessions open: idle or checked out. """
+        with self._cond:
+            return self._size
+
+    def _cleanup(self, session):
+        """ Close the given session, ignoring any failure to do so. """
+        try:
+            session.cleanup()
+        except Exception as ex:
+            logging.info("(SessionPool): failed to close a session: {}".format(ex))
+
+    def _evict(self):
+        """ Close any sessions idle for too long. Caller must hold the lock. """
+        now = self._clock()
+        stale = [pair for pair in self._idle if ((now - pair[1]) > self._max_idle)]
+        if (stale):
+            self._idle = [pair for pair in self._idle if ((now - pair[1]) <= self._max_idle)]
+            self._size -= len(stale)
+            self._cond.notify_all()
+            for session, _ in stale:
+                self._cleanup(session)
+
+    def _forget(self):
+        """ Give up the place of a session which is no longer open. """
+        with self._cond:
+            self._size -= 1
+            self._cond.notify()
+
+    def _healthy(self, session):
+        """ Tell whether the given session passes the health check. """
+        try:
+            return bool(self._health_fn(session))
+        except Exception as ex:
+            logging.info("(SessionPool): session failed its health check: {}".format(ex))
+            return False
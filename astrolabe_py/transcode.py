@@ -0,0 +1,82 @@
+#
+# Module to transcode (compress or decompress) the stream of bytes of a file as it is uploaded.
+#   Written by: agent. 10/19/2026.
+#   Last Modified: Compress at the fastest gzip level by default.
+#
+import zlib
+
+# file name extension of gzipped files
+GZIP_EXTENSION = ".gz"
+
+# default gzip compression level: the fastest level, so compression keeps up with the upload stream
+DEFAULT_GZIP_LEVEL = 1
+
+# window bits which tell zlib to read or write the gzip format
+_GZIP_WBITS = 16 + zlib.MAX_WBITS
+
+
+def gzip_chunks(chunks, level=DEFAULT_GZIP_LEVEL):
+    """ Generator to yield the gzip compressed form of the given iterable of byte chunks. """
+    compressor = zlib.compressobj(level, zlib.DEFLATED, _GZIP_WBITS)
+    for chunk in chunks:
+        out = compressor.compress(chunk)
+        if (out):
+            yield out
+    yield compressor.flush()
+
+
+def gunzip_chunks(chunks):
+    """ Generator to yield the decompressed form of the given iterable of gzipped byte chunks,
+        which may hold several concatenated gzip members.
+    """
+    decompressor = zlib.decompressobj(_GZIP_WBITS)
+    for chunk in chunks:
+        while (chunk):
+            out = decompressor.decompress(chunk)
+            if (out):
+                yield out
+            chunk = b""
+            if (decompressor.eof):          # start of the next member, if any
+                chunk = decompressor.unused_data
+                decompressor = zlib.decompressobj(_GZIP_WBITS)
+    if (not decompressor.eof):
+        out = decompressor.flush()
+        if (out):
+            yield out
+
+
+# dictionary of the available transcodings, mapping their names to their chunk transformers
+TRANSCODERS = {
+    "gzip": gzip_chunks,
+    "gunzip": gunzip_chunks
+}
+
+
+def transcoder_for(file_path, options):
+    """ Return the chunk transformer for the transcoding set by the options, if it applies
+        to the given file (only files which are not gzipped are gzipped, and vice versa),
+        else return None.
+    """
+    mode = options.get("transcode")
+    if ((mode == "gzip") and (not is_gzipped(file_path))):
+        return gzip_chunks
+    if ((mode == "gunzip") and is_gzipped(file_path)):
+        return gunzip_chunks
+    return None
+
+
+def transcoded_path(file_path, options):
+    """ Return the given path renamed for the transcoding set by the options, if it applies
+        to the file: with a gzip extension added when gzipping, or removed when gunzipping.
+    """
+    transcoder = transcoder_for(file_path, options)
+    if (transcoder is gzip_chunks):
+        return file_path + GZIP_EXTENSION
+    if (transcoder is gunzip_chunks):
+        return file_path[:-len(GZIP_EXTENSION)]
+    return file_path
+
+
+def is_gzipped(file_path):
+    """ Tell whether the given file is gzipped, judging by its name. """
+    return str(file_path).endswith(GZIP_EXTENSION)
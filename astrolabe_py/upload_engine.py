@@ -0,0 +1,256 @@
+"""
+Class to run file uploads concurrently on several worker threads, each with its own iRods session.
+  Last Modified: Report the decisions of the concurrency tuner in verbose mode.
+"""
+import collections
+import logging
+import multiprocessing
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+logging.basicConfig(level=logging.ERROR)    # default logging configuration
+
+# sentinel placed on the work queue to tell a worker to stop
+_STOP = None
+
+# default number of completed uploads over which the concurrency tuner measures performance
+DEFAULT_TUNING_WINDOW = 8
+
+
+class ConcurrencyTuner:
+    """ Class to tune a concurrency limit by additive-increase, multiplicative-decrease (AIMD),
+        from the latency and throughput measured over successive windows of completed operations.
+    """
+
+    def __init__(self, min_limit, max_limit, window=DEFAULT_TUNING_WINDOW,
+                 latency_factor=2.0, decrease_factor=0.5, clock=time.monotonic, verbose=False):
+        """ Create a tuner whose limit starts at, and stays no lower than, the given minimum
+            and rises no higher than the given maximum. After each window of the given number
+            of operations, the limit is cut by the decrease factor if any operation failed,
+            if the mean latency exceeds the best mean latency seen by the latency factor, or if
+            throughput fell after the last increase; otherwise the limit is raised by one.
+            If verbose is True, each change of the limit is printed, with its reason.
+        """
+        self._min_limit = max(1, min_limit)
+        self._max_limit = max(self._min_limit, max_limit)
+        self._window = max(1, window)
+        self._latency_factor = latency_factor
+        self._decrease_factor = decrease_factor
+        self._clock = clock
+        self._verbose = verbose
+        self._limit = self._min_limit
+        self._best_latency = None           # lowest mean latency of any window
+        self._last_throughput = None        # throughput of the previous window
+        self._last_increased = False        # whether the limit was raised after the previous window
+        self._reset_window()
+
+    def limit(self):
+        """ Return the current concurrency limit. """
+        return self._limit
+
+    def record(self, latency, nbytes, ok=True):
+        """ Record a completed operation, with its latency in seconds and number of bytes, and
+            adjust the limit at the end of a window. Returns the (possibly new) limit.
+        """
+        self._count += 1
+        self._latency_sum += latency
+        self._bytes += nbytes
+        self._failed = self._failed or (not ok)
+        if (self._count >= self._window):
+            self._adjust()
+        return self._limit
+
+    def _adjust(self):
+        """ Adjust the limit from the measurements of the window just completed. """
+        elapsed = max(self._clock() - self._window_start, 1e-9)
+        throughput = self._bytes / elapsed
+        latency = self._latency_sum / self._count
+        if ((self._best_latency is None) or (latency < self._best_latency)):
+            self._best_latency = latency
+
+        if (self._failed):
+            reason = "failures"
+        elif (latency > (self._latency_factor * self._best_latency)):
+            reason = "latency {:.3f}s over best {:.3f}s".format(latency, self._best_latency)
+        elif (self._last_increased and (throughput < self._last_throughput)):
+            reason = "throughput fell to {:.0f} B/s from {:.0f} B/s".format(
+                throughput, self._last_throughput)
+        else:
+            reason = None
+
+        old_limit = self._limit
+        if (reason):
+            self._limit = max(self._min_limit, int(self._limit * self._decrease_factor))
+            self._last_increased = False
+        else:
+            self._limit = min(self._max_limit, self._limit + 1)
+            self._last_increased = (self._limit > old_limit)
+            reason = "latency {:.3f}s, throughput {:.0f} B/s".format(latency, throughput)
+        if (self._verbose and (self._limit != old_limit)):
+            print("Concurrency {} -> {}: {}".format(old_limit, self._limit, reason))
+        self._last_throughput = throughput
+        self._reset_window()
+
+    def _reset_window(self):
+        """ Start a new measurement window. """
+        self._count = 0
+        self._latency_sum = 0.0
+        self._bytes = 0
+        self._failed = False
+        self._window_start = self._clock()
+
+
+class UploadEngine:
+    """ Class to run file uploads concurrently on several worker threads, optionally fed by
+        a CPU-bound preparation stage (e.g. metadata extraction) running in a process pool.
+    """
+
+    def __init__(self, file_fn, helper_fn, options={}, jobs=1, prepare_fn=None, prepare_jobs=0,
+                 adaptive=False, min_jobs=1):
+        """ Create an engine which calls the given file function, as
+            file_fn(ihelper, source_file, to_path, options), for each file to be uploaded.
+            Each of the given number of worker threads gets its own iRods helper, created
+            by calling the given helper function.
+            If a (picklable) preparation function is given, it is first called, as
+            prepare_fn(source_file, options), for each file in a pool of the given number of
+            processes, and its result is passed to the file function as an extra argument.
+            If adaptive is True, the number of files uploaded at once is tuned automatically,
+            between the given minimum and the number of workers.
+        """
+        self._file_fn = file_fn
+        self._helper_fn = helper_fn
+        self._options = options
+        self._jobs = max(1, jobs)
+        self._prepare_fn = prepare_fn
+        self._prepare_jobs = max(1, prepare_jobs)
+        self._queue = queue.Queue(maxsize=(2 * self._jobs)) # bounded: feeder blocks when full
+        self._error = None                  # first exception raised by any worker
+        self._lock = threading.Lock()
+        self._tuner = (ConcurrencyTuner(min_jobs, self._jobs, verbose=options.get("verbose", False))
+                       if adaptive else None)
+        self._gate = threading.Condition()  # admits no more active uploads than the tuned limit
+        self._active = 0                    # number of uploads currently admitted by the gate
+
+    def run(self, pairs):
+        """ Upload the files given by the list of (source file, target path) pairs.
+            Returns a list of the results of the file function, in the same order as the pairs.
+            If the file function raises an exception, no further files are started and the
+            first exception is re-raised once the workers have finished.
+        """
+        results = [False] * len(pairs)
+        workers = [threading.Thread(target=self._worker, args=(results,), daemon=True)
+                   for _ in range(min(self._jobs, len(pairs)))]
+        for worker in workers:
+            worker.start()
+
+        if (self._prepare_fn):
+            self._feed_prepared(pairs)
+        else:
+            for idx, pair in enumerate(pairs):
+                if (self._error):           # stop feeding work after any failure
+                    break
+                self._queue.put((idx, pair[0], pair[1], ())) # blocks while the queue is full
+
+        for worker in workers:
+            self._queue.put(_STOP)
+        for worker in workers:
+            worker.join()
+
+        if (self._error):
+            raise self._error
+        return results
+
+    def _feed_prepared(self, pairs):
+        """ Run the preparation function for each pair in the process pool and feed the
+            prepared work items to the upload workers, in order. At most a bounded number of
+            preparations are in flight, so a slow upload stage throttles the preparation stage.
+        """
+        max_pending = 2 * (self._prepare_jobs + self._jobs)
+        context = multiprocessing.get_context("spawn") # do not fork the worker threads' sessions
+        with ProcessPoolExecutor(max_workers=self._prepare_jobs, mp_context=context) as pool:
+            pending = collections.deque()
+            for idx, pair in enumerate(pairs):
+                if (self._error):           # stop preparing work after any failure
+                    break
+                pending.append((idx, pair, pool.submit(self._prepare_fn, pair[0], self._options)))
+                if (len(pending) >= max_pending):
+                    self._feed_one(*pending.popleft())
+            while (pending):
+                if (self._error):
+                    pending.popleft()[2].cancel()
+                else:
+                    self._feed_one(*pending.popleft())
+
+    def _admit(self):
+        """ Wait until the gate admits another active upload, within the tuned limit. """
+        with self._gate:
+            while (self._tuner and (self._active >= self._tuner.limit())):
+                self._gate.wait()
+            self._active += 1
+
+    def _feed_one(self, idx, pair, future):
+        """ Wait for the given preparation to finish, then queue its work item for upload. """
+        try:
+            prepared = future.result()
+        except Exception as ex:
+            self._set_error(ex)
+            return
+        self._queue.put((idx, pair[0], pair[1], (prepared,))) # blocks while the queue is full
+
+    def _measure(self, source_file, latency, result):
+        """ Record the latency and size of a completed upload with the concurrency tuner. """
+        if (self._tuner):
+            try:
+                nbytes = os.path.getsize(source_file)
+            except OSError:
+                nbytes = 0
+            with self._gate:
+                self._tuner.record(latency, nbytes, ok=bool(result))
+                self._gate.notify_all()     # the limit may have risen
+
+    def _release(self):
+        """ Release an active upload from the gate, letting a waiting worker in. """
+        with self._gate:
+            self._active -= 1
+            self._gate.notify_all()
+
+    def _set_error(self, ex):
+        """ Record the given exception, if it is the first one raised by any worker. """
+        with self._lock:
+            if (self._error is None):
+                logging.error("(UploadEngine): {}".format(ex))
+                self._error = ex
+
+    def _worker(self, results):
+        """ Process work items from the queue, using this worker's own iRods helper, until told
+            to stop. After any failure, work items are drained from the queue but not processed.
+        """
+        ihelper = None
+        try:
+            ihelper = self._helper_fn()
+        except Exception as ex:
+            self._set_error(ex)
+
+        while True:
+            self._admit()
+            try:
+                item = self._queue.get()
+                if (item is _STOP):
+                    break
+                if (self._error is None):
+                    idx, source_file, to_path, prepared = item
+                    start = time.monotonic()
+                    try:
+                        results[idx] = self._file_fn(ihelper, source_file, to_path, self._options,
+                                                     *prepared)
+                    except Exception as ex:
+                        self._set_error(ex)
+                    self._measure(source_file, time.monotonic() - start, results[idx])
+            finally:
+                self._release()
+
+        if (ihelper):
+            ihelper.cleanup()
@@ -1,77 +1,192 @@
 #
 # Module to extract metadata and upload one or more FITS files to iRods.
 #   Written by: Tom Hicks. 7/19/2018.
-#   Last Modified: Maintain return of same truth vector as previous version.
+#   Last Modified: Take every iRods session from one pool, checked out by workers per file.
 #
 import os
 import sys
+import time
+import random
+import socket
 import logging
 import fnmatch
+from concurrent.futures import ThreadPoolExecutor
+from irods.exception import (CAT_CONNECT_ERR, NetworkException, SYS_HEADER_READ_LEN_ERR,
+                             SYS_HEADER_WRITE_LEN_ERR, SYS_SOCK_OPEN_ERR)
 
 import astrolabe_py.fits_ops as fo
 import astrolabe_py.irods_help as ih
+import astrolabe_py.transcode as tc
 import astrolabe_py.utils as utils
+from astrolabe_py.header_capture import HeaderCapture
+from astrolabe_py.journal import UploadJournal
+from astrolabe_py.progress import ProgressTracker
+from astrolabe_py.session_pool import SessionPool
+from astrolabe_py.upload_engine import UploadEngine
 
 logging.basicConfig(level=logging.INFO)     # default logging configuration
 
 _ASTROLABE_ROOT_DIR = "astrolabe"
 
-def execute(options):
+# default settings for sending large files over several parallel transfer streams
+_DEFAULT_PARALLEL_THRESHOLD = 32 * 1024**2 # files larger than this are sent in parallel streams
+_DEFAULT_TRANSFER_THREADS = 4               # maximum number of parallel streams per file
+_DEFAULT_CHUNK_SIZE = 64 * 1024**2          # minimum number of bytes sent by each stream
+
+# default settings for retrying failed iRods operations
+_DEFAULT_RETRIES = 3                        # number of retries after the first attempt
+_DEFAULT_RETRY_DELAY = 1.0                  # base delay before the first retry, in seconds
+_MAX_RETRY_DELAY = 60.0                     # maximum delay before any retry, in seconds
+
+# dictionary of scheduling policies for the order of uploads, mapping each policy name to a
+# function returning a sort key for a (source file, target path) pair and the size of its file,
+# or to None, for the order in which the files were found
+SCHEDULES = {
+    "walk": None,                           # order of discovery
+    "largest": lambda pair, size: -size,    # largest first: shortest total run time
+    "smallest": lambda pair, size: size,    # smallest first: most files done early
+    "locality": lambda pair, size: os.path.split(pair[0]) # files of a directory together
+}
+
+# errors of the connection to iRods, which retrying an iRods operation may cure
+_RETRYABLE_ERRORS = (ConnectionError, socket.timeout, NetworkException, SYS_SOCK_OPEN_ERR,
+                     SYS_HEADER_READ_LEN_ERR, SYS_HEADER_WRITE_LEN_ERR, CAT_CONNECT_ERR)
+
+# default file for the journal of completed uploads
+_DEFAULT_JOURNAL_FILE = "upload-journal.jsonl"
+
+def execute(options, progress_fn=None):
     """ Process the specified file(s) according to the other given arguments.
         This module operates on one or more FITS files to extract metadata,
         uploads the files to iRods, and attach the metadata to the files.
+        If a progress function is given, it is called with each progress event (a dictionary).
     """
-    # create connection to iRods
-    ihelper = ih.IrodsHelper()
-    ensure_astrolabe_root(ihelper)          # create/use astrolabe directory, as needed
-
-    # get the desired subset of metadata keys, if any specified by a keyfile
-    md_keys = utils.get_metadata_keys(options)
-    if (md_keys):
-        options["keys_subset"] = md_keys
-
-    # execute action for a single file or a directory of files
-    images_path = options.get("images_path")
-    if (utils.path_has_dots(images_path)):
-        print("Error: Images path argument must be asbolute; it may not contain '..' or '.'")
-        sys.exit(10)
-
-    if (os.path.isfile(images_path)):
-        to_path = options.get("to_path")    # allow for future expansion
-        if (not to_path):
-            to_path = os.path.basename(images_path)
-        return [ do_file(ihelper, images_path, to_path, options) ]
-    else:
-        if (os.path.isdir(images_path)):
-            return do_tree(ihelper, images_path, options)
-        else:
-            print("Error: Specified images path '{}' is not a file or directory".format(images_path))
-            sys.exit(11)
-
-
-def do_file(ihelper, source_file, to_path, options):
+    # create connection to iRods, from a pool of sessions shared with any concurrent workers
+    max_sessions = options.get("max_sessions") or options.get("jobs", 1) or 1
+    with SessionPool(ih.IrodsHelper.new_session, max_sessions=max_sessions) as pool:
+        with ih.IrodsHelper(pool=pool) as ihelper:
+            ensure_astrolabe_root(ihelper)  # create/use astrolabe directory, as needed
+
+            # get the desired subset of metadata keys, if any specified by a keyfile
+            md_keys = utils.get_metadata_keys(options)
+            if (md_keys):
+                options["keys_subset"] = md_keys
+
+            # execute action for a single file or a directory of files
+            images_path = options.get("images_path")
+            if (utils.path_has_dots(images_path)):
+                print("Error: Images path argument must be asbolute; it may not contain '..' or '.'")
+                sys.exit(10)
+
+            if (os.path.isfile(images_path)):
+                to_path = options.get("to_path") # allow for future expansion
+                if (not to_path):
+                    to_path = tc.transcoded_path(os.path.basename(images_path), options)
+                return upload_pairs(ihelper, [(images_path, to_path)], options, progress_fn)
+            else:
+                if (os.path.isdir(images_path)):
+                    return do_tree(ihelper, images_path, options, progress_fn)
+                else:
+                    print("Error: Specified images path '{}' is not a file or directory".format(images_path))
+                    sys.exit(11)
+
+
+def do_file(ihelper, source_file, to_path, options, metadata=None, progress=None):
     """ Do metadata extraction, file upload, and metadata attachment for the given file,
         depending on the settings of the various arguments in the given 'options' dictionary.
+        If the metadata for the file has already been extracted, by an earlier pipeline stage,
+        it is given by the 'metadata' argument and is not extracted again. Otherwise, the
+        header of the file is captured as it is uploaded, so the file is read only once.
+        If a transcoding is requested, the file is compressed or decompressed as it is uploaded.
+        In metadata-only mode, the file is not uploaded: its metadata is extracted and attached
+        to the already uploaded file, unless that file's metadata already matches.
+        The iRods operations are retried, as set by the options, if they fail. If a progress
+        tracker is given, the durations of the phases and the number of retries are reported
+        to it. Returns True if the file was processed, or False if it failed even so.
     """
     verbose = options.get("verbose", False)
-    upload_only = options.get("upload_only", False)
-
-    if (verbose):
-        print("Uploading file {} to {}".format(source_file, to_path))
-    ihelper.put_file(source_file, to_path, absolute=True)
-
-    if ((not upload_only) and has_metadata(source_file)):
-        if (verbose):
-            print("Extracting metadata from file {}".format(source_file))
-        metadata = fo.fits_metadata(source_file, options)
-        if (verbose):
-            print("Attaching metadata to file {}".format(to_path))
+    report = options.get("report", False)
+    metadata_only = options.get("metadata_only", False)
+
+    capture = None
+    if ((metadata is None) and (not metadata_only) and metadata_wanted(source_file, options)):
+        capture = HeaderCapture(gzipped=source_file.endswith(".gz"))
+
+    phases = {}                             # durations of the phases of processing this file
+    counts = { "operations": 0, "attempts": 0 } # iRods operations and attempts at them
+
+    def put_file():
+        counts["attempts"] += 1
+        if (capture):
+            capture.reset()                 # a retry streams the file again
+        ihelper.put_file(source_file, to_path, absolute=True, checksum=options.get("sync", False),
+                         num_threads=transfer_threads(os.path.getsize(source_file), options),
+                         tee=capture, transform=tc.transcoder_for(source_file, options))
+
+    def put_metaf():
+        counts["attempts"] += 1
         ihelper.put_metaf(metadata, to_path)
 
-    return True
+    def get_metaf():
+        counts["attempts"] += 1
+        return ihelper.get_metaf(to_path)
+
+    ok = True
+    action = "Uploaded to"
+    try:
+        if (not metadata_only):
+            if (verbose):
+                print("Uploading file {} to {}".format(source_file, to_path))
+            start = time.monotonic()
+            counts["operations"] += 1
+            retry_call(ihelper, options, put_file)
+            phases["put"] = time.monotonic() - start
+
+        if (metadata is None):
+            start = time.monotonic()
+            metadata = extract_metadata(source_file, options,
+                                        capture.header_bytes() if capture else None)
+            if (metadata is not None):
+                phases["extract"] = time.monotonic() - start
+        if (metadata is not None):
+            start = time.monotonic()
+            if (metadata_only):
+                counts["operations"] += 1
+                action = "Metadata updated at"
+                if (metadata_matches(retry_call(ihelper, options, get_metaf), metadata)):
+                    action = "Metadata unchanged at"
+            if (action != "Metadata unchanged at"):
+                if (verbose):
+                    print("Attaching metadata to file {}".format(to_path))
+                counts["operations"] += 1
+                retry_call(ihelper, options, put_metaf)
+            phases["attach"] = time.monotonic() - start
+    except Exception as ex:
+        logging.error("(do_file): failed to upload file {} to {}: {}".format(source_file, to_path, ex))
+        ok = False
+
+    if (progress):
+        try:
+            nbytes = os.path.getsize(source_file)
+        except OSError:                     # the file may have vanished: that failed the upload
+            nbytes = 0
+        progress.file_done(source_file, to_path, nbytes, phases,
+                           retries=(counts["attempts"] - counts["operations"]), ok=ok)
+    if (ok and report):
+        print("Filename: {}\n{}: {}".format(source_file, action, to_path))
+    return ok
+
+
+def backoff_delay(attempt, options):
+    """ Return the delay, in seconds, before the given retry (numbered from 0): a random delay
+        ("full jitter") of up to the base retry delay doubled for each earlier retry, capped.
+    """
+    base = options.get("retry_delay")
+    base = _DEFAULT_RETRY_DELAY if (base is None) else base
+    return random.uniform(0, min(_MAX_RETRY_DELAY, base * (2 ** attempt)))
 
 
-def do_tree(ihelper, root_node, options):
+def do_tree(ihelper, root_node, options, progress_fn=None):
     """ Walk the local filesystem tree from the given root_node and process any FITS files.
         The walk creates a parallel tree in the iRods Astrolabe area and calls do_file to
         upload the files (and possibly their metadata) to the corresponding iRods directories.
@@ -84,33 +199,74 @@ def do_tree(ihelper, root_node, options):
     # remove the root path prefix from the upload files
     suffix_paths = make_suffix_paths(root_path, source_paths, options)
 
-    # make a list of directories to be created in iRods and create them
+    # make a list of directories needed in iRods and create any which are missing
     dir_paths = make_dir_paths(suffix_paths, options)
-    for adir in dir_paths:
-        ihelper.mkdir(adir, absolute=True)  # make corresponding iRods directory
+    if (not options.get("metadata_only", False)): # files, and so directories, already exist
+        ihelper.ensure_dirs(dir_paths, absolute=True, jobs=options.get("jobs", 1) or 1)
 
     # make a list of user-home-relative target file paths
     target_paths = make_target_paths(suffix_paths, options)
 
     # pair up the local source file paths and the iRods target file paths, then upload the files
-    return [ do_file(ihelper, pair[0], pair[1], options) for pair in zip(source_paths, target_paths) ]
+    return upload_pairs(ihelper, list(zip(source_paths, target_paths)), options, progress_fn)
 
 
 def ensure_astrolabe_root(ihelper):
     """ Ensure that the Astrolabe root directory exists and set it as the user's root directory. """
     ihelper.set_root()                      # reset root to user iRod root dir
     ihelper.cd_root()                       # set cwd to user iRod root dir
-    ihelper.mkdir(_ASTROLABE_ROOT_DIR)      # make the Astrolabe directory
+    ihelper.ensure_dirs([_ASTROLABE_ROOT_DIR]) # make the Astrolabe directory, if missing
     ihelper.set_root(top_dir=_ASTROLABE_ROOT_DIR) # reset root to Astrolabe dir
 
 
+def extract_metadata(source_file, options, header_bytes=None):
+    """ Return the metadata extracted from the given file, or from the already captured bytes
+        of its header, if given, or None, if the file has no metadata or metadata processing
+        is not wanted.
+    """
+    if (not metadata_wanted(source_file, options)):
+        return None
+    if (options.get("verbose", False)):
+        print("Extracting metadata from file {}".format(source_file))
+    return fo.fits_metadata(source_file, options, header_bytes)
+
+
+def find_unchanged(ihelper, pairs, options):
+    """ Return the set of indices of the given (local source file, iRods target path) pairs
+        whose target file already exists in iRods with the same size and checksum as the
+        source file. The remote sizes and stored checksums are fetched by a single query and
+        the local checksums, of files with matching sizes, are computed concurrently.
+    """
+    if (not pairs):
+        return set()
+    top_dir = os.path.commonpath([os.path.dirname(pair[1]) for pair in pairs])
+    stats = ihelper.get_file_stats(top_dir, absolute=True)
+
+    candidates = []                         # (index, remote checksum) of same size files
+    for idx, (source_file, to_path) in enumerate(pairs):
+        stat = stats.get(ihelper.abs_path(to_path))
+        if (stat and (stat[1] is not None) and (stat[0] == os.path.getsize(source_file))):
+            candidates.append((idx, stat[1]))
+
+    with ThreadPoolExecutor() as pool:
+        checksums = pool.map(lambda cand: utils.file_checksum(pairs[cand[0]][0], like=cand[1]),
+                             candidates)
+        return { cand[0] for cand, checksum in zip(candidates, checksums)
+                 if (checksum == cand[1]) }
+
+
 def get_source_paths(root_path, options):
-    """Walk the given root path, returning a list of paths for files to be uploaded."""
+    """Walk the given root path, returning a list of paths for files to be uploaded.
+       If a shard is specified, only the paths belonging to that shard are returned.
+    """
+    shard = options.get("shard")
     results = []
     for root, dirs, files in os.walk(root_path):
         for afile in files:                 # for files at this level
             if (isa_desired_file(afile)):   # if a file is to be uploaded
-                results.append(os.path.join(root, afile)) # local source path
+                source_path = os.path.join(root, afile) # local source path
+                if (utils.in_shard(os.path.relpath(source_path, root_path), shard)):
+                    results.append(source_path)
     return results
 
 
@@ -130,6 +286,25 @@ def make_dir_paths(file_paths, options):
     return sorted({os.path.split(path)[0] for path in file_paths}, reverse=True)
 
 
+def make_file_fn(journal=None, progress=None):
+    """ Return a version of the do_file function which reports to the given progress tracker,
+        if any, and records each completed upload in the given journal, if any.
+    """
+    def file_fn(ihelper, source_file, to_path, options, metadata=None):
+        stat = None
+        if (journal is not None):           # the file as uploaded, not as it may be afterward
+            try:
+                stat = os.stat(source_file)
+            except OSError:                 # the file has vanished: its upload will fail
+                pass
+        result = do_file(ihelper, source_file, to_path, options, metadata, progress)
+        if (result and stat):
+            journal.record(source_file, to_path, metadata_wanted(source_file, options),
+                           size=stat.st_size, mtime=stat.st_mtime)
+        return result
+    return file_fn
+
+
 def make_suffix_paths(root_path, source_paths, options):
     """Remove the given root path from each of the paths in the given source path list."""
     source_prefix = os.path.split(root_path)[0] # find local path prefix preceding root node
@@ -138,6 +313,225 @@ def make_suffix_paths(root_path, source_paths, options):
 
 
 def make_target_paths(suffix_paths, options, irods_prefix=_ASTROLABE_ROOT_DIR):
-    """Return a list of user-home-relative iRods paths for the given list of local file paths."""
-    return suffix_paths                     # currently a NOP
+    """Return a list of user-home-relative iRods paths for the given list of local file paths,
+       renamed for any requested transcoding.
+    """
+    return [tc.transcoded_path(path, options) for path in suffix_paths]
     # return [os.path.join(irods_prefix, afile) for afile in suffix_paths]
+
+
+def make_pooled_fn(file_fn):
+    """ Return a version of the given file function which attaches its iRods helper to a
+        session of the helper's pool only while it processes a file, so that idle workers
+        hold no session and no more workers upload at once than the pool has sessions.
+    """
+    def pooled_fn(ihelper, *args, **kwargs):
+        ihelper.attach()
+        try:
+            return file_fn(ihelper, *args, **kwargs)
+        finally:
+            ihelper.detach()
+    return pooled_fn
+
+
+def make_worker_helper(pool=None):
+    """ Create and return a new iRods helper for a worker, rooted at the Astrolabe directory.
+        If a session pool is given, the helper checks out a session from the pool only while
+        it is in use (see make_pooled_fn), so it is returned detached.
+    """
+    ihelper = ih.IrodsHelper(pool=pool)
+    ihelper.set_root(top_dir=_ASTROLABE_ROOT_DIR) # Astrolabe dir already ensured by execute
+    ihelper.detach()
+    return ihelper
+
+
+def metadata_matches(current, metadata):
+    """ Tell whether the given current metadata of an iRods file already holds exactly the
+        given metadata items, as attached: for each key, the same set of (string) values.
+    """
+    def values_by_key(items, keys):
+        values = {}
+        for item in items:
+            if (item.keyword in keys):
+                values.setdefault(item.keyword, set()).add(str(item.value))
+        return values
+    keys = set([item.keyword for item in metadata])
+    return (values_by_key(current, keys) == values_by_key(metadata, keys))
+
+
+def metadata_wanted(source_file, options):
+    """ Return true if metadata is to be extracted from the given file and attached to it. """
+    return ((not options.get("upload_only", False)) and has_metadata(source_file))
+
+
+def open_journal(options):
+    """ Return an open journal of completed uploads, if journaling or resuming is requested,
+        else return None.
+    """
+    journal_path = options.get("journal")
+    if ((not journal_path) and options.get("resume", False)):
+        journal_path = _DEFAULT_JOURNAL_FILE
+    return UploadJournal(journal_path) if journal_path else None
+
+
+def open_progress(pairs, todo, options, progress_fn=None):
+    """ Return a progress tracker for uploading the pairs with the given indices, if progress
+        events, a progress display, or a progress function are requested, else return None.
+    """
+    events_path = options.get("events")
+    display = sys.stderr if options.get("progress", False) else None
+    if (not (events_path or display or progress_fn)):
+        return None
+    total_bytes = sum([os.path.getsize(pairs[idx][0]) for idx in todo])
+    return ProgressTracker(len(todo), total_bytes, events_path=events_path,
+                           callback=progress_fn, display=display)
+
+
+def report_failures(pairs, results, options):
+    """ Report the (source file, target path) pairs which failed to upload, as a dead-letter
+        list, and write their source files to the dead-letter file, if one is specified.
+    """
+    failed = [pair for pair, result in zip(pairs, results) if (not result)]
+    if (failed):
+        print("Failed to upload {} files:".format(len(failed)))
+        for source_file, to_path in failed:
+            print("  {} -> {}".format(source_file, to_path))
+    dead_letter_path = options.get("dead_letter")
+    if (dead_letter_path):
+        with open(dead_letter_path, "w") as dead_letters:
+            for source_file, to_path in failed:
+                dead_letters.write("{}\n".format(source_file))
+
+
+def retry_call(ihelper, options, fn, *args, **kwargs):
+    """ Call the given iRods operation with the given arguments, and return its result.
+        If it fails because of the connection to iRods, re-establish the session of the given
+        iRods helper and retry it, after an exponential backoff, up to the number of retries
+        set by the options. Any other failure, or the last one, is re-raised.
+    """
+    verbose = options.get("verbose", False)
+    retries = options.get("retries")
+    retries = _DEFAULT_RETRIES if (retries is None) else retries
+    for attempt in range(retries + 1):
+        try:
+            return fn(*args, **kwargs)
+        except _RETRYABLE_ERRORS as ex:
+            if (attempt >= retries):
+                raise
+            delay = backoff_delay(attempt, options)
+            if (verbose):
+                print("Retrying {} in {:.1f} seconds, after failure: {}".format(
+                    getattr(fn, "__name__", "operation"), delay, ex))
+            time.sleep(delay)
+            try:
+                ihelper.reconnect()
+            except Exception as rex:        # the next attempt will fail, and be retried, too
+                if (verbose):
+                    print("Failed to reconnect to iRods: {}".format(rex))
+
+
+def schedule_todo(pairs, todo, options):
+    """ Return the given list of indices of pairs to be uploaded, reordered by the scheduling
+        policy set by the options. Sizes are collected only for the files to be uploaded.
+        Ties keep the order in which the files were found.
+    """
+    key_fn = SCHEDULES.get(options.get("schedule") or "walk")
+    if (key_fn is None):
+        return todo
+    keys = { idx: key_fn(pairs[idx], os.path.getsize(pairs[idx][0])) for idx in todo }
+    return sorted(todo, key=lambda idx: keys[idx])
+
+
+def sync_todo(ihelper, pairs, todo, options):
+    """ Return the given list of indices of pairs to be uploaded, less the indices of any
+        pairs whose target file is unchanged in iRods. The skipped files are reported.
+    """
+    unchanged = find_unchanged(ihelper, [pairs[idx] for idx in todo], options)
+    print("Sync: skipping {} unchanged files, uploading {} new or changed files".format(
+        len(unchanged), len(todo) - len(unchanged)))
+    if (options.get("verbose", False) or options.get("report", False)):
+        for pos in sorted(unchanged):
+            source_file, to_path = pairs[todo[pos]]
+            print("Filename: {}\nUnchanged at: {}".format(source_file, to_path))
+    return [idx for pos, idx in enumerate(todo) if (pos not in unchanged)]
+
+
+def transfer_threads(file_size, options):
+    """ Return the number of parallel streams over which to send a file of the given size:
+        a single stream for files no larger than the parallel threshold, else enough streams
+        for each to send at least one chunk, up to the maximum number of transfer threads.
+    """
+    threshold = options.get("parallel_threshold") or _DEFAULT_PARALLEL_THRESHOLD
+    max_threads = options.get("transfer_threads") or _DEFAULT_TRANSFER_THREADS
+    chunk_size = options.get("chunk_size") or _DEFAULT_CHUNK_SIZE
+    if (file_size <= threshold):
+        return 1
+    return max(1, min(max_threads, -(-file_size // chunk_size))) # ceiling of chunks in file
+
+
+def upload_pairs(ihelper, pairs, options, progress_fn=None):
+    """ Upload the files given by the list of (local source file, iRods target path) pairs,
+        on several concurrent workers if requested. If a journal is requested, completed
+        uploads are recorded in it and, when resuming, uploads already recorded in it are
+        skipped. In sync mode, files which are unchanged in iRods are skipped. The rest are
+        uploaded in the order of the requested scheduling policy. If progress tracking is
+        requested, or a progress function is given, progress events are emitted for each file
+        and a summary at the end. Files which fail to upload are reported at the end.
+        Returns a list of truth values, in the same order as the pairs.
+    """
+    journal = open_journal(options)
+    progress = None
+    try:
+        todo = list(range(len(pairs)))
+        if ((journal is not None) and options.get("resume", False)):
+            todo = [idx for idx in todo
+                    if (not journal.is_done(pairs[idx][0], pairs[idx][1],
+                                            metadata_wanted(pairs[idx][0], options)))]
+            if (options.get("verbose", False)):
+                print("Resuming: skipping {} files already uploaded, according to journal {}".format(
+                    len(pairs) - len(todo), journal.journal_path()))
+        if (options.get("sync", False)):   # skip files already in iRods and unchanged
+            todo = sync_todo(ihelper, pairs, todo, options)
+        todo = schedule_todo(pairs, todo, options)
+        progress = open_progress(pairs, todo, options, progress_fn)
+        file_fn = make_file_fn(journal, progress)
+
+        results = [True] * len(pairs)       # skipped files were uploaded successfully
+        todo_pairs = [pairs[idx] for idx in todo]
+        jobs = options.get("jobs", 1) or 1
+        extract_jobs = options.get("extract_jobs", 0) or 0
+        if ((jobs > 1) or (extract_jobs > 0)): # upload on workers, sharing a pool of sessions
+            pool = ihelper.session_pool()
+            own_pool = (pool is None)
+            if (own_pool):
+                pool = SessionPool(ih.IrodsHelper.new_session,
+                                   max_sessions=(options.get("max_sessions") or jobs))
+            ihelper.detach()                # leave the sessions of the pool to the workers
+            try:
+                engine = UploadEngine(make_pooled_fn(file_fn), lambda: make_worker_helper(pool),
+                                      options, jobs,
+                                      prepare_fn=(extract_metadata if (extract_jobs > 0) else None),
+                                      prepare_jobs=extract_jobs,
+                                      adaptive=options.get("adaptive", False),
+                                      min_jobs=options.get("min_jobs", 1) or 1)
+                todo_results = engine.run(todo_pairs)
+            finally:
+                ihelper.attach()
+                if (own_pool):
+                    pool.close()
+        else:
+            todo_results = [ file_fn(ihelper, pair[0], pair[1], options) for pair in todo_pairs ]
+        for idx, result in zip(todo, todo_results):
+            results[idx] = result
+        if (progress):
+            summary = progress.finish()
+            if (options.get("progress", False) or options.get("verbose", False)):
+                for line in progress.summary_lines(summary):
+                    print(line)
+        report_failures(pairs, results, options)
+        return results
+    finally:
+        if (journal is not None):
+            journal.close()
+        if (progress):
+            progress.close()
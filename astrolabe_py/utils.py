@@ -1,9 +1,11 @@
 #
 # Module to provide general utility functions for Astrolabe code.
 #   Written by: Tom Hicks. 7/26/2018.
-#   Last Modified: Remove unused, leftover code.
+#   Last Modified: Reject infinite byte sizes.
 #
+import base64
 import fnmatch
+import hashlib
 import os
 import pathlib as pl
 
@@ -14,17 +16,44 @@ _DEFAULT_KEYS_FILE = "metadata-keys.txt"
 _FITS_PAT = "*.fits"
 _GZFITS_PAT = "*.fits.gz"
 
+# prefix of iRods SHA-256 checksums (otherwise iRods checksums are MD5 hex digests)
+_SHA2_PREFIX = "sha2:"
+
+# multipliers for the (binary) unit suffixes of byte sizes
+_SIZE_UNITS = { "": 1, "K": 1024, "M": 1024**2, "G": 1024**3, "T": 1024**4 }
+
+# size of the blocks read when computing a file checksum
+_CHECKSUM_BLOCK_SIZE = 1024 * 1024
+
 def is_fits_file(fyl):
     """ Return True if the given file is FITS file, else False. """
     return (fnmatch.fnmatch(fyl, _FITS_PAT) or fnmatch.fnmatch(fyl, _GZFITS_PAT))
 
-def filter_file_tree(root_dir):
-    """ Generator to yield all FITS files in the file tree under the given root directory. """
+def file_checksum(file_path, like=None):
+    """ Return the checksum of the given local file, in the form iRods stores checksums:
+        a SHA-256 checksum ('sha2:' plus base64 digest) if the given example checksum
+        is one, else an MD5 hex digest.
+    """
+    sha2 = bool(like) and str(like).startswith(_SHA2_PREFIX)
+    hasher = hashlib.sha256() if sha2 else hashlib.md5()
+    with open(file_path, "rb") as fyl:
+        for block in iter(lambda: fyl.read(_CHECKSUM_BLOCK_SIZE), b""):
+            hasher.update(block)
+    if (sha2):
+        return _SHA2_PREFIX + base64.b64encode(hasher.digest()).decode("ascii")
+    else:
+        return hasher.hexdigest()
+
+def filter_file_tree(root_dir, shard=None):
+    """ Generator to yield all FITS files in the file tree under the given root directory.
+        If a shard tuple is given, only the files belonging to that shard are yielded.
+    """
     for root, dirs, files in os.walk(root_dir):
         for fyl in files:
             if (is_fits_file(fyl)):
                 file_path = os.path.join(root, fyl)
-                yield file_path
+                if (in_shard(os.path.relpath(file_path, root_dir), shard)):
+                    yield file_path
 
 def get_metadata_keys(options):
     """ Return a list of metadata keys to be extracted. """
@@ -35,7 +64,46 @@ def get_metadata_keys(options):
     else:
         return None
 
+def parse_size(spec):
+    """ Parse a byte size string, a number with an optional K, M, G, or T (binary) unit suffix,
+        into a number of bytes. Raises ValueError on a bad specification.
+    """
+    text = str(spec).strip().upper()
+    if (text.endswith("B")):                # allow e.g. 64MB as well as 64M
+        text = text[:-1]
+    unit = text[-1:] if (text[-1:] in _SIZE_UNITS) else ""
+    try:
+        size = int(float(text[:len(text)-len(unit)]) * _SIZE_UNITS[unit])
+    except (ValueError, OverflowError):     # not a number, NaN, or infinite
+        raise ValueError("Size must be a number with an optional K, M, G or T suffix, not '{}'".format(spec))
+    if (size < 1):
+        raise ValueError("Size must be positive, not '{}'".format(spec))
+    return size
+
 def path_has_dots(apath):
     """ Tell whether the given path contains '.' or '..' """
     parts = list(pl.PurePath(apath).parts)
     return ((apath == ".") or (".." in parts) or ("." in parts))
+
+def parse_shard(spec):
+    """ Parse a shard specification string of the form 'i/N' into an (i, N) tuple,
+        where shards are numbered from 1 to N. Raises ValueError on a bad specification.
+    """
+    try:
+        index, count = [int(part) for part in str(spec).split("/")]
+    except ValueError:
+        raise ValueError("Shard must be specified as 'i/N', not '{}'".format(spec))
+    if ((count < 1) or (index < 1) or (index > count)):
+        raise ValueError("Shard index must be between 1 and {}, not {}".format(count, index))
+    return (index, count)
+
+def in_shard(rel_path, shard=None):
+    """ Tell whether the given relative path belongs to the given (i, N) shard tuple.
+        The partition is made by a stable hash of the path, so it is the same on every
+        node and on every run. If no shard is given, every path belongs to it.
+    """
+    if (not shard):
+        return True
+    index, count = shard
+    digest = hashlib.md5(pl.PurePath(rel_path).as_posix().encode("utf-8")).digest()
+    return ((int.from_bytes(digest[:8], "big") % count) == (index - 1))
@@ -2,7 +2,7 @@
 #
 # Setup script.
 #   Written by: Tom Hicks. 6/22/2018.
-#   Last Modified: Figure out requires. Redo VERSION reading.
+#   Last Modified: Drop the notes on iRods client features.
 #
 import os
 import re
@@ -39,11 +39,11 @@ setup(
     },
     install_requires=[
         'astropy>=3.0.3',
-        'python-irodsclient>=0.8.1'
+        'python-irodsclient>=1.0.0'
     ],
     python_requires='~=3.6',
     # scripts=scripts,
-    scripts=[ "checker", "uploader" ],
+    scripts=[ "checker", "merger", "uploader" ],
     classifiers=[
         'Development Status :: 1 - Planning',
         'Environment :: Console',
@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+#
+# Python code to unit test the Astrolabe batch derived metadata module.
+#   Written by: agent. 10/19/2026.
+#   Last Modified: Add tests for positions from sexagesimal coordinates.
+#
+import os
+import tempfile
+import unittest
+import numpy as np
+from astropy.io import fits
+
+from context import bo                      # the module under test
+from context import fm
+
+def suite():
+  suite = unittest.TestSuite()
+  suite.addTest(unittest.defaultTestLoader.loadTestsFromTestCase(PositionTestCase))
+  suite.addTest(unittest.defaultTestLoader.loadTestsFromTestCase(TimeTestCase))
+  return suite
+
+
+class BatchOpsTestCase(unittest.TestCase):
+
+  "Base test class"
+  @classmethod
+  def setUpClass(cls):
+    cls.tmpdir = tempfile.TemporaryDirectory()
+
+  @classmethod
+  def tearDownClass(cls):
+    cls.tmpdir.cleanup()
+
+  @classmethod
+  def make_fits(cls, name, cards):
+    "Write a small FITS file with the given header cards and return a FitsMeta for it"
+    file_path = os.path.join(cls.tmpdir.name, name)
+    hdu = fits.PrimaryHDU(np.zeros((2, 2), dtype=np.int16))
+    for key, value in cards.items():
+      hdu.header[key] = value
+    hdu.writeto(file_path, overwrite=True)
+    return fm.FitsMeta(file_path)
+
+
+class PositionTestCase(BatchOpsTestCase):
+
+  def setUp(self):
+    "Initialize the test case"
+    self.fm_icrs = self.make_fits("icrs.fits", { "RA": "12:30:00", "DEC": "-30:15:00",
+                                                 "RADESYS": "ICRS" })
+    self.fm_objct = self.make_fits("objct.fits", { "OBJCTRA": "12 30 00", "OBJCTDEC": "+10 00 00",
+                                                   "RA": "01:00:00", "DEC": "01:00:00",
+                                                   "RADESYS": "ICRS" })
+    self.fm_deg = self.make_fits("deg.fits", { "RA": 187.5, "DEC": 45.0, "RADESYS": "ICRS" })
+    self.fm_fk4 = self.make_fits("fk4.fits", { "RA": "12:30:00", "DEC": "10:00:00",
+                                               "EQUINOX": 1950.0 })
+    self.fm_ctype = self.make_fits("ctype.fits", { "CTYPE1": "RA---TAN", "CRVAL1": 1.0,
+                                                   "RA": "12:30:00", "DEC": "10:00:00" })
+    self.fm_bad = self.make_fits("bad.fits", { "RA": "not an angle", "DEC": "10:00:00" })
+
+  def test_sexagesimal(self):
+    "Sexagesimal RA (in hours) and DEC are converted to degrees"
+    bo.derive_position_metadata([self.fm_icrs])
+    self.assertAlmostEqual(self.fm_icrs.get("right_ascension").value, 187.5)
+    self.assertAlmostEqual(self.fm_icrs.get("declination").value, -30.25)
+
+  def test_objct_preferred(self):
+    "Object coordinates are preferred over telescope coordinates"
+    bo.derive_position_metadata([self.fm_objct])
+    self.assertAlmostEqual(self.fm_objct.get("right_ascension").value, 187.5)
+    self.assertAlmostEqual(self.fm_objct.get("declination").value, 10.0)
+
+  def test_decimal_degrees(self):
+    "Numeric coordinates are taken to be in degrees"
+    bo.derive_position_metadata([self.fm_deg])
+    self.assertAlmostEqual(self.fm_deg.get("right_ascension").value, 187.5)
+    self.assertAlmostEqual(self.fm_deg.get("declination").value, 45.0)
+
+  def test_fk4_precessed(self):
+    "Coordinates in an old equinox are converted to ICRS"
+    bo.derive_position_metadata([self.fm_fk4])
+    ra = self.fm_fk4.get("right_ascension").value
+    dec = self.fm_fk4.get("declination").value
+    self.assertNotAlmostEqual(ra, 187.5, places=2) # precessed by about 0.64 degrees
+    self.assertAlmostEqual(ra, 188.14, places=1)
+    self.assertAlmostEqual(dec, 9.72, places=1)
+
+  def test_ctype_position_kept(self):
+    "Files which already have a position are not changed"
+    fmeta = self.fm_ctype
+    fmeta.add_item("right_ascension", 1.0)
+    md0 = fmeta.metadata()
+    bo.derive_position_metadata([fmeta])
+    self.assertEqual(fmeta.metadata(), md0)
+
+  def test_bad_angle(self):
+    "An unparseable angle gives no position but does not spoil the batch"
+    bo.derive_position_metadata([self.fm_bad, self.fm_icrs])
+    self.assertNotIn("right_ascension", self.fm_bad)
+    self.assertAlmostEqual(self.fm_icrs.get("right_ascension").value, 187.5)
+
+  def test_keys_subset(self):
+    "Derived position keys are added to the keys subset"
+    ksub = [ "NAXIS" ]
+    bo.derive_position_metadata([self.fm_icrs], ksub)
+    self.assertIn("right_ascension", ksub)
+    self.assertIn("declination", ksub)
+
+
+class TimeTestCase(BatchOpsTestCase):
+
+  def setUp(self):
+    "Initialize the test case"
+    self.fm_iso = self.make_fits("iso.fits", { "DATE-OBS": "2010-01-01T00:00:00", "EXPTIME": 60 })
+    self.fm_tt = self.make_fits("tt.fits", { "DATE-OBS": "2010-01-01T00:01:06.184", "TIMESYS": "TT" })
+    self.fm_mjd = self.make_fits("mjd.fits", { "MJD-OBS": 55197.0, "MJD-END": 55197.5 })
+    self.fm_rel = self.make_fits("rel.fits", { "MJDREF": 55197.0, "TIMEUNIT": "s",
+                                               "TSTART": 3600.0, "TSTOP": 7200.0,
+                                               "TIMEOFFS": 60.0, "TIMEDEL": 3.2 })
+    self.fm_old = self.make_fits("old.fits", { "DATE-OBS": "25/12/97", "TIME-OBS": "6:00:00" })
+    self.fm_none = self.make_fits("none.fits", { "OBJECT": "nothing" })
+
+  def test_iso_with_exposure(self):
+    "ISO start time plus exposure gives start, stop, and exposure"
+    bo.derive_time_metadata([self.fm_iso])
+    self.assertAlmostEqual(self.fm_iso.get("start_time").value, 55197.0)
+    self.assertAlmostEqual(self.fm_iso.get("stop_time").value, 55197.0 + (60.0 / 86400.0))
+    self.assertEqual(self.fm_iso.get("exposure_time").value, 60.0)
+    self.assertNotIn("time_resolution", self.fm_iso)
+
+  def test_timesys_tt(self):
+    "Times in the TT scale are converted to UTC"
+    bo.derive_time_metadata([self.fm_tt])   # TT - UTC = 66.184 seconds in 2010
+    self.assertAlmostEqual(self.fm_tt.get("start_time").value, 55197.0, places=8)
+
+  def test_mjd_keys(self):
+    "MJD start and end keys give start, stop, and exposure"
+    bo.derive_time_metadata([self.fm_mjd])
+    self.assertEqual(self.fm_mjd.get("start_time").value, 55197.0)
+    self.assertEqual(self.fm_mjd.get("stop_time").value, 55197.5)
+    self.assertAlmostEqual(self.fm_mjd.get("exposure_time").value, 43200.0)
+
+  def test_relative_keys(self):
+    "Relative times are offset from the reference time"
+    bo.derive_time_metadata([self.fm_rel])
+    self.assertAlmostEqual(self.fm_rel.get("start_time").value, 55197.0 + (3660.0 / 86400.0))
+    self.assertAlmostEqual(self.fm_rel.get("stop_time").value, 55197.0 + (7260.0 / 86400.0))
+    self.assertAlmostEqual(self.fm_rel.get("exposure_time").value, 3600.0, places=3)
+    self.assertEqual(self.fm_rel.get("time_resolution").value, 3.2)
+
+  def test_old_date_format(self):
+    "Old style dd/mm/yy dates are combined with a separate time of day"
+    bo.derive_time_metadata([self.fm_old])
+    self.assertAlmostEqual(self.fm_old.get("start_time").value, 50807.25) # 1997-12-25T06:00
+
+  def test_no_time_keys(self):
+    "No time items are derived for a file without time keys"
+    md0 = self.fm_none.metadata()
+    bo.derive_time_metadata([self.fm_none])
+    self.assertEqual(self.fm_none.metadata(), md0)
+
+  def test_batch(self):
+    "A mixed batch of files and time scales is converted together"
+    batch = [self.fm_iso, self.fm_tt, self.fm_mjd, self.fm_rel, self.fm_old, self.fm_none]
+    bo.derive_time_metadata(batch)
+    starts = [fmeta.get("start_time") for fmeta in batch]
+    self.assertAlmostEqual(starts[0].value, 55197.0)
+    self.assertAlmostEqual(starts[1].value, 55197.0, places=8)
+    self.assertEqual(starts[2].value, 55197.0)
+    self.assertAlmostEqual(starts[3].value, 55197.0 + (3660.0 / 86400.0))
+    self.assertAlmostEqual(starts[4].value, 50807.25)
+    self.assertEqual(starts[5], None)
+
+  def test_keys_subset_source(self):
+    "Derived items are added, and added to the subset, when their source key is in the subset"
+    ksub = [ "DATE-OBS" ]
+    bo.derive_time_metadata([self.fm_iso], ksub)
+    self.assertIn("start_time", self.fm_iso)
+    self.assertIn("start_time", ksub)
+    self.assertNotIn("stop_time", self.fm_iso)
+    self.assertNotIn("stop_time", ksub)
+    self.assertNotIn("exposure_time", self.fm_iso)
+
+  def test_keys_subset_derived(self):
+    "Derived items are added when they are in the subset"
+    ksub = [ "stop_time" ]
+    bo.derive_time_metadata([self.fm_iso], ksub)
+    self.assertIn("stop_time", self.fm_iso)
+    self.assertNotIn("start_time", self.fm_iso)
+    self.assertEqual(ksub, [ "stop_time" ])
+
+
+if __name__ == "__main__":
+  suite = suite()
+  unittest.TextTestRunner(verbosity=2).run(suite)
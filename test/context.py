@@ -1,14 +1,25 @@
 #
 # Test context file: obviate need to install module before testing.
 #   Written by: Tom Hicks. 6/30/2018.
-#   Last Modified: Update for project rename.
+#   Last Modified: Add batch, header capture, journal, lookup cache, merge operations, plan operations, progress, session pool, transcode, upload engine, and utilities modules.
 #
 import os
 import sys
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
+import astrolabe_py.batch_ops as bo
 import astrolabe_py.fits_meta as fm
 import astrolabe_py.fits_ops as fo
+import astrolabe_py.header_capture as hc
 import astrolabe_py.irods_help as ih
+import astrolabe_py.journal as jnl
+import astrolabe_py.lookup_cache as lc
+import astrolabe_py.merge_ops as mo
+import astrolabe_py.plan_ops as po
+import astrolabe_py.progress as pg
+import astrolabe_py.session_pool as sp
+import astrolabe_py.transcode as tc
+import astrolabe_py.upload_engine as ue
 import astrolabe_py.uploader as up
+import astrolabe_py.utils as utils
 # import astrolabe_py.wwt_help as wh
@@ -2,7 +2,7 @@
 #
 # Python code to unit test the Astrolabe FITS Metadata module.
 #   Written by: Tom Hicks. 7/11/2018.
-#   Last Modified: Update for project rename.
+#   Last Modified: Add test for extraction from captured header bytes.
 #
 import json
 import unittest
@@ -280,7 +280,7 @@ class FitsMetaTestCase(FitsMetaBaseTestCase):
     self.assertNotEqual(item, None)
     self.assertEqual(type(item), Metadatum)
     self.assertEqual(item.keyword, "NAXIS")
-    self.assertEqual(item.value, "2")
+    self.assertEqual(item.value, 2)
 
 
   def test_getitem_none(self):
@@ -304,7 +304,7 @@ class FitsMetaTestCase(FitsMetaBaseTestCase):
     self.assertNotEqual(item, None)
     self.assertEqual(type(item), Metadatum)
     self.assertEqual(item.keyword, "NAXIS")
-    self.assertEqual(item.value, "2")
+    self.assertEqual(item.value, 2)
 
 
   def test_copy_item_not_found(self):
@@ -376,6 +376,43 @@ class FitsMetaTestCase(FitsMetaBaseTestCase):
     self.assertTrue("YYYYY" in ks1)         # new item should be in key set
 
 
+  def test_ctor_ignore_keys(self):
+    "Ignored keys are not extracted (from real data)"
+    fmi = fm.FitsMeta(self.test_file, ignore_keys=["HISTORY", "NAXIS"])
+    self.assertEqual(len(fmi), self.test_file_md_count - 3)
+    self.assertFalse("HISTORY" in fmi)
+    self.assertFalse("NAXIS" in fmi)
+    self.assertTrue("NAXIS1" in fmi)        # unaffected by similar name
+
+  def test_ctor_wanted_keys(self):
+    "Only wanted keys are extracted (from real data)"
+    fmw = fm.FitsMeta(self.test_file, wanted_keys=["NAXIS", "HISTORY", "filepath", "BOGUS"])
+    self.assertEqual(len(fmw), 4)           # HISTORY keyword is repeated in test file
+    self.assertEqual(fmw.key_set(), set(["NAXIS", "HISTORY", "filepath"]))
+
+  def test_ctor_wanted_and_ignored_keys(self):
+    "Ignored keys are not extracted even when wanted (from real data)"
+    fmw = fm.FitsMeta(self.test_file, ignore_keys=["HISTORY"], wanted_keys=["NAXIS", "HISTORY"])
+    self.assertEqual(len(fmw), 1)
+    self.assertEqual(fmw.key_set(), set(["NAXIS"]))
+
+  def test_native_value_types(self):
+    "Metadata values keep their native header types (from real data)"
+    self.assertEqual(type(self.fm.get("SIMPLE").value), bool)
+    self.assertEqual(type(self.fm.get("NAXIS1").value), int)
+    self.assertEqual(type(self.fm.get("CRVAL1").value), float)
+    self.assertEqual(type(self.fm.get("CTYPE1").value), str)
+    self.assertEqual(self.fm.get("CRVAL1").value, 189.65693199)
+
+  def test_ctor_header_bytes(self):
+    "Metadata extracted from captured header bytes is the same as from the file"
+    with open(self.test_file, "rb") as fits_file:
+      header_bytes = fits_file.read(2880 * 4)   # more than the header: only the header is used
+    hfm = fm.FitsMeta(self.test_file, header_bytes=header_bytes)
+    self.assertEqual(hfm.metadata(), self.fm.metadata())
+    self.assertEqual(hfm.hdu_info(), [])
+
+
 if __name__ == "__main__":
   suite = suite()
   unittest.TextTestRunner(verbosity=2).run(suite)
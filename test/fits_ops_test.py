@@ -2,7 +2,7 @@
 #
 # Python code to unit test the Astrolabe FITS Operations module.
 #   Written by: Tom Hicks. 6/22/2018.
-#   Last Modified: Update for r_a/dec name reversion. Update test file count and constants.
+#   Last Modified: Check the full file path in the HDU info report. Test a batch with a bad file.
 #
 import unittest
 from astropy.io import fits
@@ -28,7 +28,7 @@ class FitsOpsTestCase(unittest.TestCase):
     cls.default_options = {}
     cls.test_file = "resources/cvnidwabcut.fits"
     cls.test_file2 = "resources/m13.fits"
-    cls.test_file_md_count = 66             # 55 native + 11 generated entries
+    cls.test_file_md_count = 71             # 55 native + 16 generated entries
     cls.test_file_hist_count = 2            # 2 HISTORY entries (often filtered out)
     cls.test_file_auto_added = 2            # right_ascension & declination added automatically
     cls.test_dir = "resources"
@@ -304,10 +304,22 @@ class FitsMetadataTestCase(FitsOpsTestCase):
     self.assertIn("sxel1", mdkeys)
     self.assertIn("sxel2", mdkeys)
     self.assertIn("t_min", mdkeys)
+    self.assertIn("t_max", mdkeys)
+    self.assertIn("t_exptime", mdkeys)
     self.assertIn("instrument_name", mdkeys)
     self.assertIn("obs_creator_name", mdkeys)
     self.assertIn("target_name", mdkeys)
 
+  def test_md_time_keys(self):
+    "Observation times are normalized to UTC MJDs and seconds"
+    metadata = dict(fo.fits_metadata(self.test_file))
+    self.assertAlmostEqual(metadata["start_time"], 51673.179166667) # 2000-05-09T04:18:00
+    self.assertAlmostEqual(metadata["stop_time"], 51673.189583333) # plus 900 seconds
+    self.assertEqual(metadata["exposure_time"], 900.0)
+    self.assertEqual(metadata["t_min"], metadata["start_time"])
+    self.assertEqual(metadata["t_max"], metadata["stop_time"])
+    self.assertEqual(metadata["t_exptime"], metadata["exposure_time"])
+
 
   def test_keys_subset_empty(self):
     "Extract all metadata if keys_subset is empty"
@@ -361,7 +373,8 @@ class FitsMetadataTestCase(FitsOpsTestCase):
     "Extract metadata for specified keys_subset, all of which have alternative keys"
     ksubset = ["NAXIS1", "NAXIS2", "DATE-OBS", "INSTRUME"]
     # keywords doubled + right_ascension & declination + VO copies of right_ascension & declination
-    ks_len = (2 * len(ksubset)) + (2 * self.test_file_auto_added)
+    # + start_time derived from DATE-OBS
+    ks_len = (2 * len(ksubset)) + (2 * self.test_file_auto_added) + 1
     metadata = fo.fits_metadata(self.test_file, {"keys_subset": ksubset})
     self.assertNotEqual(metadata, None)
     # [print(item) for item in metadata]      # DEBUGGING
@@ -377,6 +390,7 @@ class FitsMetadataTestCase(FitsOpsTestCase):
     self.assertIn("NAXIS2", mdkeys)
     self.assertIn("sxel2", mdkeys)
     self.assertIn("DATE-OBS", mdkeys)
+    self.assertIn("start_time", mdkeys)
     self.assertIn("t_min", mdkeys)
     self.assertIn("INSTRUME", mdkeys)
     self.assertIn("instrument_name", mdkeys)
@@ -455,12 +469,30 @@ class FitsMetadataTestCase(FitsOpsTestCase):
     self.assertIn("target_name", mdkeys)    # derived from OBJECT, so still present
 
 
+  def test_fits_metadata_batch(self):
+    "Extract metadata for a batch of files"
+    mdlist = fo.fits_metadata_batch([self.test_file, self.test_file2])
+    self.assertEqual(len(mdlist), 2)
+    self.assertEqual(len(mdlist[0]), self.test_file_md_count)
+    self.assertEqual(mdlist[0], fo.fits_metadata(self.test_file))
+    self.assertEqual(mdlist[1], fo.fits_metadata(self.test_file2))
+
+  def test_fits_metadata_batch_bad_file(self):
+    "One unreadable file in a batch does not fail the others"
+    mdlist = fo.fits_metadata_batch([self.test_file, "NO_SUCH_FILEPATH", self.test_file2])
+    self.assertEqual(len(mdlist), 3)
+    self.assertIsNone(mdlist[1])
+    self.assertEqual(mdlist[0], fo.fits_metadata(self.test_file))
+    self.assertEqual(mdlist[2], fo.fits_metadata(self.test_file2))
+
+
   def test_fits_hdu_info(self):
     "Get summary info report for the HDUs of a file"
     report = fo.fits_hdu_info(self.test_file)
     self.assertNotEqual(report, None)
     self.assertEqual(len(report), 3)        # filename, heading, and one HDU line
     self.assertTrue(all([type(line) == str for line in report]))
+    self.assertEqual(report[0], "Filename: {}".format(self.test_file))
 
   def test_execute_info_one(self):
     "Get summary info reports for a single FITS files"
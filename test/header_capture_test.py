@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+#
+# Python code to unit test the Astrolabe FITS header capture class.
+#   Written by: agent. 10/19/2026.
+#   Last Modified: Initial creation.
+#
+import gzip
+import unittest
+from astropy.io import fits
+
+from context import hc                      # the module under test
+
+def suite():
+  suite = unittest.TestSuite()
+  suite.addTest(unittest.defaultTestLoader.loadTestsFromTestCase(CaptureTestCase))
+  return suite
+
+
+class CaptureTestCase(unittest.TestCase):
+
+  "Base test class"
+  @classmethod
+  def setUpClass(cls):
+    cls.test_file = "resources/m13.fits"
+    with open(cls.test_file, "rb") as fits_file:
+      cls.file_bytes = fits_file.read()
+    cls.header = fits.getheader(cls.test_file)
+
+  def feed(self, capture, data, chunk_size):
+    for start in range(0, len(data), chunk_size):
+      capture(data[start:start + chunk_size])
+
+
+  def test_capture(self):
+    "The primary header is captured from chunks of any size"
+    for chunk_size in [ 1000, 2880, 4096, len(self.file_bytes) ]:
+      capture = hc.HeaderCapture()
+      self.feed(capture, self.file_bytes, chunk_size)
+      self.assertTrue(capture.done())
+      header_bytes = capture.header_bytes()
+      self.assertEqual(len(header_bytes) % hc.FITS_BLOCK_SIZE, 0)
+      self.assertEqual(fits.Header.fromstring(header_bytes.decode("ascii")), self.header)
+
+  def test_capture_gzipped(self):
+    "The primary header is captured from a gzipped file"
+    capture = hc.HeaderCapture(gzipped=True)
+    self.feed(capture, gzip.compress(self.file_bytes), 512)
+    self.assertEqual(fits.Header.fromstring(capture.header_bytes().decode("ascii")), self.header)
+
+  def test_capture_incomplete(self):
+    "Nothing is captured until the END card has passed"
+    capture = hc.HeaderCapture()
+    capture(self.file_bytes[:1000])
+    self.assertFalse(capture.done())
+    self.assertIsNone(capture.header_bytes())
+
+  def test_capture_no_end(self):
+    "Capture is abandoned when no END card is found"
+    capture = hc.HeaderCapture(max_header_size=2 * hc.FITS_BLOCK_SIZE)
+    self.feed(capture, b" " * (3 * hc.FITS_BLOCK_SIZE), 1000)
+    self.assertTrue(capture.done())
+    self.assertIsNone(capture.header_bytes())
+
+  def test_reset(self):
+    "A reset capture starts again from the beginning of the file"
+    capture = hc.HeaderCapture()
+    capture(self.file_bytes[:1000])
+    capture.reset()
+    self.feed(capture, self.file_bytes, 4096)
+    self.assertEqual(fits.Header.fromstring(capture.header_bytes().decode("ascii")), self.header)
+
+
+if __name__ == "__main__":
+  suite = suite()
+  unittest.TextTestRunner(verbosity=2).run(suite)
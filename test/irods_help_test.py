@@ -2,14 +2,18 @@
 #
 # Python code to unit test the Astrolabe iRods Help class.
 #   Written by: Tom Hicks. 6/30/2018.
-#   Last Modified: Update for project rename.
+#   Last Modified: Test deleting a tree whose name holds a LIKE wildcard.
 #
 import os
+import re
 import unittest
 from irods.session import iRODSSession
 from irods.exception import CollectionDoesNotExist, DataObjectDoesNotExist
+from irods.meta import iRODSMeta
+from irods.models import Collection, DataObject, DataObjectMeta
 
 from context import ih                      # the module under test
+from context import sp
 from context import up
 from astrolabe_py import Metadatum
 
@@ -18,6 +22,13 @@ def suite():
   suite.addTest(unittest.defaultTestLoader.loadTestsFromTestCase(ConnectionsTestCase))
   suite.addTest(unittest.defaultTestLoader.loadTestsFromTestCase(MovementTestCase))
   suite.addTest(unittest.defaultTestLoader.loadTestsFromTestCase(FilesTestCase))
+  suite.addTest(unittest.defaultTestLoader.loadTestsFromTestCase(BranchesTestCase))
+  suite.addTest(unittest.defaultTestLoader.loadTestsFromTestCase(MetadataChangesTestCase))
+  suite.addTest(unittest.defaultTestLoader.loadTestsFromTestCase(PooledTestCase))
+  suite.addTest(unittest.defaultTestLoader.loadTestsFromTestCase(LookupTestCase))
+  suite.addTest(unittest.defaultTestLoader.loadTestsFromTestCase(TreeMetadataTestCase))
+  suite.addTest(unittest.defaultTestLoader.loadTestsFromTestCase(TreeWalkTestCase))
+  suite.addTest(unittest.defaultTestLoader.loadTestsFromTestCase(TreeDeleteTestCase))
   # Tests in the following TestCase take about 15 seconds each to run:
   # suite.addTest(unittest.defaultTestLoader.loadTestsFromTestCase(WalkTestCase))
   # Tests in the following TestCase take about 5 minutes each to run:
@@ -971,6 +982,486 @@ class DeleteTestCase(IrodsHelpTestCase):
     self.assertFalse(deletes[1])            # so it is too late for this call
 
 
+
+class BranchesTestCase(IrodsHelpTestCase):
+
+  def setUp(self):
+    "Initialize the test case"
+    self.top = "/zone/home/user/astrolabe"
+
+  def test_missing_branches_none(self):
+    "Nothing is created when every directory exists"
+    dirs = [ self.top, self.top + "/a", self.top + "/a/b" ]
+    self.assertEqual(ih.IrodsHelper.missing_branches(dirs, set(dirs)), [])
+
+  def test_missing_branches_leaves(self):
+    "Only the missing leaves are created, grouped by their topmost missing ancestor"
+    dirs = [ self.top + "/a", self.top + "/a/b", self.top + "/a/b/c", self.top + "/a/b/d",
+             self.top + "/a/e", self.top + "/x/y" ]
+    existing = set([ self.top, self.top + "/a" ])
+    self.assertEqual(ih.IrodsHelper.missing_branches(dirs, existing),
+                     [ [ self.top + "/a/b/c", self.top + "/a/b/d" ],
+                       [ self.top + "/a/e" ],
+                       [ self.top + "/x/y" ] ])
+
+  def test_missing_branches_no_top(self):
+    "All directories form a single branch when their common top directory is missing"
+    dirs = [ self.top + "/a", self.top + "/b" ]
+    self.assertEqual(ih.IrodsHelper.missing_branches(dirs, set()), [ dirs ])
+
+
+class MetadataChangesTestCase(IrodsHelpTestCase):
+
+  def changes(self, current, metadata):
+    return [ (op.operation, op.avu.name, op.avu.value)
+             for op in ih.IrodsHelper.metadata_changes(current, metadata) ]
+
+  def test_metadata_changes_none(self):
+    "Nothing is changed when the metadata is already attached"
+    current = [ iRODSMeta("a", "1"), iRODSMeta("b", "x"), iRODSMeta("c", "other") ]
+    mdata = [ Metadatum("a", 1), Metadatum("b", "x") ]
+    self.assertEqual(self.changes(current, mdata), [])
+    self.assertEqual(self.changes(current, []), [])
+
+  def test_metadata_changes_new(self):
+    "All new items are added to a file without metadata, once each"
+    mdata = [ Metadatum("a", 1), Metadatum("b", "x"), Metadatum("b", "x") ]
+    self.assertEqual(self.changes([], mdata), [ ("add", "a", "1"), ("add", "b", "x") ])
+
+  def test_metadata_changes_diff(self):
+    "Only the changed values of the given keys are removed and added"
+    current = [ iRODSMeta("a", "1"), iRODSMeta("b", "x"), iRODSMeta("b", "y"),
+                iRODSMeta("c", "other"), iRODSMeta("d", "5", "m") ]
+    mdata = [ Metadatum("a", 1), Metadatum("b", "y"), Metadatum("b", "z"), Metadatum("d", 5) ]
+    self.assertEqual(self.changes(current, mdata),
+                     [ ("remove", "b", "x"), ("remove", "d", "5"),
+                       ("add", "b", "z"), ("add", "d", "5") ])
+
+
+class PoolSession:
+  "Stand-in for an iRods session of a session pool"
+  zone = "zone"
+  username = "user"
+
+  def __init__(self):
+    self.cleaned = False
+
+  def cleanup(self):
+    self.cleaned = True
+
+
+class PooledTestCase(IrodsHelpTestCase):
+
+  def setUp(self):
+    "Initialize the test case"
+    self.pool = sp.SessionPool(PoolSession, max_sessions=2)
+
+  def test_pooled_connect(self):
+    "A pooled helper checks out its session and returns it on disconnecting"
+    ihelper = ih.IrodsHelper(pool=self.pool)
+    session = ihelper.session()
+    self.assertEqual(ihelper.root(), "/zone/home/user")
+    ihelper.disconnect()
+    self.assertFalse(session.cleaned)
+    self.assertIs(ih.IrodsHelper(pool=self.pool).session(), session)
+    self.assertEqual(self.pool.size(), 1)
+
+  def test_pooled_reconnect(self):
+    "A pooled helper discards its broken session on reconnecting"
+    ihelper = ih.IrodsHelper(pool=self.pool)
+    ihelper.cd("subdir")
+    session = ihelper.session()
+    ihelper.reconnect()
+    self.assertTrue(session.cleaned)
+    self.assertIsNot(ihelper.session(), session)
+    self.assertEqual(ihelper.cwd(), "/zone/home/user/subdir")
+    self.assertEqual(self.pool.size(), 1)
+
+  def test_pooled_detach(self):
+    "A detached helper returns its session to the pool and keeps its place for attaching"
+    ihelper = ih.IrodsHelper(pool=self.pool)
+    ihelper.set_root(top_dir="astrolabe")
+    ihelper.cd("subdir")
+    session = ihelper.session()
+    ihelper.detach()
+    self.assertIsNone(ihelper.session())
+    self.assertIs(self.pool.acquire(timeout=0), session)
+    self.pool.release(session)
+    ihelper.attach()
+    self.assertIs(ihelper.session(), session)
+    self.assertEqual(ihelper.root(), "/zone/home/user/astrolabe")
+    self.assertEqual(ihelper.cwd(), "/zone/home/user/astrolabe/subdir")
+    self.assertEqual(self.pool.size(), 1)
+
+
+class LookupNode:
+  "Stand-in for an iRods data object or collection"
+  def __init__(self, path):
+    self.path = path
+    self.unlinked = False
+
+  def unlink(self, force=False):
+    self.unlinked = True
+
+
+class LookupManager:
+  "Stand-in for the data object or collection manager of a session: counts lookups"
+  def __init__(self):
+    self.gets = 0
+    self.puts = 0
+
+  def get(self, path):
+    self.gets += 1
+    return LookupNode(path)
+
+  def create(self, path):
+    return LookupNode(path)
+
+  def exists(self, path):
+    return False
+
+  def put(self, local_file, path, num_threads=0, **options):
+    self.puts += 1
+
+
+class LookupMeta:
+  "Stand-in for the metadata manager of a session: holds the metadata of each path"
+  def __init__(self):
+    self.avus = {}
+    self.applied = []
+
+  def get(self, model_cls, path):
+    return list(self.avus.get(path, []))
+
+  def apply_atomic_operations(self, model_cls, path, *avu_ops):
+    self.applied.extend(avu_ops)
+    for op in avu_ops:
+      avus = self.avus.setdefault(path, [])
+      if (op.operation == "add"):
+        avus.append(op.avu)
+      else:
+        avus[:] = [avu for avu in avus if ((avu.name, avu.value) != (op.avu.name, op.avu.value))]
+
+
+class LookupSession(PoolSession):
+  "Stand-in for an iRods session whose lookups are counted"
+  def __init__(self):
+    super().__init__()
+    self.collections = LookupManager()
+    self.data_objects = LookupManager()
+    self.metadata = LookupMeta()
+
+
+class LookupTestCase(IrodsHelpTestCase):
+
+  def setUp(self):
+    "Initialize the test case"
+    self.pool = sp.SessionPool(LookupSession, max_sessions=1)
+    self.ihelper = ih.IrodsHelper(pool=self.pool)
+    self.session = self.ihelper.session()
+
+  def test_lookups_cached(self):
+    "Repeated lookups of a file or directory are answered from the cache"
+    obj = self.ihelper.getf("a.fits")
+    self.assertIs(self.ihelper.getf("a.fits", absolute=True), obj)
+    self.assertEqual(self.session.data_objects.gets, 1)
+    self.ihelper.get_dir("sub")
+    self.ihelper.get_dir("sub")
+    self.ihelper.get_root()
+    self.ihelper.get_cwd()
+    self.assertEqual(self.session.collections.gets, 2)
+
+  def test_lookups_invalidated(self):
+    "Uploading, deleting, or disconnecting drops the cached lookups"
+    self.ihelper.getf("a.fits")
+    self.ihelper.put_file("resources/m13.fits", "a.fits")
+    self.ihelper.getf("a.fits")
+    self.assertEqual(self.session.data_objects.gets, 2)
+    self.assertTrue(self.ihelper.delete_file("a.fits"))
+    self.ihelper.getf("a.fits")
+    self.assertEqual(self.session.data_objects.gets, 3)
+    newdir = self.ihelper.mkdir("new")
+    self.assertIs(self.ihelper.get_dir("new"), newdir)
+    self.ihelper.disconnect()
+    self.ihelper.connect()
+    self.ihelper.getf("a.fits")
+    self.assertEqual(self.session.data_objects.gets, 4)
+
+  def test_metadata_fresh(self):
+    "The metadata of a cached file is read afresh, for getting and for updating it"
+    obj = self.ihelper.getf("a.fits")
+    self.session.metadata.avus[obj.path] = [ iRODSMeta("a", "1"), iRODSMeta("b", "2") ]
+    self.assertEqual(self.ihelper.get_metaf("a.fits"), [ Metadatum("a", "1"), Metadatum("b", "2") ])
+    self.assertEqual(self.ihelper.put_metaf([ Metadatum("a", 1), Metadatum("b", 3) ], "a.fits"), 2)
+    self.assertEqual([ (op.operation, op.avu.name, op.avu.value) for op in self.session.metadata.applied ],
+                     [ ("remove", "b", "2"), ("add", "b", "3") ])
+    self.assertEqual(self.ihelper.get_metaf("a.fits"), [ Metadatum("a", "1"), Metadatum("b", "3") ])
+
+  def test_ensure_dirs_pooled(self):
+    "A pooled helper creates directories with sessions from its pool, even a pool of one"
+    self.assertEqual(self.ihelper.ensure_dirs([ "new" ], jobs=4), 1)
+    self.assertIs(self.ihelper.session(), self.session)
+    self.assertEqual(self.pool.size(), 1)
+    self.ihelper.get_dir("new")             # created by another session, so not cached
+    self.assertEqual(self.session.collections.gets, 1)
+
+  def test_lookups_uncached(self):
+    "A cache of no entries looks up every time"
+    self.ihelper.disconnect()
+    ihelper = ih.IrodsHelper({ "lookup_cache_size": 0 }, pool=self.pool)
+    ihelper.getf("a.fits")
+    ihelper.getf("a.fits")
+    self.assertEqual(self.session.data_objects.gets, 2)
+
+
+def like(value, pattern):
+  "Tell whether the given value matches the given SQL LIKE pattern: '_' is any one character"
+  regex = "".join([ ".*" if (char == "%") else "." if (char == "_") else re.escape(char)
+                    for char in pattern ])
+  return (re.fullmatch(regex, value, re.DOTALL) is not None)
+
+
+def has_column(columns, column):
+  "Tell whether the given column is one of the given columns: == on columns makes a criterion"
+  return any((col is column) for col in columns)
+
+
+class TreeQuery:
+  "Stand-in for a catalog query over the rows of a table: records the pages asked for"
+  def __init__(self, table, columns, log):
+    self.table = table
+    self.columns = columns
+    self.log = log
+    self.criterion = None
+    self.ordered = False
+    self.page_size = None
+
+  def filter(self, criterion):
+    self.criterion = criterion
+    return self
+
+  def order_by(self, column):
+    self.ordered = True
+    return self
+
+  def limit(self, page_size):
+    self.page_size = page_size
+    return self
+
+  def __iter__(self):
+    self.log.append(self)
+    value = getattr(self.criterion, "_value", self.criterion.value) # older clients quote .value
+    rows = [ row for row in self.table
+             if ((row[Collection.name] == value) if (self.criterion.op == "=")
+                 else like(row[Collection.name], value)) ]
+    if (self.ordered):
+      rows.sort(key=lambda row: (row[Collection.name], row[DataObject.name]))
+    if (has_column(self.columns, DataObjectMeta.name)):
+      rows = [ row for row in rows if (DataObjectMeta.name in row) ]
+    return iter([ { col: row[col] for col in self.columns } for row in rows ])
+
+
+class TreeSession(PoolSession):
+  "Stand-in for an iRods session whose catalog holds a few files"
+  def __init__(self):
+    super().__init__()
+    self.queries = []
+    top = "/zone/home/user/tree"
+    def row(coll, name, key=None, value=None):
+      row = { Collection.name: coll, DataObject.name: name }
+      if (key):
+        row.update({ DataObjectMeta.name: key, DataObjectMeta.value: value })
+      return row
+    self.table = [ row(top + "/b", "x.fits", "K", "1"), row(top, "y.fits", "A", "2"),
+                   row(top, "y.fits", "B", "3"), row(top + "/b", "x.fits", "K", "1"), # replica
+                   row(top, "bare.fits"), row(top + "2", "other.fits", "K", "9"),
+                   row("/zone/home/user/run_1", "r.fits", "K", "4"),
+                   row("/zone/home/user/runX1/sub", "s.fits", "K", "5") ] # LIKE run_1/% matches
+
+  def query(self, *columns):
+    return TreeQuery(self.table, columns, self.queries)
+
+
+class TreeMetadataTestCase(IrodsHelpTestCase):
+
+  def setUp(self):
+    "Initialize the test case"
+    self.ihelper = ih.IrodsHelper(pool=sp.SessionPool(TreeSession, max_sessions=1))
+    self.top = "/zone/home/user/tree"
+
+  def test_walk_metadata(self):
+    "The metadata of every file in the tree is yielded, then the files without any"
+    found = list(self.ihelper.walk_metadata("tree", absolute=True, page_size=100))
+    self.assertEqual(found, [
+      (self.top + "/y.fits", [ Metadatum("A", "2"), Metadatum("B", "3") ]),
+      (self.top + "/b/x.fits", [ Metadatum("K", "1") ]),
+      (self.top + "/bare.fits", []) ])
+    queries = self.ihelper.session().queries
+    self.assertEqual(len(queries), 4)
+    self.assertTrue(all([ query.page_size == 100 for query in queries ]))
+
+  def test_walk_metadata_only(self):
+    "Only the files with metadata are yielded, if asked"
+    found = dict(self.ihelper.walk_metadata("tree", absolute=True, include_bare=False))
+    self.assertEqual(sorted(found), [ self.top + "/b/x.fits", self.top + "/y.fits" ])
+
+  def test_walk_metadata_wildcards(self):
+    "Directories matched by wildcards in the path of the tree are not walked"
+    found = list(self.ihelper.walk_metadata("run_1", absolute=True))
+    self.assertEqual(found, [ ("/zone/home/user/run_1/r.fits", [ Metadatum("K", "4") ]) ])
+
+
+class CatalogQuery(TreeQuery):
+  "Stand-in for a catalog query which may select all of the columns of a model"
+  def __init__(self, table, columns, log):
+    expanded = []
+    for col in columns:
+      expanded.extend(col._columns if isinstance(col, type) else [ col ])
+    super().__init__(table, expanded, log)
+
+  def __iter__(self):
+    rows = super().__iter__()
+    if (has_column(self.columns, DataObject.name)): # collections without files have no file rows
+      rows = [ row for row in rows if (row[DataObject.name] is not None) ]
+    else:                                   # a collection is listed once, however many files
+      rows = list({ row[Collection.name]: row for row in rows }.values())
+    return iter(rows)
+
+
+class CatalogManager:
+  "Stand-in for a manager of a session: records the nodes removed, failing for some"
+  def __init__(self, sess):
+    self.sess = sess
+    self.removed = []
+    self.failing = set()
+
+  def remove(self, path, recurse=True, force=False):
+    if (path in self.failing):
+      raise RuntimeError("cannot remove {}".format(path))
+    self.removed.append(path)
+
+  def unlink(self, path, force=False):
+    self.remove(path)
+
+
+class CatalogSession(PoolSession):
+  "Stand-in for an iRods session whose catalog holds a small tree of files"
+  server_version = (4, 3, 0)
+
+  def __init__(self):
+    super().__init__()
+    self.queries = []
+    self.collections = CatalogManager(self)
+    self.data_objects = CatalogManager(self)
+    self.table = []
+    top = "/zone/home/user"
+    self.add(top, None)
+    self.add(top + "/t0", None)
+    self.add(top + "/t0/t2", None)
+    self.add(top + "/t0/t1", "b.txt", 2, checksum="sha2:abc")
+    self.add(top + "/t0/t1", "b.txt", 2, replica=1)
+    self.add(top + "/t0/t1", "a.txt", 1)
+    self.add(top + "/t0/t1/t3", None)
+    self.add(top + "/t_1", "c.txt", 3)
+    self.add(top + "/tX1/t4", "d.txt", 4)   # matched by the LIKE pattern t_1/%
+
+  def add(self, coll, name, size=0, checksum="", replica=0):
+    row = { col: None for col in (Collection._columns + DataObject._columns) }
+    row.update({ Collection.name: coll, Collection.id: hash(coll) })
+    if (name):
+      row.update({ DataObject.id: hash(coll + name), DataObject.name: name,
+                   DataObject.size: str(size), DataObject.checksum: checksum,
+                   DataObject.replica_number: replica })
+    self.table.append(row)
+
+  def query(self, *columns):
+    return CatalogQuery(self.table, columns, self.queries)
+
+
+class TreeWalkTestCase(IrodsHelpTestCase):
+
+  def setUp(self):
+    "Initialize the test case"
+    self.ihelper = ih.IrodsHelper(pool=sp.SessionPool(CatalogSession, max_sessions=1))
+    self.ihelper.cd_down("t0")
+
+  def nodes(self, walker):
+    return [ (node[0].name, [ sub.name for sub in node[1] ], [ obj.name for obj in node[2] ])
+             for node in walker ]
+
+  def test_walk_topdown(self):
+    "Walk a directory tree in top-down order, using two catalog queries"
+    self.assertEqual(self.nodes(self.ihelper.walk()), [
+      ("t0", [ "t1", "t2" ], []),
+      ("t1", [ "t3" ], [ "a.txt", "b.txt" ]),
+      ("t3", [], []),
+      ("t2", [], []) ])
+    self.assertEqual(len(self.ihelper.session().queries), 4) # two criteria for each
+    node = next(self.ihelper.walk())
+    self.assertEqual(node[0].path, "/zone/home/user/t0")
+
+  def test_walk_bottomup(self):
+    "Walk a directory tree in bottom-up order"
+    self.assertEqual([ node[0] for node in self.nodes(self.ihelper.walk(topdown=False)) ],
+                     [ "t3", "t1", "t2", "t0" ])
+
+  def test_walk_missing(self):
+    "Walking a missing directory yields nothing"
+    self.ihelper.cd_down("missing")
+    self.assertEqual(list(self.ihelper.walk()), [])
+
+  def test_walk_files(self):
+    "A record of each file is yielded, with the checksum of any replica"
+    self.assertEqual(list(self.ihelper.walk_files("t0", absolute=True)), [
+      ih.FileRecord("/zone/home/user/t0/t1/a.txt", 1, None),
+      ih.FileRecord("/zone/home/user/t0/t1/b.txt", 2, "sha2:abc") ])
+    self.assertEqual(self.ihelper.get_file_stats(".")["/zone/home/user/t0/t1/b.txt"], (2, "sha2:abc"))
+
+  def test_walk_wildcards(self):
+    "Directories matched by wildcards in the path of the tree are not walked"
+    self.assertEqual(list(self.ihelper.walk_files("t_1", absolute=True)),
+                     [ ih.FileRecord("/zone/home/user/t_1/c.txt", 3, None) ])
+    self.ihelper.cd_root()
+    self.ihelper.cd_down("t_1")
+    self.assertEqual(self.nodes(self.ihelper.walk()), [ ("t_1", [], [ "c.txt" ]) ])
+
+
+class TreeDeleteTestCase(IrodsHelpTestCase):
+
+  def setUp(self):
+    "Initialize the test case"
+    self.ihelper = ih.IrodsHelper(pool=sp.SessionPool(CatalogSession, max_sessions=1))
+    self.session = self.ihelper.session()
+    self.top = "/zone/home/user/t0"
+
+  def test_delete_tree(self):
+    "Files are unlinked first, then directories are removed bottom-up"
+    events = []
+    self.assertEqual(self.ihelper.delete_tree("t0", jobs=4, progress_fn=events.append), 0)
+    self.assertEqual(sorted(self.session.data_objects.removed),
+                     [ self.top + "/t1/a.txt", self.top + "/t1/b.txt" ])
+    removed = self.session.collections.removed
+    self.assertEqual(sorted(removed), sorted([ self.top, self.top + "/t1", self.top + "/t2",
+                                               self.top + "/t1/t3" ]))
+    self.assertEqual(removed[0], self.top + "/t1/t3")
+    self.assertEqual(removed[-1], self.top)
+    self.assertEqual([ event["done"] for event in events ], list(range(1, 7)))
+    self.assertTrue(all([ event["total"] == 6 and event["ok"] for event in events ]))
+
+  def test_delete_tree_failures(self):
+    "Nodes which cannot be deleted are counted"
+    self.session.data_objects.failing.add(self.top + "/t1/a.txt")
+    self.session.collections.failing.add(self.top + "/t1")
+    self.assertEqual(self.ihelper.delete_tree("t0"), 2)
+    self.assertEqual(self.ihelper.delete_tree("missing"), 1)
+
+  def test_delete_tree_wildcards(self):
+    "Nothing outside the tree is deleted, even if matched by wildcards in its path"
+    self.assertEqual(self.ihelper.delete_tree("t_1"), 0)
+    self.assertEqual(self.session.data_objects.removed, [ "/zone/home/user/t_1/c.txt" ])
+    self.assertEqual(self.session.collections.removed, [ "/zone/home/user/t_1" ])
+
+
 if __name__ == "__main__":
   suite = suite()
   unittest.TextTestRunner(verbosity=2).run(suite)
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+#
+# Python code to unit test the Astrolabe upload journal class.
+#   Written by: agent. 10/19/2026.
+#   Last Modified: Test a file changed during its upload.
+#
+import os
+import tempfile
+import unittest
+
+from context import jnl                     # the module under test
+
+def suite():
+  suite = unittest.TestSuite()
+  suite.addTest(unittest.defaultTestLoader.loadTestsFromTestCase(JournalTestCase))
+  return suite
+
+
+class JournalTestCase(unittest.TestCase):
+
+  def setUp(self):
+    "Initialize the test case"
+    self.tmpdir = tempfile.TemporaryDirectory()
+    self.journal_path = os.path.join(self.tmpdir.name, "journal.jsonl")
+    self.source = os.path.join(self.tmpdir.name, "source.fits")
+    with open(self.source, "w") as src:
+      src.write("some data")
+
+  def tearDown(self):
+    "Cleanup after the test case"
+    self.tmpdir.cleanup()
+
+
+  def test_empty(self):
+    "A new journal has no records"
+    with jnl.UploadJournal(self.journal_path) as journal:
+      self.assertEqual(len(journal), 0)
+      self.assertFalse(journal.is_done(self.source, "target.fits"))
+    self.assertTrue(os.path.isfile(self.journal_path))
+
+  def test_record(self):
+    "A recorded upload is done"
+    with jnl.UploadJournal(self.journal_path) as journal:
+      journal.record(self.source, "target.fits", True)
+      self.assertEqual(len(journal), 1)
+      self.assertTrue(journal.is_done(self.source, "target.fits"))
+      self.assertTrue(journal.is_done(self.source, "target.fits", metadata_wanted=True))
+      self.assertFalse(journal.is_done(self.source, "other.fits"))
+
+  def test_reload(self):
+    "Records are reloaded when the journal is reopened"
+    with jnl.UploadJournal(self.journal_path, sync_batch=10) as journal:
+      journal.record(self.source, "target.fits", False)
+    with jnl.UploadJournal(self.journal_path) as journal:
+      self.assertEqual(len(journal), 1)
+      self.assertTrue(journal.is_done(self.source, "target.fits"))
+      self.assertFalse(journal.is_done(self.source, "target.fits", metadata_wanted=True))
+
+  def test_changed_file(self):
+    "A file changed since it was recorded is not done"
+    with jnl.UploadJournal(self.journal_path) as journal:
+      journal.record(self.source, "target.fits")
+      with open(self.source, "a") as src:
+        src.write(" and some more data")
+      self.assertFalse(journal.is_done(self.source, "target.fits"))
+
+  def test_changed_during_upload(self):
+    "A file changed after it was examined for its upload is not done"
+    stat = os.stat(self.source)
+    with open(self.source, "a") as src:
+      src.write(" and some more data")
+    with jnl.UploadJournal(self.journal_path) as journal:
+      journal.record(self.source, "target.fits", size=stat.st_size, mtime=stat.st_mtime)
+      self.assertFalse(journal.is_done(self.source, "target.fits"))
+
+  def test_partial_record(self):
+    "A partially written last record is ignored and does not spoil later records"
+    with jnl.UploadJournal(self.journal_path) as journal:
+      journal.record(self.source, "target.fits")
+    with open(self.journal_path, "a") as jfile:
+      jfile.write('{"source": "/trunc')     # simulate a crash while writing
+    with jnl.UploadJournal(self.journal_path) as journal:
+      self.assertEqual(len(journal), 1)
+      journal.record(self.source, "target2.fits")
+    with jnl.UploadJournal(self.journal_path) as journal:
+      self.assertEqual(len(journal), 1)
+      self.assertTrue(journal.is_done(self.source, "target2.fits"))
+
+
+if __name__ == "__main__":
+  suite = suite()
+  unittest.TextTestRunner(verbosity=2).run(suite)
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+#
+# Python code to unit test the Astrolabe lookup cache class.
+#   Written by: agent. 10/19/2026.
+#   Last Modified: Initial creation.
+#
+import unittest
+
+from context import lc                      # the module under test
+
+def suite():
+  suite = unittest.TestSuite()
+  suite.addTest(unittest.defaultTestLoader.loadTestsFromTestCase(LookupCacheTestCase))
+  return suite
+
+
+class ManualClock:
+  "Clock which only advances when told to"
+  def __init__(self):
+    self.now = 0.0
+
+  def __call__(self):
+    return self.now
+
+
+class LookupCacheTestCase(unittest.TestCase):
+
+  def setUp(self):
+    "Initialize the test case"
+    self.clock = ManualClock()
+    self.cache = lc.LookupCache(max_entries=3, ttl=10, clock=self.clock)
+
+  def test_get_put(self):
+    "A value put is got back, a missing one is None"
+    self.assertEqual(self.cache.put("/a", 1), 1)
+    self.assertEqual(self.cache.get("/a"), 1)
+    self.assertIsNone(self.cache.get("/b"))
+
+  def test_ttl(self):
+    "An entry expires after its time to live"
+    self.cache.put("/a", 1)
+    self.clock.now = 9.9
+    self.assertEqual(self.cache.get("/a"), 1)
+    self.clock.now = 10
+    self.assertIsNone(self.cache.get("/a"))
+    self.assertEqual(len(self.cache), 0)
+
+  def test_lru(self):
+    "The least recently used entry is dropped when the cache is full"
+    for idx, path in enumerate([ "/a", "/b", "/c" ]):
+      self.cache.put(path, idx)
+    self.cache.get("/a")
+    self.cache.put("/d", 3)
+    self.assertIsNone(self.cache.get("/b"))
+    self.assertEqual(self.cache.get("/a"), 0)
+    self.assertEqual(len(self.cache), 3)
+
+  def test_invalidate(self):
+    "Invalidated entries are dropped: one path or a whole tree"
+    for path in [ "/x", "/x/y", "/xy" ]:
+      self.cache.put(path, path)
+    self.cache.invalidate("/xy")
+    self.cache.invalidate("/none")
+    self.assertIsNone(self.cache.get("/xy"))
+    self.cache.put("/xy", "/xy")
+    self.cache.invalidate_tree("/x")
+    self.assertIsNone(self.cache.get("/x"))
+    self.assertIsNone(self.cache.get("/x/y"))
+    self.assertEqual(self.cache.get("/xy"), "/xy")
+    self.cache.clear()
+    self.assertEqual(len(self.cache), 0)
+
+  def test_disabled(self):
+    "A cache of no entries holds nothing"
+    cache = lc.LookupCache(max_entries=0)
+    self.assertEqual(cache.put("/a", 1), 1)
+    self.assertIsNone(cache.get("/a"))
+
+
+if __name__ == "__main__":
+  suite = suite()
+  unittest.TextTestRunner(verbosity=2).run(suite)
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+#
+# Python code to unit test the Astrolabe report merging module.
+#   Written by: agent. 10/19/2026.
+#   Last Modified: Check that same-named files in different directories are kept apart.
+#
+import os
+import tempfile
+import unittest
+
+from context import mo                      # the module under test
+
+def suite():
+  suite = unittest.TestSuite()
+  suite.addTest(unittest.defaultTestLoader.loadTestsFromTestCase(MergeTestCase))
+  return suite
+
+
+class MergeTestCase(unittest.TestCase):
+
+  "Base test class"
+  @classmethod
+  def setUpClass(cls):
+    cls.report1 = [ "Filename: b.fits", "warning b1", "warning b2", "",
+                    "Filename: d.fits", "warning d1" ]
+    cls.report2 = [ "preamble line", "Filename: c.fits", "warning c1",
+                    "Filename: a.fits", "warning a1" ]
+
+  def setUp(self):
+    "Initialize the test case"
+    self.tmpdir = tempfile.TemporaryDirectory()
+    self.report_paths = []
+    for idx, report in enumerate([self.report1, self.report2]):
+      report_path = os.path.join(self.tmpdir.name, "shard{}.txt".format(idx+1))
+      with open(report_path, "w") as rfile:
+        rfile.write("\n".join(report))
+      self.report_paths.append(report_path)
+
+  def tearDown(self):
+    "Cleanup after the test case"
+    self.tmpdir.cleanup()
+
+
+  def test_read_report(self):
+    "Read a report into blocks of lines, one block per file"
+    blocks = mo.read_report(self.report_paths[0])
+    self.assertEqual(len(blocks), 2)
+    self.assertEqual(blocks[0], ["Filename: b.fits", "warning b1", "warning b2"])
+    self.assertEqual(blocks[1], ["Filename: d.fits", "warning d1"])
+
+  def test_read_report_preamble(self):
+    "Lines before the first file block are ignored"
+    blocks = mo.read_report(self.report_paths[1])
+    self.assertEqual(len(blocks), 2)
+    self.assertEqual(blocks[0][0], "Filename: c.fits")
+
+  def test_merge_reports_sorted(self):
+    "Merged report blocks are ordered by filename"
+    merged = mo.merge_reports([mo.read_report(rpath) for rpath in self.report_paths])
+    self.assertEqual([block[0] for block in merged],
+                     [ "Filename: a.fits", "Filename: b.fits",
+                       "Filename: c.fits", "Filename: d.fits" ])
+
+  def test_merge_reports_dups(self):
+    "A file reported more than once is only reported once"
+    report = mo.read_report(self.report_paths[0])
+    merged = mo.merge_reports([report, report])
+    self.assertEqual(merged, report)
+
+  def test_merge_reports_same_name(self):
+    "Files of the same name in different directories are each reported"
+    merged = mo.merge_reports([ [ [ "Filename: night1/a.fits", "warning 1" ] ],
+                                [ [ "Filename: night2/a.fits", "warning 2" ] ] ])
+    self.assertEqual([block[0] for block in merged],
+                     [ "Filename: night1/a.fits", "Filename: night2/a.fits" ])
+
+  def test_execute_merge(self):
+    "Merge several report files"
+    merged = mo.execute_merge({"report_paths": self.report_paths})
+    self.assertEqual(len(merged), 4)
+    self.assertTrue(all([type(block) == list for block in merged]))
+
+  def test_execute_merge_bad_path(self):
+    "Exits on a bad report path"
+    with self.assertRaises(SystemExit):
+      mo.execute_merge({"report_paths": ["NO_SUCH_REPORT"]})
+
+
+if __name__ == "__main__":
+  suite = suite()
+  unittest.TextTestRunner(verbosity=2).run(suite)
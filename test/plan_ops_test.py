@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+#
+# Python code to unit test the Astrolabe upload planning module.
+#   Written by: agent. 10/19/2026.
+#   Last Modified: Add test of counting metadata items in batches.
+#
+import os
+import unittest
+
+from context import po                      # the module under test
+
+def suite():
+  suite = unittest.TestSuite()
+  suite.addTest(unittest.defaultTestLoader.loadTestsFromTestCase(PlanTestCase))
+  return suite
+
+
+class PlanTestCase(unittest.TestCase):
+
+  "Base test class"
+  @classmethod
+  def setUpClass(cls):
+    cls.test_dir = "resources"
+    cls.test_dir_fits_count = 4
+    cls.test_dir_collections = 3            # resources, test3, test4
+    cls.test_file = "resources/m13.fits"
+
+
+  def test_plan_tree(self):
+    "Plan the upload of a tree of files without connecting to iRods"
+    plan = po.plan_tree(self.test_dir, { "ignore_keys": set(["COMMENT", "HISTORY"]) })
+    self.assertEqual(plan["files"], self.test_dir_fits_count)
+    self.assertEqual(plan["collections"], self.test_dir_collections)
+    self.assertEqual(plan["collection_creates"], 1) # only the deepest leaf is created
+    self.assertEqual(plan["metadata_files"], self.test_dir_fits_count)
+    self.assertGreater(plan["metadata_items"], 0)
+    self.assertEqual(plan["bytes"],
+                     sum([os.path.getsize(os.path.join(root, afile))
+                          for root, dirs, files in os.walk(self.test_dir)
+                          for afile in files if afile.endswith(".fits")]))
+
+  def test_plan_batches(self):
+    "Metadata items are counted the same, however many files are extracted at once"
+    options = { "ignore_keys": set(["COMMENT", "HISTORY"]) }
+    plan = po.plan_tree(self.test_dir, options)
+    batch_size = po._METADATA_BATCH_SIZE
+    try:
+      po._METADATA_BATCH_SIZE = 1
+      batched = po.plan_tree(self.test_dir, options)
+    finally:
+      po._METADATA_BATCH_SIZE = batch_size
+    self.assertEqual(batched["metadata_files"], plan["metadata_files"])
+    self.assertEqual(batched["metadata_items"], plan["metadata_items"])
+
+  def test_plan_upload_only(self):
+    "No metadata is planned when only uploading"
+    plan = po.plan_tree(self.test_dir, { "upload_only": True })
+    self.assertEqual(plan["metadata_files"], 0)
+    self.assertEqual(plan["metadata_items"], 0)
+
+  def test_plan_shard(self):
+    "A sharded plan covers only the files of the shard"
+    plans = [po.plan_tree(self.test_dir, { "upload_only": True, "shard": (idx, 2) })
+             for idx in range(1, 3)]
+    self.assertEqual(sum([plan["files"] for plan in plans]), self.test_dir_fits_count)
+
+  def test_estimate_time(self):
+    "Times are estimated from the given bandwidth, latency, and number of workers"
+    plan = { "collections": 2, "collection_creates": 2, "files": 10, "bytes": 1000,
+             "metadata_files": 10, "metadata_items": 100 }
+    est = po.estimate_time(plan, { "bandwidth": 100, "latency": 0.5, "jobs": 2 })
+    self.assertEqual(est["mkdir_time"], 1.0)
+    self.assertEqual(est["transfer_time"], 10.0)
+    self.assertEqual(est["latency_time"], (30 + 30) * 0.5 / 2)
+    self.assertEqual(est["wall_time"], 1.0 + 10.0 + 15.0)
+
+  def test_execute_plan(self):
+    "Report the plan for a single file"
+    lines = po.execute_plan({ "images_path": self.test_file, "upload_only": True })
+    self.assertEqual(lines[0], "Collections to create: 0 (in 0 requests)")
+    self.assertEqual(lines[1], "Files to transfer: 1")
+    self.assertTrue(lines[-1].startswith("Estimated wall time: "))
+
+  def test_format(self):
+    "Format byte counts and durations"
+    self.assertEqual(po.format_bytes(100), "100 B")
+    self.assertEqual(po.format_bytes(3 * 1024**3), "3.0 GiB")
+    self.assertEqual(po.format_seconds(3725), "1:02:05")
+
+
+if __name__ == "__main__":
+  suite = suite()
+  unittest.TextTestRunner(verbosity=2).run(suite)
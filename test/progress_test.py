@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+#
+# Python code to unit test the Astrolabe upload progress tracking class.
+#   Written by: agent. 10/19/2026.
+#   Last Modified: Test callbacks which fail or call back into the tracker.
+#
+import io
+import json
+import os
+import tempfile
+import unittest
+
+from context import pg                      # the module under test
+
+def suite():
+  suite = unittest.TestSuite()
+  suite.addTest(unittest.defaultTestLoader.loadTestsFromTestCase(ProgressTestCase))
+  return suite
+
+
+class FakeClock:
+  "Clock which advances by a fixed step each time it is read"
+  def __init__(self, step=1.0):
+    self.now = 0.0
+    self.step = step
+
+  def __call__(self):
+    self.now += self.step
+    return self.now
+
+
+class ProgressTestCase(unittest.TestCase):
+
+  def setUp(self):
+    "Initialize the test case"
+    self.events = []
+
+  def make_tracker(self, **kwargs):
+    return pg.ProgressTracker(4, 4000, callback=self.events.append, clock=FakeClock(), **kwargs)
+
+
+  def test_percentile(self):
+    "Percentiles are found by the nearest-rank method"
+    values = list(range(1, 101))
+    self.assertEqual(pg.percentile(values, 50), 50)
+    self.assertEqual(pg.percentile(values, 99), 99)
+    self.assertEqual(pg.percentile(values, 100), 100)
+    self.assertEqual(pg.percentile([3.0], 90), 3.0)
+    self.assertIsNone(pg.percentile([], 50))
+
+  def test_events(self):
+    "Start, file, and summary events are passed to the callback"
+    tracker = self.make_tracker()
+    tracker.file_done("a.fits", "t/a.fits", 1000, { "put": 1.0, "attach": 0.5 })
+    tracker.file_done("b.fits", "t/b.fits", 2000, { "put": 3.0 }, retries=2, ok=False)
+    tracker.finish()
+    self.assertEqual([event["event"] for event in self.events], ["start", "file", "file", "summary"])
+    self.assertEqual(self.events[1]["source"], "a.fits")
+    self.assertEqual(self.events[2]["retries"], 2)
+    self.assertFalse(self.events[2]["ok"])
+
+  def test_summary(self):
+    "The summary counts files, bytes, and retries, and gives phase percentiles"
+    tracker = self.make_tracker()
+    for idx in range(4):
+      tracker.file_done("f{}.fits".format(idx), "t", 1000, { "put": float(idx + 1) }, retries=idx)
+    summary = tracker.finish()
+    self.assertEqual(summary["files"], 4)
+    self.assertEqual(summary["bytes"], 4000)
+    self.assertEqual(summary["retries"], 6)
+    self.assertEqual(summary["phases"]["put"]["p50"], 2.0)
+    self.assertEqual(summary["phases"]["put"]["max"], 4.0)
+    self.assertNotIn("attach", summary["phases"])
+    lines = tracker.summary_lines(summary)
+    self.assertTrue(lines[0].startswith("Files: 4 (0 failed)"))
+    self.assertTrue(lines[2].startswith("Phase put: p50=2.000s"))
+
+  def test_events_file(self):
+    "Events are appended to the events file as JSON lines"
+    with tempfile.TemporaryDirectory() as tmpdir:
+      events_path = os.path.join(tmpdir, "events.jsonl")
+      with self.make_tracker(events_path=events_path) as tracker:
+        tracker.file_done("a.fits", "t/a.fits", 1000, { "put": 1.0 })
+        tracker.finish()
+      with open(events_path) as events_file:
+        records = [json.loads(line) for line in events_file]
+      self.assertEqual([rec["event"] for rec in records], ["start", "file", "summary"])
+      self.assertEqual(records[1]["phases"], { "put": 1.0 })
+
+  def test_display(self):
+    "A rolling progress line is displayed"
+    display = io.StringIO()
+    tracker = self.make_tracker(display=display)
+    tracker.file_done("a.fits", "t/a.fits", 1000, { "put": 1.0 })
+    tracker.finish()
+    self.assertTrue(display.getvalue().startswith("\r1/4 files"))
+    self.assertIn("ETA", display.getvalue())
+    self.assertTrue(display.getvalue().endswith("\n"))
+
+  def test_failing_callback(self):
+    "A failing callback does not fail the tracking of the run"
+    def callback(record):
+      raise RuntimeError("callback failed")
+    tracker = pg.ProgressTracker(1, 1000, callback=callback, clock=FakeClock())
+    tracker.file_done("a.fits", "a.fits", 1000, { "put": 0.5 })
+    self.assertEqual(tracker.finish()["files"], 1)
+
+  def test_reentrant_callback(self):
+    "A callback may call back into the tracker"
+    summaries = []
+    trackers = []                           # empty for the start event, sent during creation
+    def callback(record):
+      if (trackers):
+        summaries.append(trackers[0].summary())
+    trackers.append(pg.ProgressTracker(1, 1000, callback=callback, clock=FakeClock()))
+    trackers[0].file_done("a.fits", "a.fits", 1000, { "put": 0.5 })
+    self.assertEqual(len(summaries), 1)
+    self.assertEqual(summaries[0]["files"], 1)
+
+
+if __name__ == "__main__":
+  suite = suite()
+  unittest.TextTestRunner(verbosity=2).run(suite)
@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+#
+# Python code to unit test the Astrolabe iRods session pool class.
+#   Written by: agent. 10/19/2026.
+#   Last Modified: Initial creation.
+#
+import threading
+import time
+import unittest
+
+from context import sp                      # the module under test
+
+def suite():
+  suite = unittest.TestSuite()
+  suite.addTest(unittest.defaultTestLoader.loadTestsFromTestCase(SessionPoolTestCase))
+  return suite
+
+
+class FakeSession:
+  "Stand-in for an iRods session: records whether it has been cleaned up"
+  def __init__(self, num):
+    self.num = num
+    self.cleaned = False
+    self.healthy = True
+
+  def cleanup(self):
+    self.cleaned = True
+
+
+class ManualClock:
+  "Clock which only advances when told to"
+  def __init__(self):
+    self.now = 0.0
+
+  def __call__(self):
+    return self.now
+
+
+class SessionPoolTestCase(unittest.TestCase):
+
+  def setUp(self):
+    "Initialize the test case"
+    self.created = []
+    self.clock = ManualClock()
+
+  def factory(self):
+    session = FakeSession(len(self.created))
+    self.created.append(session)
+    return session
+
+  def make_pool(self, max_sessions=2):
+    return sp.SessionPool(self.factory, max_sessions=max_sessions, max_idle=100, check_after=10,
+                          health_fn=(lambda session: session.healthy), clock=self.clock)
+
+  def test_reuse(self):
+    "A returned session is handed out again instead of creating another"
+    pool = self.make_pool()
+    session = pool.acquire()
+    pool.release(session)
+    self.assertIs(pool.acquire(), session)
+    self.assertEqual(len(self.created), 1)
+    self.assertEqual(pool.size(), 1)
+
+  def test_bounded(self):
+    "No more than the maximum number of sessions is open: others wait for a free one"
+    pool = self.make_pool(max_sessions=1)
+    session = pool.acquire()
+    with self.assertRaises(TimeoutError):
+      pool.acquire(timeout=0)
+    got = []
+    waiter = threading.Thread(target=lambda: got.append(pool.acquire()))
+    waiter.start()
+    time.sleep(0.05)
+    self.assertEqual(got, [])
+    pool.release(session)
+    waiter.join(timeout=5)
+    self.assertEqual(got, [ session ])
+    self.assertEqual(len(self.created), 1)
+
+  def test_health_check(self):
+    "A broken session idle for a while is closed and replaced on checkout"
+    pool = self.make_pool()
+    session = pool.acquire()
+    pool.release(session)
+    session.healthy = False
+    self.clock.now = 5                      # not idle long enough to be checked
+    self.assertIs(pool.acquire(), session)
+    pool.release(session)
+    self.clock.now = 20
+    fresh = pool.acquire()
+    self.assertIsNot(fresh, session)
+    self.assertTrue(session.cleaned)
+    self.assertEqual(pool.size(), 1)
+
+  def test_idle_eviction(self):
+    "Sessions idle for too long are closed"
+    pool = self.make_pool()
+    first = pool.acquire()
+    second = pool.acquire()
+    pool.release(first)
+    self.clock.now = 50
+    pool.release(second)
+    self.clock.now = 120
+    self.assertIs(pool.acquire(), second)
+    self.assertTrue(first.cleaned)
+    self.assertFalse(second.cleaned)
+    self.assertEqual(pool.size(), 1)
+
+  def test_discard(self):
+    "A discarded session is closed and frees its place for a new one"
+    pool = self.make_pool(max_sessions=1)
+    session = pool.acquire()
+    pool.discard(session)
+    self.assertTrue(session.cleaned)
+    self.assertIsNot(pool.acquire(timeout=0), session)
+    self.assertEqual(len(self.created), 2)
+
+  def test_factory_failure(self):
+    "A session which cannot be created does not take up a place"
+    pool = sp.SessionPool(lambda: 1 / 0, max_sessions=1)
+    with self.assertRaises(ZeroDivisionError):
+      pool.acquire()
+    self.assertEqual(pool.size(), 0)
+
+  def test_close(self):
+    "Closing the pool closes its idle sessions, and those returned later"
+    with self.make_pool() as pool:
+      idle = pool.acquire()
+      busy = pool.acquire()
+      pool.release(idle)
+    self.assertTrue(idle.cleaned)
+    self.assertFalse(busy.cleaned)
+    pool.release(busy)
+    self.assertTrue(busy.cleaned)
+    self.assertEqual(pool.size(), 0)
+    with self.assertRaises(RuntimeError):
+      pool.acquire()
+
+  def test_threads(self):
+    "Many threads share the sessions of the pool safely"
+    pool = self.make_pool(max_sessions=3)
+    in_use = set()
+    lock = threading.Lock()
+    errors = []
+
+    def work():
+      for _ in range(50):
+        session = pool.acquire()
+        with lock:
+          if (session.num in in_use):
+            errors.append(session.num)
+          in_use.add(session.num)
+        with lock:
+          in_use.discard(session.num)
+        pool.release(session)
+
+    threads = [ threading.Thread(target=work) for _ in range(8) ]
+    for thread in threads:
+      thread.start()
+    for thread in threads:
+      thread.join(timeout=10)
+    self.assertEqual(errors, [])
+    self.assertLessEqual(len(self.created), 3)
+
+
+if __name__ == "__main__":
+  suite = suite()
+  unittest.TextTestRunner(verbosity=2).run(suite)
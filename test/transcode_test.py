@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+#
+# Python code to unit test the Astrolabe upload transcoding module.
+#   Written by: agent. 10/19/2026.
+#   Last Modified: Initial creation.
+#
+import gzip
+import unittest
+
+from context import tc                      # the module under test
+
+def suite():
+  suite = unittest.TestSuite()
+  suite.addTest(unittest.defaultTestLoader.loadTestsFromTestCase(TranscodeTestCase))
+  return suite
+
+
+class TranscodeTestCase(unittest.TestCase):
+
+  "Base test class"
+  @classmethod
+  def setUpClass(cls):
+    cls.test_file = "resources/m13.fits"
+    with open(cls.test_file, "rb") as fits_file:
+      cls.file_bytes = fits_file.read()
+
+  def chunked(self, data, chunk_size=1000):
+    return [data[start:start + chunk_size] for start in range(0, len(data), chunk_size)]
+
+
+  def test_gzip_chunks(self):
+    "Gzipped chunks decompress to the original bytes"
+    gzipped = b"".join(tc.gzip_chunks(self.chunked(self.file_bytes)))
+    self.assertLess(len(gzipped), len(self.file_bytes))
+    self.assertEqual(gzip.decompress(gzipped), self.file_bytes)
+
+  def test_gunzip_chunks(self):
+    "Gunzipped chunks are the original bytes"
+    gzipped = gzip.compress(self.file_bytes)
+    self.assertEqual(b"".join(tc.gunzip_chunks(self.chunked(gzipped, 100))), self.file_bytes)
+
+  def test_gunzip_chunks_members(self):
+    "Concatenated gzip members are all decompressed"
+    gzipped = gzip.compress(self.file_bytes[:5000]) + gzip.compress(self.file_bytes[5000:])
+    self.assertEqual(b"".join(tc.gunzip_chunks(self.chunked(gzipped, 700))), self.file_bytes)
+
+  def test_transcoder_for(self):
+    "Transcodings apply only to files in the form they convert from"
+    self.assertIs(tc.transcoder_for("a.fits", { "transcode": "gzip" }), tc.gzip_chunks)
+    self.assertIsNone(tc.transcoder_for("a.fits.gz", { "transcode": "gzip" }))
+    self.assertIs(tc.transcoder_for("a.fits.gz", { "transcode": "gunzip" }), tc.gunzip_chunks)
+    self.assertIsNone(tc.transcoder_for("a.fits", { "transcode": "gunzip" }))
+    self.assertIsNone(tc.transcoder_for("a.fits", {}))
+
+  def test_transcoded_path(self):
+    "Transcoded files are renamed to match"
+    self.assertEqual(tc.transcoded_path("d/a.fits", { "transcode": "gzip" }), "d/a.fits.gz")
+    self.assertEqual(tc.transcoded_path("d/a.fits.gz", { "transcode": "gunzip" }), "d/a.fits")
+    self.assertEqual(tc.transcoded_path("d/a.fits.gz", { "transcode": "gzip" }), "d/a.fits.gz")
+    self.assertEqual(tc.transcoded_path("d/a.fits", {}), "d/a.fits")
+
+
+if __name__ == "__main__":
+  suite = suite()
+  unittest.TextTestRunner(verbosity=2).run(suite)
@@ -0,0 +1,216 @@
+#!/usr/bin/env python3
+#
+# Python code to unit test the Astrolabe concurrent upload engine.
+#   Written by: agent. 10/19/2026.
+#   Last Modified: Test the reporting of concurrency tuning decisions.
+#
+import contextlib
+import io
+import random
+import threading
+import time
+import unittest
+
+from context import ue                      # the module under test
+
+def suite():
+  suite = unittest.TestSuite()
+  suite.addTest(unittest.defaultTestLoader.loadTestsFromTestCase(EngineTestCase))
+  suite.addTest(unittest.defaultTestLoader.loadTestsFromTestCase(TunerTestCase))
+  return suite
+
+
+def prepare_fn(source_file, options):
+  "Preparation function: must be at module level to be run in another process"
+  if (source_file == options.get("bad_file")):
+    raise ValueError("cannot prepare {}".format(source_file))
+  return source_file.upper()
+
+
+class FakeHelper:
+  "Stand-in for an iRods helper: records whether it has been cleaned up"
+  def __init__(self):
+    self.cleaned = False
+
+  def cleanup(self):
+    self.cleaned = True
+
+
+class EngineTestCase(unittest.TestCase):
+
+  def setUp(self):
+    "Initialize the test case"
+    self.helpers = []
+    self.lock = threading.Lock()
+    self.pairs = [ ("src{}.fits".format(idx), "tgt{}.fits".format(idx)) for idx in range(25) ]
+
+  def make_helper(self):
+    helper = FakeHelper()
+    with self.lock:
+      self.helpers.append(helper)
+    return helper
+
+  def slow_file_fn(self, ihelper, source_file, to_path, options):
+    time.sleep(random.uniform(0, 0.01))     # finish out of order
+    return (source_file, to_path, ihelper)
+
+
+  def test_run_ordered(self):
+    "Results are returned in the order of the input pairs"
+    engine = ue.UploadEngine(self.slow_file_fn, self.make_helper, {}, jobs=4)
+    results = engine.run(self.pairs)
+    self.assertEqual(len(results), len(self.pairs))
+    self.assertEqual([res[:2] for res in results], self.pairs)
+
+  def test_run_sessions(self):
+    "Each worker gets its own helper, which is cleaned up at the end"
+    engine = ue.UploadEngine(self.slow_file_fn, self.make_helper, {}, jobs=4)
+    results = engine.run(self.pairs)
+    self.assertEqual(len(self.helpers), 4)
+    self.assertTrue(all([helper.cleaned for helper in self.helpers]))
+    self.assertTrue(set([res[2] for res in results]) <= set(self.helpers))
+
+  def test_run_few_files(self):
+    "No more workers are started than there are files"
+    engine = ue.UploadEngine(self.slow_file_fn, self.make_helper, {}, jobs=8)
+    results = engine.run(self.pairs[:2])
+    self.assertEqual(len(results), 2)
+    self.assertEqual(len(self.helpers), 2)
+
+  def test_run_empty(self):
+    "Running with no files does nothing"
+    engine = ue.UploadEngine(self.slow_file_fn, self.make_helper, {}, jobs=4)
+    self.assertEqual(engine.run([]), [])
+
+  def test_run_error(self):
+    "An exception from the file function is re-raised after the workers finish"
+    def bad_file_fn(ihelper, source_file, to_path, options):
+      if (source_file == "src3.fits"):
+        raise IOError("upload failed")
+      return True
+    engine = ue.UploadEngine(bad_file_fn, self.make_helper, {}, jobs=3)
+    with self.assertRaises(IOError):
+      engine.run(self.pairs)
+    self.assertTrue(all([helper.cleaned for helper in self.helpers]))
+
+  def test_run_helper_error(self):
+    "An exception creating a worker helper is re-raised without hanging"
+    def bad_helper_fn():
+      raise ConnectionError("no iRods")
+    engine = ue.UploadEngine(self.slow_file_fn, bad_helper_fn, {}, jobs=2)
+    with self.assertRaises(ConnectionError):
+      engine.run(self.pairs)
+
+  def test_pipeline_ordered(self):
+    "Prepared results are passed to the file function, and returned in input order"
+    def file_fn(ihelper, source_file, to_path, options, prepared):
+      time.sleep(random.uniform(0, 0.005))
+      return (source_file, prepared)
+    engine = ue.UploadEngine(file_fn, self.make_helper, {}, jobs=3,
+                             prepare_fn=prepare_fn, prepare_jobs=2)
+    results = engine.run(self.pairs)
+    self.assertEqual(results, [ (src, src.upper()) for src, tgt in self.pairs ])
+    self.assertTrue(all([helper.cleaned for helper in self.helpers]))
+
+  def test_pipeline_error(self):
+    "An exception from the preparation function is re-raised after the workers finish"
+    def file_fn(ihelper, source_file, to_path, options, prepared):
+      return True
+    engine = ue.UploadEngine(file_fn, self.make_helper, { "bad_file": "src5.fits" }, jobs=2,
+                             prepare_fn=prepare_fn, prepare_jobs=2)
+    with self.assertRaises(ValueError):
+      engine.run(self.pairs)
+
+  def test_run_adaptive(self):
+    "No more uploads are active at once than the tuned limit"
+    active = [0, 0]                         # current and maximum number of active uploads
+    def file_fn(ihelper, source_file, to_path, options):
+      with self.lock:
+        active[0] += 1
+        active[1] = max(active[1], active[0])
+      time.sleep(0.002)
+      with self.lock:
+        active[0] -= 1
+      return True
+    engine = ue.UploadEngine(file_fn, self.make_helper, {}, jobs=4, adaptive=True, min_jobs=1)
+    engine._tuner = ue.ConcurrencyTuner(1, 2, window=100) # hold the limit at 1
+    self.assertEqual(engine.run(self.pairs), [True] * len(self.pairs))
+    self.assertEqual(active[1], 1)
+
+
+class FakeClock:
+  "Clock which advances by a fixed step each time it is read"
+  def __init__(self, step=1.0):
+    self.now = 0.0
+    self.step = step
+
+  def __call__(self):
+    self.now += self.step
+    return self.now
+
+
+class TunerTestCase(unittest.TestCase):
+
+  def make_tuner(self, min_limit=1, max_limit=8, verbose=False):
+    return ue.ConcurrencyTuner(min_limit, max_limit, window=2, clock=FakeClock(), verbose=verbose)
+
+  def run_window(self, tuner, latency=0.1, nbytes=100, ok=True):
+    tuner.record(latency, nbytes, ok)
+    return tuner.record(latency, nbytes, ok)
+
+
+  def test_starts_at_min(self):
+    "The limit starts at the minimum"
+    self.assertEqual(self.make_tuner(min_limit=3).limit(), 3)
+
+  def test_additive_increase(self):
+    "The limit rises by one per good window, up to the maximum"
+    tuner = self.make_tuner(max_limit=3)
+    limits = [self.run_window(tuner, nbytes=100 * (idx + 1)) for idx in range(4)]
+    self.assertEqual(limits, [2, 3, 3, 3])
+
+  def test_decrease_on_failure(self):
+    "The limit is halved, but not below the minimum, after a failure"
+    tuner = self.make_tuner(min_limit=2)
+    for idx in range(4):
+      self.run_window(tuner, nbytes=100 * (idx + 1))
+    self.assertEqual(tuner.limit(), 6)
+    self.assertEqual(self.run_window(tuner, nbytes=1000, ok=False), 3)
+    self.assertEqual(self.run_window(tuner, nbytes=1000, ok=False), 2)
+
+  def test_decrease_on_latency(self):
+    "The limit is halved when latency grows well beyond the best seen"
+    tuner = self.make_tuner()
+    for idx in range(3):
+      self.run_window(tuner, nbytes=100 * (idx + 1))
+    self.assertEqual(tuner.limit(), 4)
+    self.assertEqual(self.run_window(tuner, latency=0.5, nbytes=1000), 2)
+
+  def test_decrease_on_throughput(self):
+    "The limit is halved when throughput falls after an increase"
+    tuner = self.make_tuner()
+    for idx in range(3):
+      self.run_window(tuner, nbytes=100 * (idx + 1))
+    self.assertEqual(self.run_window(tuner, nbytes=10), 2)
+
+  def test_verbose(self):
+    "Changes of the limit, and only changes, are reported in verbose mode"
+    out = io.StringIO()
+    with contextlib.redirect_stdout(out):
+      tuner = self.make_tuner(max_limit=2, verbose=True)
+      for idx in range(3):
+        self.run_window(tuner, nbytes=100 * (idx + 1))
+      self.run_window(tuner, nbytes=1000, ok=False)
+    lines = out.getvalue().splitlines()
+    self.assertEqual(len(lines), 2)
+    self.assertTrue(lines[0].startswith("Concurrency 1 -> 2: "))
+    self.assertEqual(lines[1], "Concurrency 2 -> 1: failures")
+    out = io.StringIO()
+    with contextlib.redirect_stdout(out):
+      self.run_window(self.make_tuner(), nbytes=100)
+    self.assertEqual(out.getvalue(), "")
+
+
+if __name__ == "__main__":
+  suite = suite()
+  unittest.TextTestRunner(verbosity=2).run(suite)
@@ -2,20 +2,39 @@
 #
 # Python code to unit test the Astrolabe FITS Operations module.
 #   Written by: Tom Hicks. 7/25/2018.
-#   Last Modified: Update tests for VO metadata additions.
+#   Last Modified: Test that workers share the sessions of a pool, one file at a time.
 #
+import contextlib
+import gzip
+import io
 import os
+import shutil
+import tempfile
+import threading
+import time
 import unittest
 from astropy.io import fits
+from irods.exception import NetworkException
 
 from context import fm
 from context import ih
+from context import sp
 from context import up                      # the module under test
+from context import utils
+from astrolabe_py import Metadatum
 
 def suite():
   suite = unittest.TestSuite()
   suite.addTest(unittest.defaultTestLoader.loadTestsFromTestCase(FileTestCase))
   suite.addTest(unittest.defaultTestLoader.loadTestsFromTestCase(MetadataTestCase))
+  suite.addTest(unittest.defaultTestLoader.loadTestsFromTestCase(ShardTestCase))
+  suite.addTest(unittest.defaultTestLoader.loadTestsFromTestCase(SyncTestCase))
+  suite.addTest(unittest.defaultTestLoader.loadTestsFromTestCase(TransferTestCase))
+  suite.addTest(unittest.defaultTestLoader.loadTestsFromTestCase(RetryTestCase))
+  suite.addTest(unittest.defaultTestLoader.loadTestsFromTestCase(TeeTestCase))
+  suite.addTest(unittest.defaultTestLoader.loadTestsFromTestCase(ScheduleTestCase))
+  suite.addTest(unittest.defaultTestLoader.loadTestsFromTestCase(MetadataOnlyTestCase))
+  suite.addTest(unittest.defaultTestLoader.loadTestsFromTestCase(PooledTestCase))
   return suite
 
 
@@ -31,7 +50,7 @@ class ULTestCase(unittest.TestCase):
     cls.empty_dir = "resources/empty_dir"
     cls.empty2_dir = "resources/test2"
     cls.test_fileB = "resources/cvnidwabcut.fits"
-    cls.test_fileB_md_count = 66            # 55 native + 11 generated entries
+    cls.test_fileB_md_count = 71            # 55 native + 16 generated entries
     cls.test_fileB_hist_count = 2           # 2 HISTORY entries (often filtered out)
     cls.test_file = "resources/m13.fits"
     cls.test_file_md_count = 27             # 23 native + 7 generated entries
@@ -179,6 +198,454 @@ class MetadataTestCase(ULTestCase):
     self.assertEqual(len(md), self.test_file_md_count)
 
 
+class ShardTestCase(ULTestCase):
+
+  def test_parse_shard(self):
+    "Parse a valid shard specification"
+    self.assertEqual(utils.parse_shard("1/8"), (1, 8))
+    self.assertEqual(utils.parse_shard("8/8"), (8, 8))
+
+  def test_parse_shard_bad(self):
+    "Throws exception on invalid shard specifications"
+    for spec in [ "", "1", "0/8", "9/8", "1/0", "a/b", "1/2/3" ]:
+      with self.assertRaises(ValueError):
+        utils.parse_shard(spec)
+
+  def test_in_shard_none(self):
+    "Every path is in the shard when no shard is given"
+    self.assertTrue(utils.in_shard("any/path.fits"))
+    self.assertTrue(utils.in_shard("any/path.fits", None))
+
+  def test_in_shard_stable(self):
+    "A path is in exactly one shard"
+    for path in [ "a.fits", "test3/m13-3.fits", "test3/test4/m13-4.fits" ]:
+      shards = [idx for idx in range(1, 9) if utils.in_shard(path, (idx, 8))]
+      self.assertEqual(len(shards), 1)
+
+  def test_source_paths_sharded(self):
+    "The shards of the source paths partition the full set of source paths"
+    all_paths = up.get_source_paths(self.test_dir, self.default_options)
+    self.assertEqual(len(all_paths), self.test_dir_fits_count)
+    shard_paths = [up.get_source_paths(self.test_dir, { "shard": (idx, 3) })
+                   for idx in range(1, 4)]
+    self.assertEqual(sum([len(paths) for paths in shard_paths]), len(all_paths))
+    self.assertEqual(sorted([path for paths in shard_paths for path in paths]),
+                     sorted(all_paths))
+
+
+
+class StatsHelper:
+  "Stand-in for an iRods helper which knows the sizes and checksums of remote files"
+  def __init__(self, stats):
+    self.stats = stats
+    self.queried = []
+
+  def abs_path(self, path):
+    return "/zone/home/user/astrolabe/{}".format(path)
+
+  def get_file_stats(self, dir_path, absolute=False):
+    self.queried.append(dir_path)
+    return self.stats
+
+
+class SyncTestCase(ULTestCase):
+
+  def test_file_checksum_md5(self):
+    "Local checksums are MD5 hex digests by default"
+    checksum = utils.file_checksum(self.test_file)
+    self.assertEqual(len(checksum), 32)
+    self.assertEqual(checksum, utils.file_checksum(self.test_file, like="0123abcd"))
+
+  def test_file_checksum_sha2(self):
+    "Local checksums are SHA-256 in iRods form when the remote checksum is"
+    checksum = utils.file_checksum(self.test_file, like="sha2:AAAA")
+    self.assertTrue(checksum.startswith("sha2:"))
+    self.assertNotEqual(checksum, utils.file_checksum(self.test_file))
+
+  def test_find_unchanged(self):
+    "Only files with the same size and checksum in iRods are unchanged"
+    pairs = [ (self.test_file, "res/m13.fits"), (self.test_fileB, "res/cvn.fits"),
+              (self.test_file, "res/sub/m13.fits"), (self.test_file, "res/sub/new.fits"),
+              (self.test_file, "res/sub/nosum.fits") ]
+    size = os.path.getsize(self.test_file)
+    sha2 = utils.file_checksum(self.test_file, like="sha2:")
+    ihelper = StatsHelper({
+      "/zone/home/user/astrolabe/res/m13.fits": (size, utils.file_checksum(self.test_file)),
+      "/zone/home/user/astrolabe/res/cvn.fits": (size, "0123abcd"), # size differs
+      "/zone/home/user/astrolabe/res/sub/m13.fits": (size, sha2),
+      "/zone/home/user/astrolabe/res/sub/nosum.fits": (size, None) })
+    self.assertEqual(up.find_unchanged(ihelper, pairs, self.default_options), { 0, 2 })
+    self.assertEqual(ihelper.queried, [ "res" ])
+
+  def test_find_unchanged_changed(self):
+    "A file with the same size but a different checksum is changed"
+    pairs = [ (self.test_file, "m13.fits") ]
+    ihelper = StatsHelper({ "/zone/home/user/astrolabe/m13.fits":
+                            (os.path.getsize(self.test_file), "0123abcd") })
+    self.assertEqual(up.find_unchanged(ihelper, pairs, self.default_options), set())
+
+  def test_find_unchanged_empty(self):
+    "Nothing is unchanged, nor queried, when there are no files"
+    ihelper = StatsHelper({})
+    self.assertEqual(up.find_unchanged(ihelper, [], self.default_options), set())
+    self.assertEqual(ihelper.queried, [])
+
+
+
+class TransferTestCase(ULTestCase):
+
+  def test_parse_size(self):
+    "Parse byte sizes with and without unit suffixes"
+    self.assertEqual(utils.parse_size("4096"), 4096)
+    self.assertEqual(utils.parse_size("64k"), 64 * 1024)
+    self.assertEqual(utils.parse_size("64M"), 64 * 1024**2)
+    self.assertEqual(utils.parse_size("1.5GB"), 3 * 512 * 1024**2)
+    self.assertEqual(utils.parse_size("2T"), 2 * 1024**4)
+
+  def test_parse_size_bad(self):
+    "Throws exception on invalid byte sizes"
+    for spec in [ "", "M", "0", "-1K", "64X", "lots", "inf", "-inf", "infG", "nan", "NaNM" ]:
+      with self.assertRaises(ValueError):
+        utils.parse_size(spec)
+
+  def test_transfer_threads_small(self):
+    "Files no larger than the threshold are sent in a single stream"
+    self.assertEqual(up.transfer_threads(1024, self.default_options), 1)
+    self.assertEqual(up.transfer_threads(100, { "parallel_threshold": 100 }), 1)
+
+  def test_transfer_threads_large(self):
+    "Large files are sent over up to the maximum number of streams"
+    options = { "parallel_threshold": 100, "transfer_threads": 8, "chunk_size": 100 }
+    self.assertEqual(up.transfer_threads(101, options), 2)
+    self.assertEqual(up.transfer_threads(300, options), 3)
+    self.assertEqual(up.transfer_threads(20000, options), 8)
+    self.assertEqual(up.transfer_threads(20 * 1024**3, self.default_options),
+                     up._DEFAULT_TRANSFER_THREADS)
+
+
+
+class FlakyHelper:
+  "Stand-in for an iRods helper whose uploads fail a given number of times"
+  def __init__(self, failures, error=ConnectionError):
+    self.failures = failures
+    self.error = error
+    self.puts = 0
+    self.reconnects = 0
+
+  def put_file(self, local_file, file_path, absolute=False, checksum=False, num_threads=0,
+               tee=None, transform=None):
+    self.puts += 1
+    if (self.puts <= self.failures):
+      raise self.error("connection reset")
+
+  def reconnect(self):
+    self.reconnects += 1
+
+
+class RetryTestCase(ULTestCase):
+
+  def setUp(self):
+    "Initialize the test case"
+    self.options = { "upload_only": True, "retries": 2, "retry_delay": 0 }
+
+  def test_backoff_delay(self):
+    "Backoff delays are jittered, doubled for each retry, and capped"
+    options = { "retry_delay": 1.0 }
+    for attempt in range(4):
+      self.assertTrue(0 <= up.backoff_delay(attempt, options) <= 2 ** attempt)
+    self.assertTrue(up.backoff_delay(20, options) <= up._MAX_RETRY_DELAY)
+    self.assertEqual(up.backoff_delay(3, { "retry_delay": 0 }), 0)
+
+  def test_retry_call(self):
+    "A failing operation is retried after reconnecting"
+    ihelper = FlakyHelper(2)
+    up.retry_call(ihelper, self.options, ihelper.put_file, self.test_file, "m13.fits")
+    self.assertEqual(ihelper.puts, 3)
+    self.assertEqual(ihelper.reconnects, 2)
+
+  def test_retry_call_exhausted(self):
+    "The last failure is raised once the retries are exhausted"
+    ihelper = FlakyHelper(3)
+    with self.assertRaises(ConnectionError):
+      up.retry_call(ihelper, self.options, ihelper.put_file, self.test_file, "m13.fits")
+    self.assertEqual(ihelper.puts, 3)
+
+  def test_retry_call_not_connection(self):
+    "A failure other than of the connection is raised without retrying"
+    ihelper = FlakyHelper(1, error=ValueError)
+    with self.assertRaises(ValueError):
+      up.retry_call(ihelper, self.options, ihelper.put_file, self.test_file, "m13.fits")
+    self.assertEqual(ihelper.puts, 1)
+    self.assertEqual(ihelper.reconnects, 0)
+
+  def test_retry_call_verbose(self):
+    "Retries are reported in verbose mode"
+    ihelper = FlakyHelper(1, error=NetworkException)
+    out = io.StringIO()
+    with contextlib.redirect_stdout(out):
+      up.retry_call(ihelper, dict(self.options, verbose=True), ihelper.put_file,
+                    self.test_file, "m13.fits")
+    self.assertEqual(ihelper.puts, 2)
+    self.assertIn("Retrying put_file", out.getvalue())
+
+  def test_do_file_fails(self):
+    "A file which keeps failing is not processed"
+    self.assertFalse(up.do_file(FlakyHelper(3), self.test_file, "m13.fits", self.options))
+    self.assertTrue(up.do_file(FlakyHelper(2), self.test_file, "m13.fits", self.options))
+
+  def test_dead_letters(self):
+    "Files which keep failing are reported in the dead-letter file"
+    with tempfile.TemporaryDirectory() as tmpdir:
+      options = dict(self.options, retries=0)
+      options["dead_letter"] = os.path.join(tmpdir, "dead.txt")
+      pairs = [ (self.test_file, "m13.fits"), (self.test_fileB, "cvn.fits") ]
+      results = up.upload_pairs(FlakyHelper(1), pairs, options)
+      self.assertEqual(results, [ False, True ])
+      with open(options["dead_letter"]) as dead_letters:
+        self.assertEqual(dead_letters.read().splitlines(), [ self.test_file ])
+
+
+
+class TeeHelper:
+  "Stand-in for an iRods helper which streams uploads through a tee and records metadata"
+  def __init__(self):
+    self.metadata = None
+    self.sent = None
+
+  def put_file(self, local_file, file_path, absolute=False, checksum=False, num_threads=0,
+               tee=None, transform=None):
+    with open(local_file, "rb") as src:
+      chunks = list(iter(lambda: src.read(1000), b""))
+    for chunk in chunks:
+      if (tee):
+        tee(chunk)
+    self.sent = b"".join(transform(chunks) if transform else chunks)
+    return bool(tee)
+
+  def put_metaf(self, metadata, file_path, absolute=False):
+    self.metadata = metadata
+
+
+class GrowingHelper(TeeHelper):
+  "Stand-in for an iRods helper during whose upload the local file is appended to"
+  def put_file(self, local_file, file_path, **kwargs):
+    result = super().put_file(local_file, file_path, **kwargs)
+    with open(local_file, "ab") as src:
+      src.write(b"more data")
+    return result
+
+
+class TeeTestCase(ULTestCase):
+
+  def test_do_file_teed(self):
+    "Metadata extracted from the upload stream is the same as from the file"
+    options = { "ignore_keys": self.ignored_keys }
+    ihelper = TeeHelper()
+    self.assertTrue(up.do_file(ihelper, self.test_fileB, "cvn.fits", options))
+    self.assertEqual(ihelper.metadata, up.extract_metadata(self.test_fileB, options))
+
+  def test_do_file_gzip(self):
+    "A gzipped upload keeps the metadata of the uncompressed header"
+    options = { "ignore_keys": self.ignored_keys, "transcode": "gzip" }
+    ihelper = TeeHelper()
+    self.assertTrue(up.do_file(ihelper, self.test_fileB, "cvn.fits.gz", options))
+    with open(self.test_fileB, "rb") as src:
+      self.assertEqual(gzip.decompress(ihelper.sent), src.read())
+    self.assertEqual(ihelper.metadata, up.extract_metadata(self.test_fileB, options))
+
+  def test_progress_vanished(self):
+    "A file which vanished fails alone, with its progress reported"
+    events = []
+    progress = up.ProgressTracker(1, 0, callback=events.append)
+    options = { "ignore_keys": self.ignored_keys, "retries": 0 }
+    self.assertFalse(up.do_file(TeeHelper(), "resources/vanished.fits", "vanished.fits", options,
+                                progress=progress))
+    self.assertEqual(events[-1]["bytes"], 0)
+    self.assertFalse(events[-1]["ok"])
+
+  def test_journal_changed_during_upload(self):
+    "A file changed during its upload is journaled as it was, so it is not taken as done"
+    with tempfile.TemporaryDirectory() as tmpdir:
+      source = shutil.copy(self.test_fileB, tmpdir)
+      with up.UploadJournal(os.path.join(tmpdir, "journal.jsonl")) as journal:
+        file_fn = up.make_file_fn(journal)
+        self.assertTrue(file_fn(GrowingHelper(), source, "cvn.fits", { "upload_only": True }))
+        self.assertEqual(len(journal), 1)
+        self.assertFalse(journal.is_done(source, "cvn.fits"))
+
+  def test_progress_events(self):
+    "Progress events report the phases of each file"
+    events = []
+    options = { "ignore_keys": self.ignored_keys }
+    pairs = [ (self.test_file, "m13.fits"), (self.test_fileB, "cvn.fits") ]
+    self.assertEqual(up.upload_pairs(TeeHelper(), pairs, options, events.append), [True, True])
+    self.assertEqual([event["event"] for event in events], ["start", "file", "file", "summary"])
+    self.assertEqual(set(events[1]["phases"].keys()), set(["put", "extract", "attach"]))
+    self.assertEqual(events[2]["bytes"], os.path.getsize(self.test_fileB))
+    self.assertEqual(events[-1]["files"], 2)
+
+  def test_progress_retries(self):
+    "Progress events count the retries of each file"
+    events = []
+    options = { "upload_only": True, "retries": 2, "retry_delay": 0 }
+    up.upload_pairs(FlakyHelper(1), [ (self.test_file, "m13.fits") ], options, events.append)
+    self.assertEqual(events[1]["retries"], 1)
+    self.assertTrue(events[1]["ok"])
+
+  def test_target_paths_transcoded(self):
+    "Target paths are renamed for the transcoding"
+    suffix_paths = [ "res/a.fits", "res/b.fits.gz" ]
+    self.assertEqual(up.make_target_paths(suffix_paths, { "transcode": "gzip" }),
+                     [ "res/a.fits.gz", "res/b.fits.gz" ])
+    self.assertEqual(up.make_target_paths(suffix_paths, { "transcode": "gunzip" }),
+                     [ "res/a.fits", "res/b.fits" ])
+    self.assertEqual(up.make_target_paths(suffix_paths, {}), suffix_paths)
+
+
+
+class ScheduleTestCase(ULTestCase):
+
+  def setUp(self):
+    "Initialize the test case"
+    self.pairs = [ (path, path) for path in up.get_source_paths(self.test_dir, self.default_options) ]
+    self.todo = list(range(len(self.pairs)))
+
+  def sizes(self, todo):
+    return [os.path.getsize(self.pairs[idx][0]) for idx in todo]
+
+  def test_schedule_walk(self):
+    "By default, files are uploaded in the order found"
+    self.assertEqual(up.schedule_todo(self.pairs, self.todo, self.default_options), self.todo)
+    self.assertEqual(up.schedule_todo(self.pairs, self.todo, { "schedule": "walk" }), self.todo)
+
+  def test_schedule_largest(self):
+    "Largest files are uploaded first"
+    todo = up.schedule_todo(self.pairs, self.todo, { "schedule": "largest" })
+    self.assertEqual(sorted(todo), self.todo)
+    self.assertEqual(self.sizes(todo), sorted(self.sizes(self.todo), reverse=True))
+
+  def test_schedule_smallest(self):
+    "Smallest files are uploaded first, only the given files are scheduled"
+    todo = up.schedule_todo(self.pairs, self.todo[1:], { "schedule": "smallest" })
+    self.assertEqual(sorted(todo), self.todo[1:])
+    self.assertEqual(self.sizes(todo), sorted(self.sizes(self.todo[1:])))
+
+  def test_schedule_locality(self):
+    "Files of the same directory are uploaded together, in directory order"
+    pairs = list(reversed(self.pairs))
+    todo = up.schedule_todo(pairs, self.todo, { "schedule": "locality" })
+    paths = [pairs[idx][0] for idx in todo]
+    self.assertEqual(paths, sorted(paths, key=os.path.split))
+
+
+class MetaOnlyHelper(TeeHelper):
+  "Stand-in for an iRods helper holding already uploaded files with the given metadata"
+  def __init__(self, current):
+    super().__init__()
+    self.current = current
+    self.puts = 0
+
+  def put_file(self, local_file, file_path, absolute=False, checksum=False, num_threads=0,
+               tee=None, transform=None):
+    self.puts += 1
+
+  def get_metaf(self, file_path, absolute=False):
+    if (self.current is None):
+      raise FileNotFoundError(file_path)
+    return [Metadatum(item.keyword, str(item.value)) for item in self.current]
+
+
+class MetadataOnlyTestCase(ULTestCase):
+
+  def setUp(self):
+    "Initialize the test case"
+    self.options = { "ignore_keys": self.ignored_keys, "metadata_only": True,
+                     "retries": 2, "retry_delay": 0 }
+
+  def test_metadata_matches(self):
+    "Metadata matches when each key has the same set of string values"
+    current = [ Metadatum("a", "1"), Metadatum("b", "x"), Metadatum("c", "old") ]
+    self.assertTrue(up.metadata_matches(current, [ Metadatum("a", 1), Metadatum("b", "x") ]))
+    self.assertFalse(up.metadata_matches(current, [ Metadatum("a", 2) ]))
+    self.assertFalse(up.metadata_matches(current, [ Metadatum("d", "new") ]))
+    self.assertFalse(up.metadata_matches(current, [ Metadatum("a", 1), Metadatum("a", 3) ]))
+    self.assertTrue(up.metadata_matches(current, []))
+
+  def test_do_file_metadata_only(self):
+    "Metadata is attached to the uploaded file, which is not uploaded again"
+    ihelper = MetaOnlyHelper([ Metadatum("SIMPLE", "F") ])
+    self.assertTrue(up.do_file(ihelper, self.test_fileB, "cvn.fits", self.options))
+    self.assertEqual(ihelper.puts, 0)
+    self.assertEqual(ihelper.metadata, up.extract_metadata(self.test_fileB, self.options))
+
+  def test_do_file_metadata_unchanged(self):
+    "Metadata which already matches is not attached again"
+    ihelper = MetaOnlyHelper(up.extract_metadata(self.test_fileB, self.options))
+    self.assertTrue(up.do_file(ihelper, self.test_fileB, "cvn.fits", self.options))
+    self.assertEqual(ihelper.puts, 0)
+    self.assertIsNone(ihelper.metadata)
+
+  def test_do_file_not_uploaded(self):
+    "A file which was never uploaded fails at once, without retries"
+    events = []
+    progress = up.ProgressTracker(1, 0, callback=events.append)
+    ihelper = MetaOnlyHelper(None)
+    self.assertFalse(up.do_file(ihelper, self.test_fileB, "cvn.fits", self.options, progress=progress))
+    self.assertEqual(events[-1]["retries"], 0)
+    self.assertIsNone(ihelper.metadata)
+
+
+
+class CountingObjects:
+  "Stand-in for the data object manager of a session: counts the uploads in progress"
+  lock = threading.Lock()
+  active = 0
+  most = 0
+  puts = []
+
+  def put(self, local_file, path, num_threads=0, **options):
+    with CountingObjects.lock:
+      CountingObjects.active += 1
+      CountingObjects.most = max(CountingObjects.most, CountingObjects.active)
+    time.sleep(0.02)
+    with CountingObjects.lock:
+      CountingObjects.active -= 1
+      CountingObjects.puts.append(path)
+
+
+class CountingSession:
+  "Stand-in for an iRods session of a session pool"
+  zone = "zone"
+  username = "user"
+
+  def __init__(self):
+    self.data_objects = CountingObjects()
+
+  def cleanup(self):
+    pass
+
+
+class PooledTestCase(ULTestCase):
+
+  def setUp(self):
+    "Initialize the test case"
+    CountingObjects.most = 0
+    CountingObjects.puts = []
+
+  def test_workers_share_pool(self):
+    "Workers take turns with the sessions of the pool, so none is held while idle"
+    pool = sp.SessionPool(CountingSession, max_sessions=1)
+    ihelper = ih.IrodsHelper(pool=pool)
+    pairs = [ (self.test_file, "m13.fits"), (self.test_fileB, "cvn.fits"),
+              (self.test_file, "m13b.fits") ]
+    options = { "upload_only": True, "jobs": 3 }
+    self.assertEqual(up.upload_pairs(ihelper, pairs, options), [ True, True, True ])
+    self.assertEqual(len(CountingObjects.puts), 3)
+    self.assertEqual(CountingObjects.most, 1)
+    self.assertEqual(pool.size(), 1)
+    self.assertIsNotNone(ihelper.session()) # attached again after the workers are done
+
+
 if __name__ == "__main__":
   suite = suite()
   unittest.TextTestRunner(verbosity=2).run(suite)